@@ -0,0 +1,63 @@
+"""
+Precomputed analysis summaries (see api/analytics.py).
+
+    python analytics_cli.py rebuild                 # recompute every user's summary
+    python analytics_cli.py rebuild --user-id u123
+    python analytics_cli.py show u123 --months 6    # what GET /api/analysis/summary returns
+
+The summaries are kept up to date on every insert and delete of an analysis;
+rebuild is for backfilling a database that predates them (the server also does
+this on its first start) and for repairing rows written around the ORM.
+Only the database is opened, not the model.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+from api.cli_app import DEFAULT_DATABASE, make_app
+from api.analytics import rebuild_summaries, user_summary
+from api.skin_analysis import db, upgrade_schema
+
+
+def cmd_rebuild(args):
+    db.create_all()
+    upgrade_schema()
+    start = time.perf_counter()
+    summary_rows, trend_rows = rebuild_summaries(args.user_id)
+    print(f"Rebuilt {summary_rows} condition rows and {trend_rows} monthly rows "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+def cmd_show(args):
+    print(json.dumps(user_summary(args.user_id, args.months), indent=2))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI analysis summaries')
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('rebuild', help='Recompute the summary tables from the analyses')
+    p.add_argument('--user-id', help='Only this user (default: everyone)')
+    p.set_defaults(func=cmd_rebuild)
+
+    p = sub.add_parser('show', help="Print one user's summary")
+    p.add_argument('user_id')
+    p.add_argument('--months', type=int, default=12)
+    p.set_defaults(func=cmd_show)
+
+    args = parser.parse_args()
+    if not os.path.exists(args.database):
+        print(f"No database at {args.database}", file=sys.stderr)
+        return 1
+    with make_app(args.database).app_context():
+        return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
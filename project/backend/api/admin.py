@@ -0,0 +1,196 @@
+"""
+Administrative endpoints (profiling, model versions, bulk export and other
+operator tooling).
+
+Every route requires the X-API-Key header to match ADMIN_API_KEY. If that
+variable is unset the admin API is disabled entirely.
+"""
+
+import os
+import hmac
+import logging
+from datetime import datetime
+from functools import wraps
+
+from flask import Blueprint, request, jsonify, send_from_directory, Response, stream_with_context
+
+from api.profiling import profiler
+from api.model_registry import registry, model_watcher
+from api.shadow import shadow, summarize, report_path
+from api.export import ExportError, ExportQuery, FORMATS, export_filename, stream_export
+
+logger = logging.getLogger(__name__)
+
+bp = Blueprint('admin', __name__)
+
+API_KEY_NAME = "X-API-Key"
+
+
+def has_admin_key() -> bool:
+    """Whether the current request carries the admin API key"""
+    expected = os.getenv('ADMIN_API_KEY')
+    provided = request.headers.get(API_KEY_NAME, '')
+    return bool(expected) and hmac.compare_digest(provided, expected)
+
+
+def require_admin_key(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not has_admin_key():
+            logger.warning(f"Rejected admin request to {request.path} from {request.remote_addr}")
+            return jsonify({
+                "success": False,
+                "error": "Admin API key required",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+# ===================== PROFILING =====================
+@bp.route('/profiling', methods=['GET'])
+@require_admin_key
+def profiling_status():
+    return jsonify({
+        "success": True,
+        "status": profiler.status(),
+        "files": profiler.list_files(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+@bp.route('/profiling/arm', methods=['POST'])
+@require_admin_key
+def arm_profiler():
+    data = request.get_json(silent=True) or {}
+    try:
+        status = profiler.arm(
+            requests=int(data['requests']) if data.get('requests') else None,
+            seconds=float(data['seconds']) if data.get('seconds') else None,
+            torch_trace=bool(data.get('torch', True)),
+            path_prefix=data.get('path_prefix')
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }), 400
+
+    return jsonify({
+        "success": True,
+        "status": status,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+@bp.route('/profiling/disarm', methods=['POST'])
+@require_admin_key
+def disarm_profiler():
+    return jsonify({
+        "success": True,
+        "status": profiler.disarm(),
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+@bp.route('/profiling/files/<path:name>', methods=['GET'])
+@require_admin_key
+def download_profile(name):
+    """Download a capture; ?format=text renders a .pstats file as a summary table"""
+    if request.args.get('format') == 'text' and name.endswith('.pstats'):
+        try:
+            summary = profiler.summarize(
+                os.path.basename(name),
+                sort=request.args.get('sort', 'cumulative'),
+                limit=int(request.args.get('limit', 40))
+            )
+        except FileNotFoundError:
+            return jsonify({
+                "success": False,
+                "error": "Profile not found",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 404
+        return Response(summary, mimetype='text/plain')
+
+    return send_from_directory(os.path.abspath(profiler.output_dir), name, as_attachment=True)
+
+
+# ===================== MODEL REGISTRY =====================
+def _models_payload():
+    return {
+        "success": True,
+        "active": registry.manifest().get('active'),
+        "versions": [entry._asdict() for entry in registry.versions()],
+        "watcher": model_watcher.status(),
+        "timestamp": datetime.utcnow().isoformat()
+    }
+
+
+@bp.route('/models', methods=['GET'])
+@require_admin_key
+def list_models():
+    return jsonify(_models_payload())
+
+
+@bp.route('/models/activate', methods=['POST'])
+@require_admin_key
+def activate_model():
+    """Make a registered version active. This process swaps at once; other
+    processes pick the change up at their next manifest poll."""
+    data = request.get_json(silent=True) or {}
+    try:
+        if data.get('rollback'):
+            entry = registry.rollback()
+        else:
+            entry = registry.activate(str(data.get('version', '')))
+    except KeyError as e:
+        return jsonify({
+            "success": False,
+            "error": e.args[0],
+            "timestamp": datetime.utcnow().isoformat()
+        }), 404
+
+    logger.info(f"Model version {entry.version} activated by {request.remote_addr}")
+    model_watcher.check_now()
+    return jsonify(_models_payload())
+
+
+@bp.route('/shadow', methods=['GET'])
+@require_admin_key
+def shadow_status():
+    """This process's shadow evaluator and the summary of the candidate's report (all processes)"""
+    candidate = os.path.basename(request.args.get('version', '')) or shadow.candidate
+    summary = summarize(report_path(candidate)) if candidate else None
+    return jsonify({
+        "success": True,
+        "status": shadow.status(),
+        "report": summary,
+        "timestamp": datetime.utcnow().isoformat()
+    })
+
+
+# ===================== EXPORT =====================
+@bp.route('/export/<table>', methods=['GET'])
+@require_admin_key
+def export_table(table):
+    """Stream analyses or chats: ?format=ndjson|csv|parquet&since=&until=&condition=&user_id=&images=1"""
+    fmt = request.args.get('format', 'ndjson')
+    images = request.args.get('images', '').lower() in ('1', 'true', 'yes')
+    try:
+        query = ExportQuery.parse(table, since=request.args.get('since'), until=request.args.get('until'),
+                                  condition=request.args.get('condition'), user_id=request.args.get('user_id'))
+        chunks = stream_export(query, fmt, images=images)
+    except ExportError as e:
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }), 400
+
+    logger.info(f"Export of {table} requested by {request.remote_addr}")
+    return Response(
+        stream_with_context(chunks),
+        mimetype='application/x-tar' if images else FORMATS[fmt],
+        headers={'Content-Disposition': f'attachment; filename="{export_filename(query, fmt, images)}"'}
+    )
@@ -0,0 +1,207 @@
+"""
+Admission control and load shedding for the analysis endpoint.
+
+Each request asks the controller for a decision before doing any work:
+
+* rejected - over capacity; answer 503 with a Retry-After estimated from the
+  current inference backlog and recent latency
+* degraded - admitted, but the optional LLM enrichment is skipped so the core
+  prediction still completes quickly
+* admitted - full processing
+
+Signals are the number of analyze requests in flight, the number of requests
+waiting for an inference slot, and exponentially weighted averages of
+request and forward-pass latency.
+"""
+
+import os
+import math
+import time
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from prometheus_client import Counter, Gauge
+
+from api.llm_gateway import CircuitBreaker, get_gateway
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', '16'))
+ADMISSION_DEGRADE_FRACTION = float(os.getenv('ADMISSION_DEGRADE_FRACTION', '0.75'))
+ADMISSION_MAX_INFERENCE_QUEUE = int(os.getenv('ADMISSION_MAX_INFERENCE_QUEUE', '8'))
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv('ADMISSION_MAX_QUEUE_WAIT', '5'))
+ADMISSION_TARGET_LATENCY = float(os.getenv('ADMISSION_TARGET_LATENCY', '8'))
+INFERENCE_CONCURRENCY = int(os.getenv('INFERENCE_CONCURRENCY', '2'))
+EWMA_ALPHA = 0.2
+MAX_RETRY_AFTER = 30
+
+ADMISSION_DECISIONS = Counter(
+    'admission_decisions_total', 'Admission decisions by outcome', ['endpoint', 'decision']
+)
+ADMISSION_SHED = Counter(
+    'admission_shed_total', 'Requests rejected or degraded, by reason', ['endpoint', 'reason']
+)
+ADMISSION_IN_FLIGHT = Gauge('admission_in_flight_requests', 'Admitted requests currently being processed')
+INFERENCE_QUEUE_DEPTH = Gauge('inference_queue_depth', 'Requests waiting for an inference slot')
+ADMISSION_LATENCY_EWMA = Gauge('admission_latency_ewma_seconds', 'Smoothed latency of admitted requests')
+
+
+class OverloadedError(Exception):
+    """Raised when work cannot be admitted; carries a Retry-After hint in seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Decision:
+    __slots__ = ('endpoint', 'admitted', 'degrade', 'reason', 'retry_after', 'started')
+
+    def __init__(self, endpoint: str, admitted: bool, degrade: bool = False,
+                 reason: Optional[str] = None, retry_after: int = 0):
+        self.endpoint = endpoint
+        self.admitted = admitted
+        self.degrade = degrade
+        self.reason = reason
+        self.retry_after = retry_after
+        self.started = time.perf_counter()
+
+
+class AdmissionController:
+    def __init__(self, max_in_flight: int = ADMISSION_MAX_IN_FLIGHT,
+                 degrade_fraction: float = ADMISSION_DEGRADE_FRACTION,
+                 max_inference_queue: int = ADMISSION_MAX_INFERENCE_QUEUE,
+                 max_queue_wait: float = ADMISSION_MAX_QUEUE_WAIT,
+                 target_latency: float = ADMISSION_TARGET_LATENCY,
+                 inference_concurrency: int = INFERENCE_CONCURRENCY):
+        self.max_in_flight = max_in_flight
+        self.degrade_at = max(1, int(max_in_flight * degrade_fraction))
+        self.max_inference_queue = max_inference_queue
+        self.max_queue_wait = max_queue_wait
+        self.target_latency = target_latency
+        self.inference_concurrency = inference_concurrency
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiting = 0
+        self._running = 0
+        self._latency_ewma: Optional[float] = None
+        self._forward_ewma: Optional[float] = None
+        self._slots = threading.BoundedSemaphore(inference_concurrency)
+
+    # ----- estimates -----
+    @staticmethod
+    def _ewma(current: Optional[float], sample: float) -> float:
+        return sample if current is None else (1 - EWMA_ALPHA) * current + EWMA_ALPHA * sample
+
+    def _queue_wait_estimate(self, waiting: int) -> float:
+        """Expected wait for an inference slot if one more request joins the queue"""
+        return (waiting + 1) / self.inference_concurrency * (self._forward_ewma or 0.0)
+
+    def _retry_after(self) -> int:
+        backlog = self._queue_wait_estimate(self._waiting) + (self._latency_ewma or 1.0)
+        # Jitter so rejected clients do not all come back at the same moment
+        seconds = math.ceil(backlog * (1 + random.random() * 0.5))
+        return max(1, min(MAX_RETRY_AFTER, seconds))
+
+    @staticmethod
+    def _llm_saturated() -> bool:
+        gateway = get_gateway()
+        return gateway.breaker.state != CircuitBreaker.CLOSED or gateway.load() >= 1.0
+
+    # ----- admission -----
+    def acquire(self, endpoint: str) -> Decision:
+        with self._lock:
+            reason = None
+            if self._in_flight >= self.max_in_flight:
+                reason = 'in_flight'
+            elif self._waiting >= self.max_inference_queue:
+                reason = 'inference_queue'
+            elif self._queue_wait_estimate(self._waiting) > self.max_queue_wait:
+                reason = 'queue_wait'
+
+            if reason:
+                decision = Decision(endpoint, False, reason=reason, retry_after=self._retry_after())
+            else:
+                self._in_flight += 1
+                ADMISSION_IN_FLIGHT.set(self._in_flight)
+                if self._in_flight > self.degrade_at:
+                    decision = Decision(endpoint, True, degrade=True, reason='in_flight')
+                elif self._latency_ewma is not None and self._latency_ewma > self.target_latency:
+                    decision = Decision(endpoint, True, degrade=True, reason='latency')
+                else:
+                    decision = Decision(endpoint, True)
+
+        if decision.admitted and not decision.degrade and self._llm_saturated():
+            decision.degrade, decision.reason = True, 'llm_saturated'
+
+        outcome = 'rejected' if not decision.admitted else 'degraded' if decision.degrade else 'admitted'
+        ADMISSION_DECISIONS.labels(endpoint=endpoint, decision=outcome).inc()
+        if decision.reason:
+            ADMISSION_SHED.labels(endpoint=endpoint, reason=decision.reason).inc()
+            logger.warning(f"Admission {outcome} for {endpoint}: {decision.reason}")
+        return decision
+
+    def release(self, decision: Decision) -> None:
+        if not decision.admitted:
+            return
+        elapsed = time.perf_counter() - decision.started
+        with self._lock:
+            self._in_flight -= 1
+            self._latency_ewma = self._ewma(self._latency_ewma, elapsed)
+            ADMISSION_IN_FLIGHT.set(self._in_flight)
+            ADMISSION_LATENCY_EWMA.set(self._latency_ewma)
+
+    # ----- inference slots -----
+    @contextmanager
+    def inference_slot(self):
+        """Bound concurrent forward passes; raise OverloadedError if the wait would be too long"""
+        with self._lock:
+            self._waiting += 1
+            INFERENCE_QUEUE_DEPTH.set(self._waiting)
+        try:
+            acquired = self._slots.acquire(timeout=self.max_queue_wait)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+                INFERENCE_QUEUE_DEPTH.set(self._waiting)
+
+        if not acquired:
+            ADMISSION_SHED.labels(endpoint='inference', reason='slot_timeout').inc()
+            with self._lock:
+                retry_after = self._retry_after()
+            raise OverloadedError("Inference queue is full, please retry later", retry_after)
+
+        start = time.perf_counter()
+        with self._lock:
+            self._running += 1
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self._slots.release()
+            with self._lock:
+                self._running -= 1
+                self._forward_ewma = self._ewma(self._forward_ewma, elapsed)
+
+    def inference_idle(self) -> bool:
+        """No request is running or waiting for a forward pass (background work may use the CPU)"""
+        with self._lock:
+            return self._running == 0 and self._waiting == 0
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'in_flight': self._in_flight,
+                'max_in_flight': self.max_in_flight,
+                'inference_queue_depth': self._waiting,
+                'inference_concurrency': self.inference_concurrency,
+                'latency_ewma_seconds': self._latency_ewma,
+                'forward_ewma_seconds': self._forward_ewma
+            }
+
+
+admission = AdmissionController()
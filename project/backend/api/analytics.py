@@ -0,0 +1,243 @@
+"""
+Precomputed per-user analysis statistics for the dashboard.
+
+Every insert or delete of a SkinAnalysisResult adjusts two small tables in
+the same transaction (the flush hook below, like the ETag counters of
+api/http_cache.py):
+
+* ConditionSummary - per user and condition: count, confidence sum (the
+  average is sum / count), first and last analysis time
+* ConditionTrend - count and confidence sum per user, condition and month
+
+Counts and sums are exactly reversible, so a delete subtracts what its
+insert added and the tables do not drift. First/last-seen times are looked
+up again (via the user/condition/time index) only when a deleted analysis
+was the oldest or newest of its condition. GET /api/analysis/summary reads
+at most one row per condition plus one per condition and month.
+
+Rows written with Core statements bypass the hook (like the ETag counters);
+``analytics_cli.py rebuild`` recomputes both tables from the analyses.
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import and_, delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from api.http_cache import RESOURCE_ANALYSES
+from api.skin_analysis import (db, SkinAnalysisResult, ConditionSummary, ConditionTrend,
+                               ResourceVersion, CONDITION_CODES)
+
+logger = logging.getLogger(__name__)
+
+MAX_TREND_MONTHS = 60
+
+
+def _period(timestamp: datetime) -> str:
+    return timestamp.strftime('%Y-%m')
+
+
+# ===================== INCREMENTAL MAINTENANCE =====================
+def _summary_add_statement(user_id: str, condition: str, count: int, confidence: float,
+                           first: datetime, last: datetime):
+    summary = ConditionSummary.__table__
+    stmt = sqlite_insert(summary).values(
+        user_id=user_id, condition=condition, count=count, confidence_sum=confidence,
+        first_seen=first, last_seen=last
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[summary.c.user_id, summary.c.condition],
+        set_={
+            'count': summary.c.count + count,
+            'confidence_sum': summary.c.confidence_sum + confidence,
+            'first_seen': func.min(summary.c.first_seen, stmt.excluded.first_seen),
+            'last_seen': func.max(summary.c.last_seen, stmt.excluded.last_seen)
+        }
+    )
+
+
+def _trend_add_statement(user_id: str, condition: str, period: str, count: int, confidence: float):
+    trend = ConditionTrend.__table__
+    stmt = sqlite_insert(trend).values(
+        user_id=user_id, condition=condition, period=period, count=count, confidence_sum=confidence
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[trend.c.user_id, trend.c.condition, trend.c.period],
+        set_={'count': trend.c.count + count, 'confidence_sum': trend.c.confidence_sum + confidence}
+    )
+
+
+def _remove_statements(user_id: str, condition: str, count: int, confidence: float,
+                       first: datetime, last: datetime):
+    summary, analyses = ConditionSummary.__table__, SkinAnalysisResult.__table__
+    key = and_(summary.c.user_id == user_id, summary.c.condition == condition)
+    yield update(summary).where(key).values(
+        count=summary.c.count - count, confidence_sum=summary.c.confidence_sum - confidence
+    )
+    yield delete(summary).where(key, summary.c.count <= 0)
+
+    # The deleted rows are already gone from the table; only look them up again
+    # when the oldest or newest analysis of the condition was among them
+    remaining = and_(analyses.c.user_id == user_id, analyses.c.primary_condition == condition)
+    yield update(summary).where(key, or_(summary.c.first_seen >= first, summary.c.last_seen <= last)).values(
+        first_seen=select(func.min(analyses.c.timestamp)).where(remaining).scalar_subquery(),
+        last_seen=select(func.max(analyses.c.timestamp)).where(remaining).scalar_subquery()
+    )
+
+
+def _trend_remove_statements(user_id: str, condition: str, period: str, count: int, confidence: float):
+    trend = ConditionTrend.__table__
+    key = and_(trend.c.user_id == user_id, trend.c.condition == condition, trend.c.period == period)
+    yield update(trend).where(key).values(
+        count=trend.c.count - count, confidence_sum=trend.c.confidence_sum - confidence
+    )
+    yield delete(trend).where(key, trend.c.count <= 0)
+
+
+def _group(analyses: Iterable[SkinAnalysisResult], by_period: bool) -> Dict[tuple, list]:
+    """(user, condition[, period]) -> [count, confidence sum, first, last]"""
+    groups = {}
+    for analysis in analyses:
+        key = (analysis.user_id, analysis.primary_condition)
+        if by_period:
+            key += (_period(analysis.timestamp),)
+        group = groups.get(key)
+        if group is None:
+            groups[key] = [1, analysis.confidence, analysis.timestamp, analysis.timestamp]
+        else:
+            group[0] += 1
+            group[1] += analysis.confidence
+            group[2] = min(group[2], analysis.timestamp)
+            group[3] = max(group[3], analysis.timestamp)
+    return groups
+
+
+@event.listens_for(Session, 'after_flush')
+def _update_summaries_on_flush(session, flush_context):
+    """Apply analyses inserted or deleted in this flush to the summary tables"""
+    added = [obj for obj in session.new if isinstance(obj, SkinAnalysisResult)]
+    removed = [obj for obj in session.deleted if isinstance(obj, SkinAnalysisResult)]
+    if not added and not removed:
+        return
+
+    statements = []
+    for (user_id, condition), (count, confidence, first, last) in _group(added, False).items():
+        statements.append(_summary_add_statement(user_id, condition, count, confidence, first, last))
+    for (user_id, condition, period), (count, confidence, _, _) in _group(added, True).items():
+        statements.append(_trend_add_statement(user_id, condition, period, count, confidence))
+    for (user_id, condition), (count, confidence, first, last) in _group(removed, False).items():
+        statements.extend(_remove_statements(user_id, condition, count, confidence, first, last))
+    for (user_id, condition, period), (count, confidence, _, _) in _group(removed, True).items():
+        statements.extend(_trend_remove_statements(user_id, condition, period, count, confidence))
+
+    connection = session.connection()
+    for statement in statements:
+        connection.execute(statement)
+
+
+# ===================== REBUILD =====================
+def rebuild_summaries(user_id: Optional[str] = None) -> Tuple[int, int]:
+    """Recompute the summary tables from the analyses (one user, or everyone).
+
+    Returns the number of summary and trend rows written.
+    """
+    analyses = SkinAnalysisResult.__table__
+    summary, trend = ConditionSummary.__table__, ConditionTrend.__table__
+    period = func.strftime('%Y-%m', analyses.c.timestamp)
+    scope = [analyses.c.user_id == user_id] if user_id else []
+
+    db.session.execute(delete(summary).where(*([summary.c.user_id == user_id] if user_id else [])))
+    db.session.execute(delete(trend).where(*([trend.c.user_id == user_id] if user_id else [])))
+    summary_rows = db.session.execute(insert(summary).from_select(
+        ['user_id', 'condition', 'count', 'confidence_sum', 'first_seen', 'last_seen'],
+        select(analyses.c.user_id, analyses.c.primary_condition, func.count(), func.sum(analyses.c.confidence),
+               func.min(analyses.c.timestamp), func.max(analyses.c.timestamp))
+        .where(*scope).group_by(analyses.c.user_id, analyses.c.primary_condition)
+    )).rowcount
+    trend_rows = db.session.execute(insert(trend).from_select(
+        ['user_id', 'condition', 'period', 'count', 'confidence_sum'],
+        select(analyses.c.user_id, analyses.c.primary_condition, period, func.count(),
+               func.sum(analyses.c.confidence))
+        .where(*scope).group_by(analyses.c.user_id, analyses.c.primary_condition, period)
+    )).rowcount
+
+    # Invalidate cached summaries (and history) of every user the rebuild may have changed
+    versions = ResourceVersion.__table__
+    db.session.execute(update(versions).where(
+        versions.c.resource == RESOURCE_ANALYSES,
+        *([versions.c.user_id == user_id] if user_id else [])
+    ).values(version=versions.c.version + 1, updated_at=datetime.utcnow()))
+    db.session.commit()
+    logger.info(f"Rebuilt analysis summaries{f' of {user_id}' if user_id else ''}: "
+                f"{summary_rows} condition rows, {trend_rows} monthly rows")
+    return summary_rows, trend_rows
+
+
+def backfill_if_empty() -> bool:
+    """Build the tables on the first start after an upgrade (analyses exist, summaries do not)"""
+    if db.session.query(ConditionSummary.user_id).first() is not None:
+        return False
+    if db.session.query(SkinAnalysisResult.id).first() is None:
+        return False
+    rebuild_summaries()
+    return True
+
+
+# ===================== READ =====================
+def _month_index(period: str) -> int:
+    year, month = period.split('-')
+    return int(year) * 12 + int(month) - 1
+
+
+def _month_name(index: int) -> str:
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def user_summary(user_id: str, months: int = 12) -> dict:
+    """Dashboard statistics of one user, from at most conditions x (months + 1) rows"""
+    months = max(1, min(months, MAX_TREND_MONTHS))
+    current = _month_index(_period(datetime.utcnow()))
+    first_period = _month_name(current - months + 1)
+
+    conditions = ConditionSummary.query.filter_by(user_id=user_id).all()
+    trend_rows = ConditionTrend.query.filter(
+        ConditionTrend.user_id == user_id, ConditionTrend.period >= first_period
+    ).all()
+
+    total = sum(row.count for row in conditions)
+    confidence = sum(row.confidence_sum for row in conditions)
+
+    trend = {_month_name(index): {'period': _month_name(index), 'count': 0, 'confidence_sum': 0.0,
+                                  'conditions': {}}
+             for index in range(current - months + 1, current + 1)}
+    for row in trend_rows:
+        bucket = trend.get(row.period)
+        if bucket is None:
+            continue  # dated in the future (clock skew)
+        bucket['count'] += row.count
+        bucket['confidence_sum'] += row.confidence_sum
+        bucket['conditions'][row.condition] = row.count
+    for bucket in trend.values():
+        bucket_sum = bucket.pop('confidence_sum')
+        bucket['average_confidence'] = bucket_sum / bucket['count'] if bucket['count'] else None
+
+    return {
+        'user_id': user_id,
+        'total_analyses': total,
+        'average_confidence': confidence / total if total else None,
+        'first_analysis_at': min(row.first_seen for row in conditions).isoformat() if conditions else None,
+        'last_analysis_at': max(row.last_seen for row in conditions).isoformat() if conditions else None,
+        'conditions': [{
+            'condition': row.condition,
+            'code': CONDITION_CODES.get(row.condition),
+            'count': row.count,
+            'share': row.count / total,
+            'average_confidence': row.confidence_sum / row.count,
+            'first_seen': row.first_seen.isoformat() if row.first_seen else None,
+            'last_seen': row.last_seen.isoformat() if row.last_seen else None
+        } for row in sorted(conditions, key=lambda row: (-row.count, row.condition))],
+        'monthly': list(trend.values())
+    }
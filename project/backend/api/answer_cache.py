@@ -0,0 +1,219 @@
+"""
+Local answer cache for recurring first-turn chat questions.
+
+Questions are normalized (lowercased, punctuation and filler words removed,
+words reduced to a crude lemma) and looked up by exact key first. Misses fall
+back to a MinHash/LSH index over word shingles so rephrasings such as
+"How long does ringworm last?" / "how long do ringworms last" share an answer.
+The cache is bounded (LRU) and entries expire after a TTL.
+"""
+
+import re
+import time
+import zlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+from prometheus_client import Counter, Gauge
+
+ANSWER_CACHE_LOOKUPS = Counter(
+    'chat_answer_cache_lookups_total', 'Answer cache lookups by result', ['result']
+)
+ANSWER_CACHE_HIT_RATIO = Gauge(
+    'chat_answer_cache_hit_ratio', 'Fraction of answer cache lookups served from cache'
+)
+ANSWER_CACHE_ENTRIES = Gauge(
+    'chat_answer_cache_entries', 'Answers currently held in the cache'
+)
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+# Filler words that never change what is being asked; question words are kept
+_FILLER = frozenset("""
+a an the is are was were be been do does did of to in on at for with my me i
+please can could would should you your tell explain about hi hello hey thanks
+""".split())
+
+_IRREGULAR = {
+    'feet': 'foot', 'children': 'child', 'kids': 'kid', 'itchy': 'itch',
+    'itching': 'itch', 'shingles': 'shingles', 'herpes': 'herpes',
+}
+
+_MERSENNE_PRIME = (1 << 31) - 1
+
+
+def lemmatize(word: str) -> str:
+    """Reduce a word to a crude lemma with a few suffix rules"""
+    if word in _IRREGULAR:
+        return _IRREGULAR[word]
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-3] + 'y'
+    if len(word) > 5 and word.endswith('ing'):
+        return word[:-3]
+    if len(word) > 4 and word.endswith('ed'):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def normalize(question: str) -> List[str]:
+    return [lemmatize(w) for w in _WORD_PATTERN.findall(question.lower()) if w not in _FILLER]
+
+
+def shingles(tokens: List[str]) -> Set[str]:
+    """Unigrams plus bigrams; questions are short so both are needed for signal"""
+    grams = set(tokens)
+    grams.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return grams
+
+
+class MinHasher:
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = np.random.RandomState(seed)
+        self.num_perm = num_perm
+        self._a = rng.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+        self._b = rng.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.int64)
+
+    def signature(self, grams: Set[str]) -> np.ndarray:
+        if not grams:
+            return np.full(self.num_perm, _MERSENNE_PRIME, dtype=np.int64)
+        hashes = np.fromiter(
+            (zlib.crc32(g.encode()) % _MERSENNE_PRIME for g in grams),
+            dtype=np.int64, count=len(grams)
+        )
+        # (a * x + b) mod p for every permutation and shingle at once
+        permuted = (np.outer(hashes, self._a) + self._b) % _MERSENNE_PRIME
+        return permuted.min(axis=0)
+
+
+class _Entry:
+    __slots__ = ('answer', 'grams', 'bands', 'expires_at')
+
+    def __init__(self, answer, grams, bands, expires_at):
+        self.answer = answer
+        self.grams = grams
+        self.bands = bands
+        self.expires_at = expires_at
+
+
+class AnswerCache:
+    def __init__(self, max_entries: int = 2048, similarity_threshold: float = 0.8,
+                 ttl_seconds: float = 86400, num_perm: int = 64, bands: int = 16):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.max_entries = max_entries
+        self.similarity_threshold = similarity_threshold
+        self.ttl_seconds = ttl_seconds
+        self._rows = num_perm // bands
+        self._bands = bands
+        self._hasher = MinHasher(num_perm)
+        self._entries: 'OrderedDict[str, _Entry]' = OrderedDict()
+        self._buckets: Dict[Tuple[int, bytes], Set[str]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._lookups = 0
+
+    def _band_keys(self, signature: np.ndarray) -> List[Tuple[int, bytes]]:
+        return [
+            (band, signature[band * self._rows:(band + 1) * self._rows].tobytes())
+            for band in range(self._bands)
+        ]
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        for band_key in entry.bands:
+            bucket = self._buckets.get(band_key)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band_key]
+
+    def _record(self, result: str) -> None:
+        self._lookups += 1
+        if result != 'miss':
+            self._hits += 1
+        ANSWER_CACHE_LOOKUPS.labels(result=result).inc()
+        ANSWER_CACHE_HIT_RATIO.set(self._hits / self._lookups)
+
+    def _live(self, key: str, now: float) -> Optional[_Entry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.expires_at < now:
+            self._remove(key)
+            return None
+        return entry
+
+    def get(self, question: str) -> Optional[str]:
+        tokens = normalize(question)
+        if not tokens:
+            return None
+        key = ' '.join(tokens)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._record('hit_exact')
+                return entry.answer
+
+            grams = shingles(tokens)
+            signature = self._hasher.signature(grams)
+            candidates = set()
+            for band_key in self._band_keys(signature):
+                candidates.update(self._buckets.get(band_key, ()))
+
+            best_key, best_score = None, 0.0
+            for candidate in candidates:
+                entry = self._live(candidate, now)
+                if entry is None:
+                    continue
+                # Confirm LSH candidates with exact Jaccard on the shingle sets
+                score = len(grams & entry.grams) / len(grams | entry.grams)
+                if score > best_score:
+                    best_key, best_score = candidate, score
+
+            if best_key is not None and best_score >= self.similarity_threshold:
+                self._entries.move_to_end(best_key)
+                self._record('hit_near')
+                return self._entries[best_key].answer
+
+            self._record('miss')
+            return None
+
+    def put(self, question: str, answer: str) -> None:
+        tokens = normalize(question)
+        if not tokens:
+            return
+        key = ' '.join(tokens)
+        grams = shingles(tokens)
+        bands = self._band_keys(self._hasher.signature(grams))
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = _Entry(answer, grams, bands, time.monotonic() + self.ttl_seconds)
+            for band_key in bands:
+                self._buckets.setdefault(band_key, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            ANSWER_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            ANSWER_CACHE_ENTRIES.set(0)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'lookups': self._lookups,
+                'hit_ratio': self._hits / self._lookups if self._lookups else 0.0
+            }
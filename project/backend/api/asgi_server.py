@@ -0,0 +1,284 @@
+"""
+ASGI serving mode.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+
+Routes with a native async handler (chat and image analysis) await the LLM on
+the event loop instead of holding a thread for the whole upstream call, so one
+process can keep hundreds of requests in flight. Blocking work inside those
+handlers (database, file I/O, form parsing) runs on a bounded I/O thread pool
+and model inference on a separate pool sized from the admission settings.
+Every other route is the unchanged Flask WSGI app, run on the I/O pool.
+
+Native handlers still go through Flask's request pipeline: a request context
+is pushed for the whole request, before_request hooks (rate limits, metrics)
+and after_request hooks (CORS, Server-Timing, access log) run as usual, and a
+handler may return anything a Flask view may return. Flask-Limiter checks
+``@limiter.limit`` limits inside the decorated view, which a native handler
+replaces, so the dispatcher checks the matched view's limits itself when it
+is given the limiter.
+
+asgiref's WsgiToAsgi is not used for the fallback because it runs every WSGI
+request on one shared thread.
+"""
+
+import io
+import os
+import sys
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from werkzeug.exceptions import InternalServerError
+
+from api.admission import admission
+
+logger = logging.getLogger(__name__)
+
+ASYNC_IO_THREADS = int(os.getenv('ASYNC_IO_THREADS', '32'))
+ASYNC_INFERENCE_THREADS = int(os.getenv(
+    'ASYNC_INFERENCE_THREADS',
+    # Threads beyond the inference slots wait inside admission.inference_slot(),
+    # where they are counted and shed like in the WSGI mode
+    str(admission.inference_concurrency + admission.max_inference_queue)
+))
+
+# Marks requests served by a native handler (their phases run on different threads)
+ASYNC_ENVIRON_KEY = 'dermai.async'
+
+_DONE = object()
+
+
+def build_environ(scope: dict, body: bytes) -> dict:
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('127.0.0.1', 0)
+    root_path = scope.get('root_path', '')
+    path = scope['path']
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf8').decode('latin1'),
+        'PATH_INFO': path.encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name, value = raw_name.decode('latin1'), raw_value.decode('latin1')
+        if name == 'content-type':
+            key = 'CONTENT_TYPE'
+        elif name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _encode_headers(headers) -> List[Tuple[bytes, bytes]]:
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+
+class AsyncRequest:
+    """Passed to native handlers; runs blocking callables inside the request's Flask context"""
+
+    def __init__(self, server: 'AsyncDispatcher', environ: dict):
+        self.server = server
+        self.environ = environ
+
+    async def run(self, fn: Callable, *args):
+        """Run fn on the I/O pool with the Flask request context active"""
+        return await self._submit(self.server.io_executor, fn, *args)
+
+    async def run_inference(self, fn: Callable, *args):
+        """Run CPU-bound model work on the inference pool"""
+        return await self._submit(self.server.inference_executor, fn, *args)
+
+    @staticmethod
+    async def _submit(executor: ThreadPoolExecutor, fn: Callable, *args):
+        # A copy of the current context carries the pushed Flask request context
+        # (request, g, the SQLAlchemy session scope) into the worker thread
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, fn, *args))
+
+
+class AsyncDispatcher:
+    """ASGI application: native async handlers for some routes, the Flask app for the rest"""
+
+    def __init__(self, flask_app, on_startup: Optional[List[Callable]] = None,
+                 on_shutdown: Optional[List[Callable]] = None, limiter=None,
+                 io_threads: int = ASYNC_IO_THREADS, inference_threads: int = ASYNC_INFERENCE_THREADS):
+        self.flask_app = flask_app
+        self.limiter = limiter
+        self.on_startup = on_startup or []
+        self.on_shutdown = on_shutdown or []
+        self.io_executor = ThreadPoolExecutor(io_threads, thread_name_prefix='asgi-io')
+        self.inference_executor = ThreadPoolExecutor(inference_threads, thread_name_prefix='asgi-inference')
+        self._routes: Dict[Tuple[str, str], Callable[[AsyncRequest], Awaitable]] = {}
+
+    def route(self, path: str, methods=('POST',)):
+        """Register a native async handler: ``async def handler(req: AsyncRequest)``"""
+        def decorator(handler):
+            for method in methods:
+                self._routes[(method, path)] = handler
+            return handler
+        return decorator
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+        body = await self._read_body(receive)
+        environ = build_environ(scope, body)
+        if len(body) > (self.flask_app.config.get('MAX_CONTENT_LENGTH') or float('inf')):
+            # Reading stopped at the limit; let Flask answer 413 as in the WSGI mode
+            environ['CONTENT_LENGTH'] = str(len(body))
+
+        handler = self._routes.get((scope['method'], scope['path']))
+        if handler is None:
+            await self._wsgi(environ, send)
+        else:
+            await self._native(handler, environ, send)
+
+    async def _read_body(self, receive) -> bytes:
+        limit = self.flask_app.config.get('MAX_CONTENT_LENGTH')
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            chunks.append(chunk)
+            size += len(chunk)
+            if not message.get('more_body') or (limit and size > limit):
+                break
+        return b''.join(chunks)
+
+    # ----- native handlers -----
+    async def _native(self, handler, environ: dict, send) -> None:
+        environ[ASYNC_ENVIRON_KEY] = True
+        req = AsyncRequest(self, environ)
+        ctx = self.flask_app.request_context(environ)
+        ctx.push()
+        error = None
+        try:
+            rv = await req.run(self._preprocess)
+            if rv is None:
+                try:
+                    rv = await handler(req)
+                except Exception as e:
+                    rv = await req.run(self._handle_error, e)
+            status, headers, body = await req.run(self._finalize, rv)
+        except Exception as e:
+            error = e
+            logger.error(f"Error finalizing async request {environ['PATH_INFO']}: {e}", exc_info=True)
+            status, headers, body = 500, [('Content-Type', 'text/plain')], b'Internal Server Error'
+        finally:
+            ctx.pop(error)
+
+        await send({'type': 'http.response.start', 'status': status, 'headers': _encode_headers(headers)})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def _preprocess(self):
+        try:
+            rv = self.flask_app.preprocess_request()
+            if rv is None and self.limiter is not None:
+                # What the view's @limiter.limit wrapper would check (route limits, or
+                # the defaults for undecorated views; limits already hit are not counted twice)
+                self.limiter.check()
+            return rv
+        except Exception as e:
+            return self._handle_error(e)
+
+    def _handle_error(self, error: Exception):
+        try:
+            return self.flask_app.handle_user_exception(error)
+        except Exception:
+            logger.error(f"Unhandled error in async handler: {error}", exc_info=error)
+            return self.flask_app.handle_http_exception(InternalServerError(original_exception=error))
+
+    def _finalize(self, rv):
+        response = self.flask_app.process_response(self.flask_app.make_response(rv))
+        try:
+            return response.status_code, list(response.headers.items()), response.get_data()
+        finally:
+            response.close()
+
+    # ----- WSGI fallback -----
+    async def _wsgi(self, environ: dict, send) -> None:
+        loop = asyncio.get_running_loop()
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = headers
+
+        async def run(fn, *args):
+            return await loop.run_in_executor(self.io_executor, fn, *args)
+
+        result = await run(self.flask_app, environ, start_response)
+        iterator = iter(result)
+        sent_start = False
+        try:
+            # Pull one chunk at a time so streamed responses are not buffered
+            while True:
+                chunk = await run(next, iterator, _DONE)
+                if chunk is _DONE:
+                    break
+                if not sent_start:
+                    await send({'type': 'http.response.start', 'status': started['status'],
+                                'headers': _encode_headers(started['headers'])})
+                    sent_start = True
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'):
+                await run(result.close)
+
+        if not sent_start:
+            await send({'type': 'http.response.start', 'status': started['status'],
+                        'headers': _encode_headers(started['headers'])})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    # ----- lifespan -----
+    async def _lifespan(self, receive, send) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    for fn in self.on_startup:
+                        await loop.run_in_executor(self.io_executor, fn)
+                except Exception as e:
+                    logger.error(f"ASGI startup failed: {e}", exc_info=True)
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                for fn in self.on_shutdown:
+                    try:
+                        await loop.run_in_executor(self.io_executor, fn)
+                    except Exception as e:
+                        logger.error(f"ASGI shutdown hook failed: {e}", exc_info=True)
+                self.io_executor.shutdown(wait=False)
+                self.inference_executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
@@ -0,0 +1,179 @@
+"""
+Confidence-gated model cascade.
+
+A MobileNetV3-small student, distilled from the EfficientNet-B0 checkpoint
+(see cascade_cli.py), classifies every image first. The full model only runs
+when the student's top-1 probability is below the calibrated threshold; the
+student's answer is used otherwise. Both models take the same preprocessed
+tensor, so an escalation costs one extra forward pass and nothing else.
+
+The threshold is chosen on a held-out set by ``cascade_cli.py`` and stored in
+the student checkpoint, together with the sha256 of the teacher it was
+distilled from and calibrated against. The analyzer only uses the cascade
+while that checkpoint is the served model version; after a hot swap to
+another version every image goes to the full model until the student is
+re-distilled or re-calibrated.
+
+    CASCADE_MODE         auto (on when the student checkpoint exists), on, off
+    STUDENT_MODEL_PATH   student checkpoint (models/student.pth)
+    CASCADE_THRESHOLD    overrides the calibrated threshold
+
+Escalations are exported as ``cascade_predictions_total{stage="full"}``
+against ``{stage="student"}``.
+"""
+
+import os
+import logging
+import threading
+from typing import Callable, Optional, Sequence, Tuple
+
+import torch
+import torch.nn as nn
+import torchvision.models as models
+from prometheus_client import Counter, Gauge, Histogram
+
+from api.model_registry import MODELS_DIR
+from api.timing import stage
+
+logger = logging.getLogger(__name__)
+
+CASCADE_MODE = os.getenv('CASCADE_MODE', 'auto').lower()
+STUDENT_MODEL_PATH = os.getenv('STUDENT_MODEL_PATH', os.path.join(MODELS_DIR, 'student.pth'))
+
+# Stored when calibration finds no safe threshold: above any probability, so everything escalates
+ESCALATE_ALL = 1.01
+
+CASCADE_PREDICTIONS = Counter(
+    'cascade_predictions_total', 'Predictions by the cascade stage that produced them', ['stage']
+)
+CASCADE_STUDENT_CONFIDENCE = Histogram(
+    'cascade_student_confidence', 'Top-1 probability of the cascade student',
+    buckets=[0.3, 0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99, 1.0]
+)
+CASCADE_ESCALATION_RATIO = Gauge(
+    'cascade_escalation_ratio', 'Fraction of images escalated to the full model by this process'
+)
+
+
+class StudentModel(nn.Module):
+    """MobileNetV3-small with a classifier head for the skin condition classes"""
+
+    def __init__(self, num_classes: int, pretrained: bool = False):
+        super().__init__()
+        weights = models.MobileNet_V3_Small_Weights.IMAGENET1K_V1 if pretrained else None
+        self.base_model = models.mobilenet_v3_small(weights=weights)
+        in_features = self.base_model.classifier[-1].in_features
+        self.base_model.classifier[-1] = nn.Linear(in_features, num_classes)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.base_model(x)
+
+
+class ModelCascade:
+    def __init__(self, student: nn.Module, threshold: float, calibration: Optional[dict] = None,
+                 teacher_sha256: Optional[str] = None):
+        self.student = student
+        self.threshold = threshold
+        self.calibration = calibration or {}
+        self.teacher_sha256 = teacher_sha256
+        self._lock = threading.Lock()
+        self._total = 0
+        self._escalated = 0
+
+    @torch.inference_mode()
+    def predict(self, image_tensor: torch.Tensor,
+                full_model: Callable[[torch.Tensor], Tuple[torch.Tensor, torch.Tensor]],
+                k: int = 3) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Top-k (probabilities, indices) from the student, or from full_model when it is unsure"""
+        with stage('forward_student'):
+            probabilities = torch.nn.functional.softmax(self.student(image_tensor), dim=1)[0]
+        confidence = probabilities.max().item()
+        CASCADE_STUDENT_CONFIDENCE.observe(confidence)
+
+        escalate = confidence < self.threshold
+        self._count(escalate)
+        if escalate:
+            with stage('forward'):
+                return full_model(image_tensor)
+        return torch.topk(probabilities, k=k)
+
+    def _count(self, escalated: bool) -> None:
+        CASCADE_PREDICTIONS.labels(stage='full' if escalated else 'student').inc()
+        with self._lock:
+            self._total += 1
+            self._escalated += escalated
+            CASCADE_ESCALATION_RATIO.set(self._escalated / self._total)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total, escalated = self._total, self._escalated
+        return {
+            'threshold': self.threshold,
+            'teacher_sha256': self.teacher_sha256,
+            'predictions': total,
+            'escalated': escalated,
+            'escalation_rate': escalated / total if total else None,
+            'calibration': self.calibration
+        }
+
+
+def load_cascade(class_names: Sequence[str], device) -> Optional[ModelCascade]:
+    """The configured cascade, or None when it is disabled or no student has been trained"""
+    if CASCADE_MODE == 'off':
+        return None
+    if not os.path.exists(STUDENT_MODEL_PATH):
+        if CASCADE_MODE == 'on':
+            raise FileNotFoundError(f"Cascade student not found at {STUDENT_MODEL_PATH}")
+        return None
+
+    checkpoint = torch.load(STUDENT_MODEL_PATH, map_location=device)
+    if tuple(checkpoint.get('class_names', class_names)) != tuple(class_names):
+        raise ValueError(f"Cascade student at {STUDENT_MODEL_PATH} was trained on different classes")
+
+    student = StudentModel(num_classes=len(class_names)).to(device)
+    student.load_state_dict(checkpoint['model_state_dict'])
+    student.eval()
+
+    threshold = float(os.getenv('CASCADE_THRESHOLD') or checkpoint.get('threshold', ESCALATE_ALL))
+    logger.info(f"Model cascade enabled: student {STUDENT_MODEL_PATH}, threshold {threshold:.4f}")
+    return ModelCascade(student, threshold, checkpoint.get('calibration'), checkpoint.get('teacher_sha256'))
+
+
+def calibrate_threshold(student_probs: torch.Tensor, full_pred: torch.Tensor, targets: torch.Tensor,
+                        max_accuracy_drop: float = 0.005) -> dict:
+    """Lowest student-confidence threshold whose cascade accuracy stays within
+    max_accuracy_drop of the full model on a held-out set.
+
+    ``targets`` are the true labels, or the full model's predictions when the
+    held-out images are unlabelled (accuracy then means agreement with it).
+    Every possible threshold is evaluated at once: sorted by confidence, the
+    cascade accepts the k most confident student answers and escalates the rest.
+    """
+    n = len(targets)
+    confidence, student_pred = student_probs.max(dim=1)
+    order = torch.argsort(confidence, descending=True)
+    confidence = confidence[order]
+    student_ok = (student_pred[order] == targets[order]).double()
+    full_ok = (full_pred[order] == targets[order]).double()
+
+    zero = torch.zeros(1, dtype=torch.float64)
+    accepted_correct = torch.cat([zero, torch.cumsum(student_ok, 0)])
+    escalated_correct = full_ok.sum() - torch.cat([zero, torch.cumsum(full_ok, 0)])
+    cascade_accuracy = (accepted_correct + escalated_correct) / n  # index k = k accepted
+
+    # Only cut between distinct confidences, so "confidence >= threshold" accepts exactly k
+    valid = torch.ones(n + 1, dtype=torch.bool)
+    valid[1:n] = confidence[:-1] > confidence[1:]
+    full_accuracy = full_ok.mean().item()
+    ok = valid & (cascade_accuracy >= full_accuracy - max_accuracy_drop - 1e-12)
+    k = int(torch.nonzero(ok).max()) if ok.any() else 0
+
+    return {
+        'threshold': float(confidence[k - 1]) if k else ESCALATE_ALL,
+        'held_out': n,
+        'escalation_rate': (n - k) / n if n else 1.0,
+        'full_accuracy': full_accuracy,
+        'student_accuracy': student_ok.mean().item(),
+        'cascade_accuracy': cascade_accuracy[k].item(),
+        'max_accuracy_drop': max_accuracy_drop
+    }
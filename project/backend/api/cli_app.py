@@ -0,0 +1,23 @@
+"""
+Database-only Flask app for the command-line tools.
+
+export_cli.py and analytics_cli.py need the ORM session but neither the model
+nor the routes of app.py, so they can run next to a live server without
+loading a second copy of the weights.
+"""
+
+import os
+
+from flask import Flask
+
+from api.skin_analysis import db
+
+DEFAULT_DATABASE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'app.db')
+
+
+def make_app(database: str = DEFAULT_DATABASE) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{database}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
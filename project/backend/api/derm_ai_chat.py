@@ -12,9 +12,14 @@ from datetime import datetime
 from typing import Optional, Dict, List
 from flask import Blueprint, request, jsonify
 import groq
-from tenacity import retry, stop_after_attempt, wait_exponential
 from dotenv import load_dotenv
-from api.skin_analysis import db, ChatMessage
+from api.skin_analysis import db, ChatMessage, ConversationSummary
+from api.llm_gateway import LLMGateway, LLMUnavailableError, get_gateway
+from api.prompt_builder import PromptBuilder
+from api.answer_cache import AnswerCache
+from api.timing import stage
+from api.http_cache import RESOURCE_CHAT, bump_version, check_not_modified, apply_validators
+from api.logging_config import LOG_REQUEST_BODIES
 
 # Create Flask Blueprint
 bp = Blueprint('chat', __name__)
@@ -22,27 +27,8 @@ bp = Blueprint('chat', __name__)
 # Load environment variables at module level
 load_dotenv()
 
-# Ensure logs directory exists
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-# Configure logging with both file and console handlers
+# Handlers are attached to the root logger by api.logging_config
 logger = logging.getLogger(__name__)
-logger.setLevel(logging.DEBUG)
-
-# Console handler
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.INFO)
-console_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-console_handler.setFormatter(console_format)
-logger.addHandler(console_handler)
-
-# File handler
-file_handler = logging.FileHandler('logs/chat_debug.log')
-file_handler.setLevel(logging.DEBUG)
-file_format = logging.Formatter('%(asctime)s - %(levelname)s - [%(filename)s:%(lineno)d] - %(message)s')
-file_handler.setFormatter(file_format)
-logger.addHandler(file_handler)
 
 # ===================== CONFIGURATION =====================
 class Config:
@@ -50,6 +36,18 @@ class Config:
     GROQ_API_KEY = os.getenv('GROQ_API_KEY')
     MAX_RETRIES = 3
     MAX_CONVERSATION_HISTORY = 20
+
+    # Prompt assembly (token counts are local estimates)
+    PROMPT_TOKEN_BUDGET = int(os.getenv('CHAT_PROMPT_TOKEN_BUDGET', '2500'))
+    HISTORY_WINDOW = int(os.getenv('CHAT_HISTORY_WINDOW', '6'))
+    SUMMARY_TOKEN_LIMIT = int(os.getenv('CHAT_SUMMARY_TOKEN_LIMIT', '300'))
+    MAX_MESSAGE_TOKENS = int(os.getenv('CHAT_MAX_MESSAGE_TOKENS', '350'))
+
+    # Answer cache for first-turn questions
+    ANSWER_CACHE_ENABLED = os.getenv('CHAT_ANSWER_CACHE_ENABLED', '1') == '1'
+    ANSWER_CACHE_SIZE = int(os.getenv('CHAT_ANSWER_CACHE_SIZE', '2048'))
+    ANSWER_CACHE_THRESHOLD = float(os.getenv('CHAT_ANSWER_CACHE_THRESHOLD', '0.8'))
+    ANSWER_CACHE_TTL = float(os.getenv('CHAT_ANSWER_CACHE_TTL', '86400'))
     
     # Service Info
     VERSION = "1.0.2"
@@ -70,37 +68,45 @@ class Config:
         "http://localhost:8000",
     ]
 
+CHAT_MODEL = "llama-3.3-70b-versatile"
+
 # ===================== DERMAI CLASS =====================
 class DermAI:
     def __init__(self):
-        """Initialize DermAI with configuration"""
-        try:
-            self.api_key = os.getenv('GROQ_API_KEY')
-            if not self.api_key:
-                logger.error("GROQ_API_KEY not found in environment variables")
-                raise ValueError("GROQ_API_KEY not found in environment variables")
-            
-            logger.info("Initializing Groq client...")
-            self.client = self._initialize_client()
-            logger.info("Groq client initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize DermAI: {str(e)}", exc_info=True)
-            raise
-        
-    def _initialize_client(self) -> groq.Client:
-        """Initialize and return the Groq client"""
-        try:
-            client = groq.Client(api_key=self.api_key)
-            # Test the client connection
-            client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[{"role": "system", "content": "Test connection"}],
-                max_tokens=1
-            )
-            return client
-        except Exception as e:
-            logger.error(f"Failed to initialize Groq client: {str(e)}", exc_info=True)
-            raise
+        """Initialize DermAI with configuration.
+
+        No network calls happen here; the LLM client is resolved on first use
+        and upstream reachability is reported by the gateway's background probe.
+        """
+        self.api_key = os.getenv('GROQ_API_KEY')
+        if not self.api_key and not os.getenv('LLM_BACKEND_URL'):
+            logger.warning("GROQ_API_KEY not found in environment variables; chat requests will fail")
+        self._client = None
+        self.prompt_builder = PromptBuilder(
+            token_budget=Config.PROMPT_TOKEN_BUDGET,
+            history_window=Config.HISTORY_WINDOW,
+            summary_token_limit=Config.SUMMARY_TOKEN_LIMIT,
+            max_message_tokens=Config.MAX_MESSAGE_TOKENS
+        )
+        self.answer_cache = AnswerCache(
+            max_entries=Config.ANSWER_CACHE_SIZE,
+            similarity_threshold=Config.ANSWER_CACHE_THRESHOLD,
+            ttl_seconds=Config.ANSWER_CACHE_TTL
+        ) if Config.ANSWER_CACHE_ENABLED else None
+
+    @property
+    def client(self) -> LLMGateway:
+        """Shared LLM gateway, resolved lazily"""
+        if self._client is None:
+            self._client = self._initialize_client()
+        return self._client
+
+    def _initialize_client(self) -> LLMGateway:
+        """Return the shared LLM gateway and make sure its connectivity probe is running"""
+        client = get_gateway()
+        client.start_probe()
+        logger.info(f"DermAI using LLM backend: {client.backend.name}")
+        return client
 
     def _format_prompt(self, user_input: str) -> str:
         return f"""As a dermatology AI assistant, provide a clear and structured response to the following query.
@@ -142,18 +148,41 @@ Remember to:
 User Query: {user_input}
 """
 
-    def _get_user_history(self, user_id: str) -> List:
-        """Get chat history from database"""
+    def _get_user_history(self, user_id: str, after_id: int = 0) -> List:
+        """Get chat history from database, optionally only messages newer than after_id"""
         try:
             logger.debug(f"Fetching chat history for user_id: {user_id}")
-            messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.timestamp).all()
-            history = [{"role": msg.role, "content": msg.content} for msg in messages]
+            messages = ChatMessage.query.filter(
+                ChatMessage.user_id == user_id,
+                ChatMessage.id > after_id
+            ).order_by(ChatMessage.timestamp).all()
+            history = [{"id": msg.id, "role": msg.role, "content": msg.content} for msg in messages]
             logger.debug(f"Found {len(history)} messages in history")
             return history
         except Exception as e:
             logger.error(f"Error retrieving chat history for user {user_id}: {str(e)}", exc_info=True)
             raise
 
+    def _get_context(self, user_id: str):
+        """Return (summary text, recent history), folding turns that left the window into the summary"""
+        summary = db.session.get(ConversationSummary, user_id)
+        history = self._get_user_history(user_id, after_id=summary.last_message_id if summary else 0)
+
+        to_fold, recent = self.prompt_builder.split_history(history)
+        if to_fold:
+            if summary is None:
+                summary = ConversationSummary(user_id=user_id, summary='', last_message_id=0)
+                db.session.add(summary)
+            summary.summary = self.prompt_builder.extend_summary(summary.summary, to_fold)
+            summary.last_message_id = to_fold[-1]['id']
+            try:
+                db.session.commit()
+            except Exception as e:
+                logger.error(f"Error saving conversation summary for user {user_id}: {str(e)}")
+                db.session.rollback()
+
+        return (summary.summary if summary else None), recent
+
     def _save_message(self, user_id: str, role: str, content: str):
         """Save message to database"""
         try:
@@ -167,92 +196,147 @@ User Query: {user_input}
             db.session.rollback()
             raise
 
-    @retry(
-        stop=stop_after_attempt(Config.MAX_RETRIES),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
-    def get_response(self, user_input: str, user_id: str) -> Dict[str, any]:
-        try:
-            logger.info(f"Processing chat request for user_id: {user_id}")
-            
-            # Validate input
-            if not user_input.strip():
-                raise ValueError("Empty user input")
-                
-            # Format prompt and get history
-            formatted_prompt = self._format_prompt(user_input)
-            history = self._get_user_history(user_id)
-            
-            logger.debug("Preparing messages for Groq API")
-            messages = [
-                {"role": "system", "content": "You are a dermatology AI assistant providing skin health information."},
-                *history[-5:],  # Keep last 5 messages for context
-                {"role": "user", "content": formatted_prompt}
-            ]
-            
-            logger.info("Sending request to Groq API")
-            completion = self.client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=messages,
-                temperature=0.7,
-                max_tokens=1000
+    def _prepare_turn(self, user_input: str, user_id: str):
+        """Validate input and assemble the prompt.
+
+        Returns (messages, cached_response, first_turn); messages is None when
+        the answer cache already has a response.
+        """
+        logger.info(f"Processing chat request for user_id: {user_id}")
+
+        # Validate input
+        if not user_input.strip():
+            raise ValueError("Empty user input")
+
+        # Format prompt and get summarized history
+        formatted_prompt = self._format_prompt(user_input)
+        with stage('db_context'):
+            summary, recent = self._get_context(user_id)
+            # End the read transaction so the pooled connection is not held
+            # for the duration of the LLM call
+            db.session.close()
+
+        # Only first-turn questions are answerable from the shared cache
+        first_turn = not recent and not summary
+        if first_turn and self.answer_cache:
+            with stage('cache_lookup'):
+                cached = self.answer_cache.get(user_input)
+            if cached:
+                logger.info("Serving chat response from answer cache")
+                return None, cached, first_turn
+
+        logger.debug("Preparing messages for Groq API")
+        with stage('prompt_build'):
+            messages = self.prompt_builder.build(
+                system_prompt="You are a dermatology AI assistant providing skin health information.",
+                user_prompt=formatted_prompt,
+                query=user_input,
+                recent=recent,
+                summary=summary
             )
-            
-            if not completion or not completion.choices:
-                raise ValueError("No response received from Groq API")
-                
-            ai_response = completion.choices[0].message.content.strip()
-            logger.debug(f"Received response from Groq API: {ai_response[:100]}...")
-            
-            # Save messages to database
-            logger.info("Saving conversation to database")
+        return messages, None, first_turn
+
+    def _finish_turn(self, user_input: str, user_id: str, ai_response: str,
+                     first_turn: bool, from_cache: bool) -> Dict[str, any]:
+        if first_turn and self.answer_cache and not from_cache:
+            self.answer_cache.put(user_input, ai_response)
+
+        # Save messages to database
+        logger.info("Saving conversation to database")
+        with stage('db_commit'):
             self._save_message(user_id, "user", user_input)
             self._save_message(user_id, "assistant", ai_response)
-            
-            return {
-                "success": True,
-                "response": ai_response,
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": user_id
-            }
-            
-        except groq.error.AuthenticationError as e:
-            logger.error(f"Groq API authentication error: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "error": "Authentication error with AI service. Please check API key.",
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": user_id
-            }
-        except groq.error.APIConnectionError as e:
-            logger.error(f"Groq API connection error: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "error": "Unable to connect to AI service. Please try again later.",
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": user_id
-            }
-        except groq.error.RateLimitError as e:
-            logger.error(f"Groq API rate limit error: {str(e)}", exc_info=True)
-            return {
-                "success": False,
-                "error": "Rate limit exceeded. Please try again in a few moments.",
-                "timestamp": datetime.utcnow().isoformat(),
-                "user_id": user_id
-            }
+
+        return {
+            "success": True,
+            "response": ai_response,
+            "timestamp": datetime.utcnow().isoformat(),
+            "user_id": user_id
+        }
+
+    def get_response(self, user_input: str, user_id: str) -> Dict[str, any]:
+        try:
+            messages, ai_response, first_turn = self._prepare_turn(user_input, user_id)
+
+            if ai_response is None:
+                logger.info("Sending request to Groq API")
+                with stage('llm'):
+                    ai_response = self.client.complete(
+                        model=CHAT_MODEL,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=1000
+                    )
+                logger.debug("Received response from Groq API (%d chars)", len(ai_response))
+                return self._finish_turn(user_input, user_id, ai_response, first_turn, from_cache=False)
+
+            return self._finish_turn(user_input, user_id, ai_response, first_turn, from_cache=True)
+
+        except Exception as e:
+            return self._error_response(e, user_id)
+
+    async def aget_response(self, user_input: str, user_id: str, offload) -> Dict[str, any]:
+        """Async variant of get_response for the ASGI serving mode.
+
+        Database work runs through ``offload`` (a coroutine function that runs a
+        callable on an executor); the LLM call is awaited without holding a thread.
+        """
+        try:
+            messages, ai_response, first_turn = await offload(self._prepare_turn, user_input, user_id)
+
+            from_cache = ai_response is not None
+            if not from_cache:
+                logger.info("Sending request to Groq API")
+                with stage('llm'):
+                    ai_response = await self.client.acomplete(
+                        model=CHAT_MODEL,
+                        messages=messages,
+                        temperature=0.7,
+                        max_tokens=1000
+                    )
+                logger.debug("Received response from Groq API (%d chars)", len(ai_response))
+
+            return await offload(self._finish_turn, user_input, user_id, ai_response, first_turn, from_cache)
+
         except Exception as e:
-            logger.error(f"Unexpected error in get_response: {str(e)}", exc_info=True)
+            return self._error_response(e, user_id)
+
+    @staticmethod
+    def _error_response(error: Exception, user_id: str) -> Dict[str, any]:
+        if isinstance(error, LLMUnavailableError):
+            logger.warning(f"LLM gateway refused chat request: {str(error)}")
             return {
                 "success": False,
-                "error": f"An unexpected error occurred: {str(e)}",
+                "degraded": True,
+                "error": "The AI assistant is under heavy load. Please try again in a few moments.",
                 "timestamp": datetime.utcnow().isoformat(),
                 "user_id": user_id
             }
+        if isinstance(error, groq.AuthenticationError):
+            logger.error(f"Groq API authentication error: {str(error)}", exc_info=error)
+            message = "Authentication error with AI service. Please check API key."
+        elif isinstance(error, groq.APIConnectionError):
+            logger.error(f"Groq API connection error: {str(error)}", exc_info=error)
+            message = "Unable to connect to AI service. Please try again later."
+        elif isinstance(error, groq.RateLimitError):
+            logger.error(f"Groq API rate limit error: {str(error)}", exc_info=error)
+            message = "Rate limit exceeded. Please try again in a few moments."
+        else:
+            logger.error(f"Unexpected error in get_response: {str(error)}", exc_info=error)
+            message = f"An unexpected error occurred: {str(error)}"
+        return {
+            "success": False,
+            "error": message,
+            "timestamp": datetime.utcnow().isoformat(),
+            "user_id": user_id
+        }
 
     def clear_conversation(self, user_id: str) -> Dict[str, any]:
         try:
             # Delete all messages for this user from the database
             ChatMessage.query.filter_by(user_id=user_id).delete()
+            ConversationSummary.query.filter_by(user_id=user_id).delete()
+            bump_version(user_id, RESOURCE_CHAT)
             db.session.commit()
             
             return {
@@ -275,51 +359,79 @@ User Query: {user_input}
 derm_ai = DermAI()
 
 # ===================== ROUTES =====================
+def _parse_chat_request():
+    """Validate the chat request body; returns (data, None) or (None, error response)"""
+    logger.debug("Received chat request", extra={
+        'content_type': request.content_type,
+        'content_length': request.content_length
+    })
+    if LOG_REQUEST_BODIES:
+        logger.debug("Chat request body", extra={'body': request.get_data(as_text=True)})
+
+    if not request.is_json:
+        logger.error("Request Content-Type is not application/json")
+        return None, (jsonify({
+            "success": False,
+            "error": "Request must be JSON with Content-Type: application/json",
+            "timestamp": datetime.utcnow().isoformat()
+        }), 400)
+
+    data = request.get_json()
+
+    if not data:
+        logger.error("Empty JSON body received")
+        return None, (jsonify({
+            "success": False,
+            "error": "Empty request body",
+            "timestamp": datetime.utcnow().isoformat()
+        }), 400)
+
+    if 'message' not in data or 'user_id' not in data:
+        logger.error(f"Missing required fields. Received fields: {list(data.keys())}")
+        return None, (jsonify({
+            "success": False,
+            "error": "Missing required fields: message and user_id",
+            "timestamp": datetime.utcnow().isoformat()
+        }), 400)
+
+    return data, None
+
+def _chat_error(e):
+    logger.error(f"Unexpected error in chat endpoint: {str(e)}", exc_info=e)
+    return jsonify({
+        "success": False,
+        "error": "Internal server error occurred",
+        "details": str(e),
+        "timestamp": datetime.utcnow().isoformat()
+    }), 500
+
 @bp.route('/chat', methods=['POST'])
 def chat():
     try:
-        logger.debug(f"Received chat request. Content-Type: {request.headers.get('Content-Type')}")
-        logger.debug(f"Request data: {request.get_data(as_text=True)}")
-        
-        if not request.is_json:
-            logger.error("Request Content-Type is not application/json")
-            return jsonify({
-                "success": False,
-                "error": "Request must be JSON with Content-Type: application/json",
-                "timestamp": datetime.utcnow().isoformat()
-            }), 400
-
-        data = request.get_json()
-        logger.debug(f"Parsed JSON data: {data}")
-
-        if not data:
-            logger.error("Empty JSON body received")
-            return jsonify({
-                "success": False,
-                "error": "Empty request body",
-                "timestamp": datetime.utcnow().isoformat()
-            }), 400
+        data, error = _parse_chat_request()
+        if error:
+            return error
 
-        if 'message' not in data or 'user_id' not in data:
-            logger.error(f"Missing required fields. Received fields: {list(data.keys())}")
-            return jsonify({
-                "success": False,
-                "error": "Missing required fields: message and user_id",
-                "timestamp": datetime.utcnow().isoformat()
-            }), 400
-        
         response = derm_ai.get_response(data['message'], data['user_id'])
         logger.info(f"Chat response generated successfully for user_id: {data['user_id']}")
         return jsonify(response)
 
     except Exception as e:
-        logger.error(f"Unexpected error in chat endpoint: {str(e)}", exc_info=True)
-        return jsonify({
-            "success": False,
-            "error": "Internal server error occurred",
-            "details": str(e),
-            "timestamp": datetime.utcnow().isoformat()
-        }), 500
+        return _chat_error(e)
+
+async def chat_async(req):
+    """Native async version of chat() served by the ASGI app (see api/asgi_server.py)"""
+    try:
+        data, error = await req.run(_parse_chat_request)
+        if error:
+            return error
+
+        response = await derm_ai.aget_response(data['message'], data['user_id'], offload=req.run)
+        logger.info(f"Chat response generated successfully for user_id: {data['user_id']}")
+        return response
+
+    except Exception as e:
+        return await req.run(_chat_error, e)
 
 @bp.route('/chat/clear', methods=['POST'])
 def clear_chat():
@@ -353,7 +465,12 @@ def get_chat_history():
                 "timestamp": datetime.utcnow().isoformat()
             }), 400
 
-        messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.timestamp).all()
+        not_modified, etag, last_modified = check_not_modified(user_id, RESOURCE_CHAT)
+        if not_modified:
+            return not_modified
+
+        with stage('db_query'):
+            messages = ChatMessage.query.filter_by(user_id=user_id).order_by(ChatMessage.timestamp).all()
         history = [{
             "id": str(msg.id),
             "role": msg.role,
@@ -361,12 +478,13 @@ def get_chat_history():
             "timestamp": msg.timestamp.isoformat()
         } for msg in messages]
 
-        return jsonify({
+        response = jsonify({
             "success": True,
             "history": history,
             "user_id": user_id,
             "timestamp": datetime.utcnow().isoformat()
         })
+        return apply_validators(response, etag, last_modified)
 
     except Exception as e:
         logger.error(f"Error retrieving chat history: {e}", exc_info=True)
@@ -383,16 +501,27 @@ def chat_health():
         # Test database connection
         ChatMessage.query.first()
         
-        # Test GROQ API key
-        api_key = os.getenv('GROQ_API_KEY')
-        if not api_key:
+        # Report the latest background connectivity probe result
+        connectivity = derm_ai.client.connectivity()
+        if connectivity['status'] == 'unconfigured':
             raise ValueError("GROQ_API_KEY not found in environment")
 
+        if connectivity['status'] == 'unreachable':
+            return jsonify({
+                "success": False,
+                "status": "degraded",
+                "database": "connected",
+                "api": connectivity['status'],
+                "llm": connectivity,
+                "timestamp": datetime.utcnow().isoformat()
+            }), 503
+
         return jsonify({
             "success": True,
             "status": "healthy",
             "database": "connected",
-            "api": "configured",
+            "api": connectivity['status'],
+            "llm": connectivity,
             "timestamp": datetime.utcnow().isoformat()
         })
     except Exception as e:
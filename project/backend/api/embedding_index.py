@@ -0,0 +1,374 @@
+"""
+Similar-case retrieval over the classifier's image embeddings.
+
+The EfficientNet backbone's globally pooled features (the 1280-d input of the
+classification layer) come out of the same forward pass as the prediction.
+They are L2-normalised and appended to a float16 matrix on disk, next to the
+SkinAnalysisResult id of each row, in one directory per model version
+(embeddings of different checkpoints are not comparable):
+
+    instance/embeddings/<version>/vectors.f16   rows x 1280 float16 (2.5 KB per case)
+    instance/embeddings/<version>/ids.i64       analysis id of each row
+
+Both files are append-only and memory-mapped read-only by every process, so
+the archive lives in the page cache rather than in each worker's heap.
+Cosine similarity is a dot product of normalised vectors.
+
+* Exact search scans the matrix in float16 chunks; it is used for small
+  archives and for any restricted subset (e.g. one user's analyses).
+* Past EMBEDDING_ANN_MIN_ROWS rows, ``embeddings_cli.py build-ann`` trains a
+  faiss IVF-PQ index (optional dependency ``faiss-cpu``; 64 bytes per case in
+  RAM). Queries probe EMBEDDING_IVF_NPROBE lists, re-rank the candidates
+  exactly against the float16 vectors, and scan rows appended since the build.
+
+Rows of deleted analyses stay in the files until ``embeddings_cli.py compact``;
+callers drop ids that no longer exist. After a model swap the new version's
+index starts empty; ``embeddings_cli.py backfill`` re-embeds the archive.
+
+Images the cascade student answered have no full-model embedding. Embedding
+each one in a background job would spend the full EfficientNet pass the
+cascade just saved, so by default they stay out of the index until the next
+``backfill``, which embeds them in batches off the request path. Similar-case
+search for such an analysis returns 404 until then. EMBEDDING_STUDENT_JOBS=on
+queues a low-priority ``embed`` job per student answer instead, trading that
+saving for immediate indexing.
+
+    EMBEDDING_INDEX_MODE     on (default) or off
+    EMBEDDING_STUDENT_JOBS   on or off (default): embed student answers in a background job
+    EMBEDDING_INDEX_DIR      instance/embeddings
+    EMBEDDING_ANN_MIN_ROWS   use the IVF-PQ index, when built, past this many rows (50000)
+    EMBEDDING_IVF_NPROBE     inverted lists probed per query (16)
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: appends are only serialized within the process
+    fcntl = None
+
+import numpy as np
+import torch
+from prometheus_client import Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_INDEX_MODE = os.getenv('EMBEDDING_INDEX_MODE', 'on').lower()
+EMBEDDING_INDEX_DIR = os.getenv(
+    'EMBEDDING_INDEX_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'embeddings')
+)
+EMBEDDING_ANN_MIN_ROWS = int(os.getenv('EMBEDDING_ANN_MIN_ROWS', '50000'))
+EMBEDDING_IVF_NPROBE = int(os.getenv('EMBEDDING_IVF_NPROBE', '16'))
+EMBEDDING_STUDENT_JOBS = os.getenv('EMBEDDING_STUDENT_JOBS', 'off').lower() == 'on'
+
+EMBEDDING_DIM = 1280  # EfficientNet-B0 pooled features
+SCAN_CHUNK_ROWS = 65536
+# Candidates fetched from the IVF-PQ index per requested result, re-ranked exactly
+ANN_RERANK_FACTOR = 32
+
+EMBEDDING_INDEX_ROWS = Gauge('embedding_index_rows', 'Rows in the similar-case embedding index')
+EMBEDDING_SEARCH_LATENCY = Histogram(
+    'embedding_search_seconds', 'Similar-case search latency', ['method'],
+    buckets=[0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+
+def _import_faiss():
+    try:
+        import faiss
+    except ImportError:
+        raise RuntimeError("The IVF-PQ index needs the faiss-cpu package (pip install faiss-cpu)")
+    return faiss
+
+
+def normalize(embeddings) -> np.ndarray:
+    """Float16 unit vectors from a (dim,) or (n, dim) tensor or array"""
+    if isinstance(embeddings, torch.Tensor):
+        embeddings = embeddings.detach().cpu().numpy()
+    matrix = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return (matrix / np.maximum(norms, 1e-12)).astype(np.float16)
+
+
+def _topk(scores: torch.Tensor, k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+    return torch.topk(scores, min(k, scores.numel()))
+
+
+class EmbeddingIndex:
+    def __init__(self, directory: str, dim: int = EMBEDDING_DIM):
+        self.directory = directory
+        self.dim = dim
+        self.row_bytes = dim * 2
+        self.vectors_path = os.path.join(directory, 'vectors.f16')
+        self.ids_path = os.path.join(directory, 'ids.i64')
+        self.ann_path = os.path.join(directory, 'ivfpq.faiss')
+        self._lock_path = os.path.join(directory, '.lock')
+        self._thread_lock = threading.Lock()
+        self._map_lock = threading.Lock()
+        self._vectors = np.empty((0, dim), dtype=np.float16)
+        self._ids = np.empty(0, dtype='<i8')
+        self._file_key = None
+        self._ann = None
+        self._ann_key = None
+
+    # ----- writes -----
+    @contextmanager
+    def _write_lock(self):
+        """Serialize appends across threads and, via flock, across processes"""
+        with self._thread_lock:
+            os.makedirs(self.directory, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(self._lock_path, 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def add(self, analysis_id: int, embedding) -> None:
+        self.add_many([analysis_id], embedding)
+
+    def add_many(self, analysis_ids: Sequence[int], embeddings) -> None:
+        vectors = normalize(embeddings)
+        if len(vectors) != len(analysis_ids) or vectors.shape[1] != self.dim:
+            raise ValueError(f"Expected {len(analysis_ids)} embeddings of size {self.dim}, got {vectors.shape}")
+        ids = np.asarray(analysis_ids, dtype='<i8')
+        with self._write_lock():
+            rows = self._file_rows()
+            with open(self.vectors_path, 'ab') as f:
+                # Drops vectors left behind by an append interrupted before its ids were written
+                f.truncate(rows * self.row_bytes)
+                f.write(vectors.tobytes())
+            # The ids file defines the row count: readers never see a row before its vector
+            with open(self.ids_path, 'ab') as f:
+                f.write(ids.tobytes())
+        EMBEDDING_INDEX_ROWS.set(rows + len(ids))
+
+    def _file_rows(self) -> int:
+        try:
+            return os.path.getsize(self.ids_path) // 8
+        except FileNotFoundError:
+            return 0
+
+    # ----- reads -----
+    def _snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(vectors, ids) memory maps covering every row written so far"""
+        try:
+            st = os.stat(self.ids_path)
+        except FileNotFoundError:
+            return self._vectors[:0], self._ids[:0]
+        key = (st.st_ino, st.st_size)
+        with self._map_lock:
+            if key != self._file_key:
+                rows = st.st_size // 8
+                if rows:
+                    # Copy-on-write maps are writable views for torch without copying the file
+                    self._ids = np.memmap(self.ids_path, dtype='<i8', mode='c', shape=(rows,))
+                    self._vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='c',
+                                              shape=(rows, self.dim))
+                else:
+                    self._ids = np.empty(0, dtype='<i8')
+                    self._vectors = np.empty((0, self.dim), dtype=np.float16)
+                self._file_key = key
+                EMBEDDING_INDEX_ROWS.set(rows)
+            return self._vectors, self._ids
+
+    def __len__(self) -> int:
+        return len(self._snapshot()[1])
+
+    def ids(self) -> np.ndarray:
+        return self._snapshot()[1]
+
+    def get(self, analysis_id: int) -> Optional[np.ndarray]:
+        """Stored (normalised) embedding of an analysis, or None when it has not been indexed"""
+        vectors, ids = self._snapshot()
+        rows = np.flatnonzero(ids == analysis_id)
+        return np.array(vectors[rows[-1]]) if len(rows) else None
+
+    def search(self, query, k: int = 10, restrict_to: Optional[Iterable[int]] = None,
+               exclude: Iterable[int] = ()) -> List[Tuple[int, float]]:
+        """Up to k (analysis_id, cosine similarity) pairs, most similar first.
+
+        restrict_to limits the search to those analysis ids (exact scan of
+        their rows); exclude drops ids such as the query's own.
+        """
+        vectors, ids = self._snapshot()
+        query = torch.from_numpy(normalize(query)[0])
+        exclude = set(exclude)
+        # Duplicates (re-indexed analyses) and excluded ids are dropped after ranking
+        fetch = 2 * k + len(exclude)
+
+        start = time.perf_counter()
+        if restrict_to is not None:
+            method = 'exact'
+            rows = np.flatnonzero(np.isin(ids, np.fromiter(restrict_to, dtype='<i8')))
+            scores, found = self._score_rows(vectors, rows, query, fetch)
+        else:
+            ann = self._load_ann(len(ids))
+            method = 'ann' if ann is not None else 'exact'
+            scores, found = self._search_all(vectors, query, fetch, ann)
+        EMBEDDING_SEARCH_LATENCY.labels(method=method).observe(time.perf_counter() - start)
+
+        results, seen = [], set(exclude)
+        for score, row in zip(scores.tolist(), found.tolist()):
+            analysis_id = int(ids[row])
+            if analysis_id not in seen:
+                seen.add(analysis_id)
+                results.append((analysis_id, score))
+                if len(results) == k:
+                    break
+        return results
+
+    def _scan(self, vectors: np.ndarray, query: torch.Tensor, k: int,
+              start: int = 0) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Exact top-k of vectors[start:] in chunks (float16 dot products, no float32 copy)"""
+        best_scores, best_rows = [torch.empty(0)], [torch.empty(0, dtype=torch.long)]
+        for offset in range(start, len(vectors), SCAN_CHUNK_ROWS):
+            chunk = torch.from_numpy(vectors[offset:offset + SCAN_CHUNK_ROWS])
+            scores, rows = _topk((chunk @ query).float(), k)
+            best_scores.append(scores)
+            best_rows.append(rows + offset)
+        return self._merge(best_scores, best_rows, k)
+
+    def _score_rows(self, vectors: np.ndarray, rows: np.ndarray, query: torch.Tensor,
+                    k: int) -> Tuple[torch.Tensor, torch.Tensor]:
+        if not len(rows):
+            return torch.empty(0), torch.empty(0, dtype=torch.long)
+        scores = (torch.from_numpy(vectors[rows]) @ query).float()
+        top, order = _topk(scores, k)
+        return top, torch.from_numpy(rows)[order]
+
+    def _search_all(self, vectors, query, k, ann) -> Tuple[torch.Tensor, torch.Tensor]:
+        if ann is None:
+            return self._scan(vectors, query, k)
+        # Approximate candidates from the indexed rows, re-ranked exactly; newer rows scanned
+        _, candidates = ann.search(query.float().numpy()[None], k * ANN_RERANK_FACTOR)
+        candidates = candidates[0][candidates[0] >= 0]
+        indexed = self._score_rows(vectors, candidates, query, k)
+        recent = self._scan(vectors, query, k, start=ann.ntotal)
+        return self._merge([indexed[0], recent[0]], [indexed[1], recent[1]], k)
+
+    @staticmethod
+    def _merge(scores: List[torch.Tensor], rows: List[torch.Tensor], k: int):
+        scores, rows = torch.cat(scores), torch.cat(rows)
+        top, order = _topk(scores, k)
+        return top, rows[order]
+
+    # ----- approximate index -----
+    def _load_ann(self, rows: int):
+        """The IVF-PQ index, when built, faiss is installed and the archive is large enough"""
+        if rows < EMBEDDING_ANN_MIN_ROWS:
+            return None
+        try:
+            st = os.stat(self.ann_path)
+        except FileNotFoundError:
+            self._ann = self._ann_key = None
+            return None
+        key = (st.st_ino, st.st_mtime)
+        with self._map_lock:
+            if key != self._ann_key:
+                self._ann_key = key
+                try:
+                    self._ann = _import_faiss().read_index(self.ann_path)
+                    self._ann.nprobe = EMBEDDING_IVF_NPROBE
+                    logger.info(f"Loaded IVF-PQ embedding index covering {self._ann.ntotal} rows")
+                except Exception as e:
+                    logger.error(f"Cannot load embedding index {self.ann_path}: {e}")
+                    self._ann = None
+            ann = self._ann
+        # An index built before a compaction points at rows that no longer exist
+        return ann if ann is not None and ann.ntotal <= rows else None
+
+    def build_ann(self, lists: Optional[int] = None, subquantizers: int = 64,
+                  train_rows: int = 65536, seed: int = 0) -> dict:
+        """Train and write an IVF-PQ index over every row currently stored"""
+        faiss = _import_faiss()
+        vectors, _ = self._snapshot()
+        rows = len(vectors)
+        lists = lists or max(1, int(np.sqrt(rows)))
+        if rows < lists * 39:
+            raise ValueError(f"{rows} rows are too few to train {lists} inverted lists")
+
+        sample = np.random.default_rng(seed).choice(rows, size=min(rows, max(train_rows, lists * 39)), replace=False)
+        quantizer = faiss.IndexFlatIP(self.dim)
+        index = faiss.IndexIVFPQ(quantizer, self.dim, lists, subquantizers, 8, faiss.METRIC_INNER_PRODUCT)
+        start = time.perf_counter()
+        index.train(np.asarray(vectors[np.sort(sample)], dtype=np.float32))
+        trained = time.perf_counter() - start
+        for offset in range(0, rows, SCAN_CHUNK_ROWS):
+            chunk = np.asarray(vectors[offset:offset + SCAN_CHUNK_ROWS], dtype=np.float32)
+            index.add(chunk)  # sequential ids = row numbers
+
+        tmp_path = f"{self.ann_path}.{os.getpid()}.tmp"
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, self.ann_path)
+        return {'rows': rows, 'lists': lists, 'subquantizers': subquantizers,
+                'train_seconds': trained, 'total_seconds': time.perf_counter() - start}
+
+    def compact(self, live_ids: Iterable[int]) -> Tuple[int, int]:
+        """Rewrite the files keeping only the latest row of each id in live_ids.
+
+        Drops the IVF-PQ index, whose rows would no longer line up. Returns
+        (rows before, rows after).
+        """
+        live = np.fromiter(live_ids, dtype='<i8')
+        with self._write_lock():
+            rows = self._file_rows()
+            if not rows:
+                return 0, 0
+            ids = np.fromfile(self.ids_path, dtype='<i8', count=rows)
+            vectors = np.memmap(self.vectors_path, dtype=np.float16, mode='r', shape=(rows, self.dim))
+            # Last occurrence of each id: first occurrence in the reversed array
+            _, last = np.unique(ids[::-1], return_index=True)
+            keep = np.sort(rows - 1 - last)
+            keep = keep[np.isin(ids[keep], live)]
+
+            tmp_vectors, tmp_ids = f"{self.vectors_path}.tmp", f"{self.ids_path}.tmp"
+            with open(tmp_vectors, 'wb') as f:
+                for offset in range(0, len(keep), SCAN_CHUNK_ROWS):
+                    f.write(np.ascontiguousarray(vectors[keep[offset:offset + SCAN_CHUNK_ROWS]]).tobytes())
+            ids[keep].tofile(tmp_ids)
+            del vectors
+            os.replace(tmp_vectors, self.vectors_path)
+            os.replace(tmp_ids, self.ids_path)
+            if os.path.exists(self.ann_path):
+                os.remove(self.ann_path)
+        return rows, len(keep)
+
+    def stats(self) -> dict:
+        vectors, _ = self._snapshot()
+        ann = self._load_ann(len(vectors))
+        return {
+            'rows': len(vectors),
+            'bytes': len(vectors) * self.row_bytes,
+            'ann_rows': ann.ntotal if ann is not None else None
+        }
+
+
+_indexes: Dict[str, EmbeddingIndex] = {}
+_index_lock = threading.Lock()
+
+
+def index_directory(model_version: str) -> str:
+    return os.path.join(EMBEDDING_INDEX_DIR, model_version)
+
+
+def get_embedding_index(model_version: str) -> Optional[EmbeddingIndex]:
+    """Return the process-wide index of a model version's embeddings, or None when EMBEDDING_INDEX_MODE=off"""
+    if EMBEDDING_INDEX_MODE == 'off':
+        return None
+    index = _indexes.get(model_version)
+    if index is None:
+        with _index_lock:
+            index = _indexes.get(model_version)
+            if index is None:
+                index = _indexes[model_version] = EmbeddingIndex(index_directory(model_version))
+    return index
@@ -0,0 +1,322 @@
+"""
+Streaming bulk export of analyses and chat transcripts.
+
+Rows are read in fixed-size chunks by keyset pagination (``id > last id``,
+EXPORT_CHUNK_ROWS at a time), and each chunk is encoded and handed to the
+caller before the next one is read. SQLite has no server-side cursors; short
+per-chunk queries give the same flat memory profile without holding a read
+transaction (and a pooled connection) open for the whole download. Rows
+inserted while an export runs are not included: the export stops at the
+highest id present when it started.
+
+Formats: NDJSON, CSV, and Parquet (one row group per chunk; ``pyarrow`` is
+imported on first use). With images, the output is an uncompressed tar
+streamed member by member: ``images/<analysis id><ext>`` as rows are read,
+then the data file (spooled to a temporary file, not memory) as
+``analyses.<format>``.
+
+    EXPORT_CHUNK_ROWS   rows per query and per Parquet row group (1000)
+"""
+
+import io
+import os
+import csv
+import json
+import time
+import tarfile
+import tempfile
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence
+
+from prometheus_client import Counter
+from sqlalchemy import func, select
+
+from api.skin_analysis import db, ChatMessage, SkinAnalysisResult, CLASS_NAMES
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK_ROWS = int(os.getenv('EXPORT_CHUNK_ROWS', '1000'))
+COPY_BYTES = 1 << 20
+
+EXPORT_ROWS = Counter('export_rows_total', 'Rows streamed by bulk exports', ['table', 'format'])
+
+TABLES = {
+    'analyses': (SkinAnalysisResult, ('id', 'user_id', 'timestamp', 'image_path', 'primary_condition',
+                                      'confidence', 'model_version', 'model_stage', 'detailed_analysis')),
+    'chats': (ChatMessage, ('id', 'user_id', 'role', 'content', 'timestamp')),
+}
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+
+class ExportError(ValueError):
+    """Invalid export parameters"""
+
+
+def _parse_time(value: Optional[str], name: str, end: bool = False) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ExportError(f"{name} must be an ISO date or datetime, e.g. 2026-01-31")
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)  # a date-only upper bound includes that whole day
+    return parsed
+
+
+class ExportQuery(NamedTuple):
+    table: str
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None   # exclusive
+    conditions: Sequence[str] = ()
+    user_id: Optional[str] = None
+
+    @classmethod
+    def parse(cls, table: str, since: Optional[str] = None, until: Optional[str] = None,
+              condition: Optional[str] = None, user_id: Optional[str] = None) -> 'ExportQuery':
+        """Validate request or command-line parameters; condition is comma-separated"""
+        if table not in TABLES:
+            raise ExportError(f"Unknown table '{table}'; expected one of {', '.join(TABLES)}")
+        conditions = tuple(c.strip() for c in (condition or '').split(',') if c.strip())
+        if conditions and table != 'analyses':
+            raise ExportError("condition only applies to analyses")
+        unknown = [c for c in conditions if c not in CLASS_NAMES]
+        if unknown:
+            raise ExportError(f"Unknown condition {', '.join(unknown)}; expected one of {', '.join(CLASS_NAMES)}")
+        return cls(table, _parse_time(since, 'since'), _parse_time(until, 'until', end=True),
+                   conditions, user_id or None)
+
+    @property
+    def columns(self) -> Sequence[str]:
+        return TABLES[self.table][1]
+
+    def _filters(self) -> list:
+        model = TABLES[self.table][0]
+        filters = []
+        if self.since is not None:
+            filters.append(model.timestamp >= self.since)
+        if self.until is not None:
+            filters.append(model.timestamp < self.until)
+        if self.conditions:
+            filters.append(model.primary_condition.in_(self.conditions))
+        if self.user_id is not None:
+            filters.append(model.user_id == self.user_id)
+        return filters
+
+    def chunks(self, chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[List[Dict[str, object]]]:
+        """Matching rows as lists of at most chunk_rows dicts, in id order"""
+        model, columns = TABLES[self.table]
+        selected = [getattr(model, name) for name in columns]
+        filters = self._filters()
+        last_id = 0
+        high_id = db.session.execute(select(func.max(model.id))).scalar() or 0
+        while True:
+            rows = db.session.execute(
+                select(*selected).where(model.id > last_id, model.id <= high_id, *filters)
+                .order_by(model.id).limit(chunk_rows)
+            ).all()
+            # End the read transaction between chunks so writers and the pool are not held up
+            db.session.close()
+            if not rows:
+                return
+            last_id = rows[-1][0]
+            yield [dict(zip(columns, row)) for row in rows]
+
+
+# ===================== ENCODERS =====================
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+class NdjsonEncoder:
+    def __init__(self, columns: Sequence[str]):
+        pass
+
+    def begin(self) -> bytes:
+        return b''
+
+    def encode(self, rows: List[dict]) -> bytes:
+        return ''.join(json.dumps(row, default=_json_default) + '\n' for row in rows).encode()
+
+    def end(self) -> bytes:
+        return b''
+
+
+class CsvEncoder:
+    def __init__(self, columns: Sequence[str]):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+    def begin(self) -> bytes:
+        self._writer.writerow(self.columns)
+        return self._drain()
+
+    def encode(self, rows: List[dict]) -> bytes:
+        self._writer.writerows(
+            [row[c].isoformat() if isinstance(row[c], datetime) else row[c] for c in self.columns] for row in rows
+        )
+        return self._drain()
+
+    def end(self) -> bytes:
+        return b''
+
+
+class _DrainBuffer:
+    """Write-only file object whose contents are taken out after each write batch"""
+
+    def __init__(self):
+        self._data = bytearray()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._data += data
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self._data)
+        self._data.clear()
+        return data
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ExportError("Parquet export needs the pyarrow package (pip install pyarrow)")
+    return pyarrow
+
+
+class ParquetEncoder:
+    def __init__(self, columns: Sequence[str]):
+        pa = _import_pyarrow()
+        types = {'id': pa.int64(), 'timestamp': pa.timestamp('us'), 'confidence': pa.float64()}
+        self._pa = pa
+        self._schema = pa.schema([(c, types.get(c, pa.string())) for c in columns])
+        self._sink = _DrainBuffer()
+        self._writer = None
+
+    def begin(self) -> bytes:
+        self._writer = self._pa.parquet.ParquetWriter(self._sink, self._schema, compression='zstd')
+        return self._sink.drain()
+
+    def encode(self, rows: List[dict]) -> bytes:
+        self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+        return self._sink.drain()
+
+    def end(self) -> bytes:
+        self._writer.close()  # writes the footer
+        return self._sink.drain()
+
+
+ENCODERS = {'ndjson': NdjsonEncoder, 'csv': CsvEncoder, 'parquet': ParquetEncoder}
+
+
+def encoder_for(fmt: str, query: ExportQuery):
+    if fmt not in ENCODERS:
+        raise ExportError(f"Unknown format '{fmt}'; expected one of {', '.join(ENCODERS)}")
+    return ENCODERS[fmt](query.columns)
+
+
+# ===================== TAR =====================
+def _tar_member(name: str, fileobj, size: int, mtime: float) -> Iterator[bytes]:
+    """Header, contents in COPY_BYTES blocks and padding of one tar member"""
+    info = tarfile.TarInfo(name)
+    info.size, info.mtime, info.mode = size, int(mtime), 0o644
+    yield info.tobuf(tarfile.PAX_FORMAT)
+    remaining = size
+    while remaining:
+        block = fileobj.read(min(COPY_BYTES, remaining))
+        if not block:
+            yield tarfile.NUL * remaining  # file shrank while being read; keep the archive valid
+            break
+        remaining -= len(block)
+        yield block
+    yield tarfile.NUL * (-size % tarfile.BLOCKSIZE)
+
+
+def _image_member(analysis_id: int, image_path: str) -> Iterator[bytes]:
+    try:
+        f = open(image_path, 'rb')
+    except OSError:
+        return  # deleted by retention or by the user
+    with f:
+        stat = os.fstat(f.fileno())
+        extension = os.path.splitext(image_path)[1].lower()
+        yield from _tar_member(f"images/{analysis_id}{extension}", f, stat.st_size, stat.st_mtime)
+
+
+def _stream_tar(query: ExportQuery, fmt: str, encoder, chunk_rows: int) -> Iterator[bytes]:
+    written = 0
+    with tempfile.TemporaryFile() as spool:
+        spool.write(encoder.begin())
+        for rows in query.chunks(chunk_rows):
+            spool.write(encoder.encode(rows))
+            EXPORT_ROWS.labels(table=query.table, format=fmt).inc(len(rows))
+            for row in rows:
+                for block in _image_member(row['id'], row['image_path']):
+                    written += len(block)
+                    yield block
+        spool.write(encoder.end())
+        size = spool.tell()
+        spool.seek(0)
+        for block in _tar_member(f"{query.table}.{fmt}", spool, size, time.time()):
+            written += len(block)
+            yield block
+    # End-of-archive marker, padded to a whole record like tarfile does
+    end = tarfile.NUL * (2 * tarfile.BLOCKSIZE)
+    yield end + tarfile.NUL * (-(written + len(end)) % tarfile.RECORDSIZE)
+
+
+def stream_export(query: ExportQuery, fmt: str, images: bool = False,
+                  chunk_rows: int = EXPORT_CHUNK_ROWS) -> Iterator[bytes]:
+    """Encoded export as a sequence of byte chunks.
+
+    Parameters are validated here, before the first chunk is produced, so
+    callers can turn ExportError into an error response.
+    """
+    if images and query.table != 'analyses':
+        raise ExportError("images only apply to analyses")
+    encoder = encoder_for(fmt, query)
+    logger.info(f"Exporting {query.table} as {fmt}{' with images' if images else ''}: {query}")
+    if images:
+        return _stream_tar(query, fmt, encoder, chunk_rows)
+    return _stream_rows(query, fmt, encoder, chunk_rows)
+
+
+def _stream_rows(query: ExportQuery, fmt: str, encoder, chunk_rows: int) -> Iterator[bytes]:
+    yield encoder.begin()
+    for rows in query.chunks(chunk_rows):
+        EXPORT_ROWS.labels(table=query.table, format=fmt).inc(len(rows))
+        yield encoder.encode(rows)
+    yield encoder.end()
+
+
+def export_filename(query: ExportQuery, fmt: str, images: bool = False) -> str:
+    stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+    return f"{query.table}-{stamp}.{'tar' if images else fmt}"
@@ -0,0 +1,111 @@
+"""
+Conditional GET support for the polled read endpoints.
+
+Every insert or delete of a ChatMessage / SkinAnalysisResult bumps a per-user
+version counter in the same transaction. Read endpoints derive a weak ETag
+from that counter (bodies carry a per-request timestamp, so equal versions are
+equivalent but not byte-identical), so an unchanged poll is answered with a
+single primary key lookup and a 304 before any rows are loaded or previews
+generated.
+"""
+
+import hashlib
+import logging
+from datetime import datetime
+from typing import Optional, Tuple
+
+from flask import request, current_app
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from api.skin_analysis import db, ChatMessage, SkinAnalysisResult, ResourceVersion
+
+logger = logging.getLogger(__name__)
+
+RESOURCE_ANALYSES = 'analyses'
+RESOURCE_CHAT = 'chat'
+
+_TRACKED_MODELS = {
+    ChatMessage: RESOURCE_CHAT,
+    SkinAnalysisResult: RESOURCE_ANALYSES,
+}
+
+
+def _upsert_statement(user_id: str, resource: str):
+    now = datetime.utcnow()
+    table = ResourceVersion.__table__
+    stmt = sqlite_insert(table).values(
+        user_id=user_id, resource=resource, version=1, updated_at=now
+    )
+    return stmt.on_conflict_do_update(
+        index_elements=[table.c.user_id, table.c.resource],
+        set_={'version': table.c.version + 1, 'updated_at': now}
+    )
+
+
+def bump_version(user_id: str, resource: str) -> None:
+    """Bump a version counter for changes the flush hook cannot see (bulk deletes).
+
+    Must be called before the surrounding transaction is committed.
+    """
+    db.session.execute(_upsert_statement(user_id, resource))
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_versions_on_flush(session, flush_context):
+    """Bump counters for tracked rows inserted or deleted in this flush"""
+    changed = set()
+    for obj in list(session.new) + list(session.deleted):
+        resource = _TRACKED_MODELS.get(type(obj))
+        if resource and obj.user_id:
+            changed.add((obj.user_id, resource))
+
+    if not changed:
+        return
+
+    connection = session.connection()
+    for user_id, resource in changed:
+        connection.execute(_upsert_statement(user_id, resource))
+
+
+def get_validators(user_id: str, resource: str, extra: str = '') -> Tuple[str, Optional[datetime]]:
+    """Return (etag, last_modified) for a user's resource without loading any content rows"""
+    row = db.session.get(ResourceVersion, (user_id, resource))
+    version = row.version if row else 0
+    last_modified = row.updated_at if row else None
+
+    digest = hashlib.sha1(f"{resource}:{user_id}:{version}:{extra}".encode()).hexdigest()
+    return digest, last_modified
+
+
+def _matches(etag: str, last_modified: Optional[datetime]) -> bool:
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+
+    return False
+
+
+def apply_validators(response, etag: str, last_modified: Optional[datetime]):
+    """Attach validators and revalidation policy to a response"""
+    response.set_etag(etag, weak=True)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def check_not_modified(user_id: str, resource: str, extra: str = ''):
+    """Look up validators for the request.
+
+    Returns (response, etag, last_modified) where response is a ready 304 if the
+    client's copy is still current, otherwise None.
+    """
+    etag, last_modified = get_validators(user_id, resource, extra)
+    if _matches(etag, last_modified):
+        response = current_app.response_class(status=304)
+        return apply_validators(response, etag, last_modified), etag, last_modified
+    return None, etag, last_modified
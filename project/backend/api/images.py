@@ -0,0 +1,85 @@
+"""
+Image helpers shared by the upload and history endpoints.
+"""
+
+import os
+import io
+import base64
+import logging
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+
+def validate_image(file_path):
+    try:
+        with Image.open(file_path) as img:
+            # Validate image dimensions
+            if any(dim > 4096 for dim in img.size):
+                return False, "Image dimensions too large. Maximum dimension is 4096px."
+            
+            # Validate image format
+            if img.format.lower() not in ['jpeg', 'jpg', 'png']:
+                return False, "Invalid image format. Only JPEG and PNG are supported."
+            
+            # Basic image quality check
+            if img.mode not in ['RGB', 'RGBA']:
+                return False, "Invalid image mode. Only RGB images are supported."
+            
+            return True, None
+    except Exception as e:
+        return False, f"Invalid image file: {str(e)}"
+
+def create_image_preview(file_path, max_size=(800, 800)):
+    try:
+        with Image.open(file_path) as img:
+            # Convert RGBA to RGB if necessary
+            if img.mode == 'RGBA':
+                img = img.convert('RGB')
+            
+            # Resize image while maintaining aspect ratio
+            img.thumbnail(max_size)
+            
+            # Save to bytes
+            img_byte_arr = io.BytesIO()
+            img.save(img_byte_arr, format='JPEG', quality=85)
+            img_byte_arr = img_byte_arr.getvalue()
+            
+            # Convert to base64
+            return base64.b64encode(img_byte_arr).decode()
+    except Exception as e:
+        logger.error(f"Error creating image preview: {str(e)}")
+        return None
+
+def preview_cache_path(file_path):
+    """Where the precomputed preview of an upload is stored (uploads/previews/<name>.b64)"""
+    directory, name = os.path.split(file_path)
+    return os.path.join(directory, 'previews', f"{name}.b64")
+
+def cached_preview(file_path):
+    """Return the precomputed base64 preview, or None if it has not been generated"""
+    try:
+        with open(preview_cache_path(file_path)) as f:
+            return f.read()
+    except OSError:
+        return None
+
+def write_preview(file_path):
+    """Generate the preview once and store it next to the upload"""
+    preview = create_image_preview(file_path)
+    if preview is None:
+        return None
+    path = preview_cache_path(file_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(preview)
+    os.replace(tmp_path, path)
+    return path
+
+def remove_preview(file_path):
+    try:
+        os.remove(preview_cache_path(file_path))
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,212 @@
+"""
+Streaming upload ingestion.
+
+Werkzeug's multipart parser writes every uploaded file into the stream
+returned by ``Request._get_file_stream``. IngestRequest returns an IngestStream
+there, which spools the bytes (in memory, then a temporary file), hashes them
+as they arrive and parses the PNG IHDR / JPEG SOF header from the first few KB.
+An upload with the wrong format, colour mode, dimensions or pixel count is
+rejected with UploadRejected while the parser is still reading it: it is
+never written to the upload folder and never decoded.
+
+The API accepts no uploads other than images, so every file part is checked.
+"""
+
+import os
+import struct
+import hashlib
+import logging
+from tempfile import SpooledTemporaryFile
+from typing import NamedTuple, Optional
+
+from flask import Request
+from PIL import Image
+from prometheus_client import Counter
+from werkzeug.exceptions import BadRequest
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_MAX_DIMENSION = int(os.getenv('UPLOAD_MAX_DIMENSION', '4096'))
+# Decompression-bomb guard: decoded size is width x height x channels
+UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', str(4096 * 4096)))
+# Give up looking for the frame header after this many bytes (large EXIF/ICC blocks precede it)
+UPLOAD_HEADER_MAX_BYTES = int(os.getenv('UPLOAD_HEADER_MAX_BYTES', str(256 * 1024)))
+# Uploads larger than this are spooled to a temporary file
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv('UPLOAD_SPOOL_MAX_MEMORY', str(1024 * 1024)))
+ALLOWED_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+# Decoders elsewhere (previews, preprocessing) refuse what ingestion would
+Image.MAX_IMAGE_PIXELS = UPLOAD_MAX_PIXELS
+
+UPLOAD_REJECTIONS = Counter('upload_rejections_total', 'Uploads rejected during ingestion', ['reason'])
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+JPEG_SOI = b'\xff\xd8'
+# Start-of-frame markers (baseline, extended, progressive, lossless, arithmetic);
+# C4 (DHT), C8 (JPG) and CC (DAC) share the range but are not frame headers
+_JPEG_SOF_MARKERS = frozenset({0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                               0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF})
+# The modes Pillow opens these as
+_PNG_MODES = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+_JPEG_MODES = {1: 'L', 3: 'RGB', 4: 'CMYK'}
+
+FORMAT_ERROR = "Invalid image format. Only JPEG and PNG are supported."
+
+
+class ImageHeader(NamedTuple):
+    format: str
+    width: int
+    height: int
+    mode: str
+
+
+class UploadRejected(BadRequest):
+    """An upload refused during ingestion (answered as a 400 JSON error)"""
+
+    def __init__(self, message: str, reason: str):
+        super().__init__(description=message)
+        self.reason = reason
+
+
+def _reject(message: str, reason: str):
+    UPLOAD_REJECTIONS.labels(reason=reason).inc()
+    raise UploadRejected(message, reason)
+
+
+def parse_image_header(data: bytes) -> Optional[ImageHeader]:
+    """Format, size and mode from the first bytes of a PNG or JPEG file.
+
+    Returns None while more bytes are needed; raises UploadRejected when the
+    data cannot be the start of a supported image.
+    """
+    if data.startswith(PNG_SIGNATURE):
+        return _parse_png(data)
+    if data.startswith(JPEG_SOI):
+        return _parse_jpeg(data)
+    if PNG_SIGNATURE.startswith(data) or JPEG_SOI.startswith(data):
+        return None
+    _reject(FORMAT_ERROR, 'format')
+
+
+def _parse_png(data: bytes) -> Optional[ImageHeader]:
+    # Signature, then IHDR: length, type, width, height, bit depth, colour type, ...
+    if len(data) < 26:
+        return None
+    length, chunk_type = struct.unpack('>I4s', data[8:16])
+    if chunk_type != b'IHDR' or length != 13:
+        _reject("Invalid image file: PNG does not start with an IHDR chunk", 'corrupt')
+    width, height, _depth, colour_type = struct.unpack('>IIBB', data[16:26])
+    mode = _PNG_MODES.get(colour_type)
+    if mode is None:
+        _reject(f"Invalid image file: unknown PNG colour type {colour_type}", 'corrupt')
+    return ImageHeader('png', width, height, mode)
+
+
+def _parse_jpeg(data: bytes) -> Optional[ImageHeader]:
+    pos = len(JPEG_SOI)
+    while True:
+        if pos >= len(data):
+            return None
+        if data[pos] != 0xFF:
+            _reject("Invalid image file: malformed JPEG marker", 'corrupt')
+        # Markers may be padded with any number of 0xFF fill bytes
+        while pos < len(data) and data[pos] == 0xFF:
+            pos += 1
+        if pos >= len(data):
+            return None
+        marker = data[pos]
+        pos += 1
+
+        if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+            continue  # standalone markers carry no length
+        if marker in (0xD9, 0xDA):
+            _reject("Invalid image file: JPEG has no frame header", 'corrupt')
+
+        if pos + 2 > len(data):
+            return None
+        (length,) = struct.unpack('>H', data[pos:pos + 2])
+        if length < 2:
+            _reject("Invalid image file: malformed JPEG segment", 'corrupt')
+        if marker in _JPEG_SOF_MARKERS:
+            # Segment: length, precision, height, width, number of components
+            if pos + 8 > len(data):
+                return None
+            _precision, height, width, components = struct.unpack('>BHHB', data[pos + 2:pos + 8])
+            return ImageHeader('jpeg', width, height, _JPEG_MODES.get(components, f"{components}-channel"))
+        pos += length
+
+
+def check_header(header: ImageHeader) -> None:
+    """Apply the upload limits to a parsed header"""
+    if header.width == 0 or header.height == 0:
+        _reject("Invalid image file: image has no pixels", 'dimensions')
+    if max(header.width, header.height) > UPLOAD_MAX_DIMENSION:
+        _reject(f"Image dimensions too large. Maximum dimension is {UPLOAD_MAX_DIMENSION}px.", 'dimensions')
+    if header.width * header.height > UPLOAD_MAX_PIXELS:
+        _reject(f"Image too large. At most {UPLOAD_MAX_PIXELS} pixels are supported.", 'pixels')
+    if header.mode not in ('RGB', 'RGBA'):
+        _reject("Invalid image mode. Only RGB images are supported.", 'mode')
+
+
+class IngestStream:
+    """Writable upload buffer that hashes and checks the bytes as they arrive.
+
+    Reads, seeks and saves (``FileStorage.save``) go to the underlying spool.
+    """
+
+    def __init__(self, validate: bool = True):
+        self._file = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_MAX_MEMORY, mode='w+b')
+        self._sha256 = hashlib.sha256()
+        self._head = bytearray()
+        self.validate = validate
+        self.header: Optional[ImageHeader] = None
+        self.size = 0
+
+    def write(self, data) -> int:
+        if self.validate and self.header is None:
+            self._inspect(data)
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def _inspect(self, data) -> None:
+        self._head += data[:UPLOAD_HEADER_MAX_BYTES - len(self._head)]
+        try:
+            header = parse_image_header(bytes(self._head))
+            if header is None:
+                if len(self._head) >= UPLOAD_HEADER_MAX_BYTES:
+                    _reject(f"Invalid image file: no image header in the first "
+                            f"{UPLOAD_HEADER_MAX_BYTES // 1024} KB", 'corrupt')
+                return
+            check_header(header)
+        except UploadRejected:
+            self._file.close()
+            raise
+        self.header = header
+        self._head = bytearray()
+
+    def finish(self) -> ImageHeader:
+        """The header of a fully received upload; rejects files that end before it"""
+        if self.header is None:
+            _reject("Invalid image file: truncated or unrecognised image", 'corrupt')
+        return self.header
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class IngestRequest(Request):
+    """Flask request class that receives file uploads through IngestStream"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if filename and not filename.lower().endswith(ALLOWED_EXTENSIONS):
+            _reject('Invalid file type. Only PNG and JPEG files are allowed', 'extension')
+        # An empty file input is reported as "No selected file" by the view
+        return IngestStream(validate=bool(filename))
@@ -0,0 +1,403 @@
+"""
+Durable local job queue backed by SQLite.
+
+Jobs survive restarts and are shared by every process on the host that opens
+the same database file. Each job has a kind, a JSON payload and a priority
+(lower runs first). Workers claim a job with a single UPDATE ... RETURNING,
+which also makes it invisible to other workers for a visibility timeout; a
+worker that dies mid-job simply lets the timeout lapse and the job is picked
+up again. Failed jobs are retried with exponential backoff and moved to the
+dead-letter state after max_attempts.
+
+    job_queue.enqueue('thumbnail', {'image_path': path}, priority=PRIORITY_LOW)
+
+    @job_queue.handler('thumbnail')
+    def make_thumbnail(payload, job): ...
+
+    workers = WorkerPool(job_queue, app, threads=2)
+    workers.start()
+
+Nothing runs at import time; workers are started explicitly by the process
+that should execute jobs (see jobs_cli.py for a standalone worker).
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import sqlite3
+import logging
+import threading
+from typing import Callable, Dict, List, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_PATH = os.getenv(
+    'JOB_QUEUE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'jobs.db')
+)
+JOB_VISIBILITY_TIMEOUT = float(os.getenv('JOB_VISIBILITY_TIMEOUT', '300'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '5'))
+JOB_BACKOFF_BASE = float(os.getenv('JOB_BACKOFF_BASE', '5'))
+JOB_BACKOFF_MAX = float(os.getenv('JOB_BACKOFF_MAX', '3600'))
+JOB_POLL_INTERVAL = float(os.getenv('JOB_POLL_INTERVAL', '1'))
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+
+QUEUED, RUNNING, DONE, DEAD = 'queued', 'running', 'done', 'dead'
+STATUSES = (QUEUED, RUNNING, DONE, DEAD)
+
+JOB_QUEUE_DEPTH = Gauge('job_queue_depth', 'Jobs by kind and status', ['kind', 'status'])
+JOBS_PROCESSED = Counter('jobs_processed_total', 'Job executions by outcome', ['kind', 'outcome'])
+JOB_RUN_LATENCY = Histogram(
+    'job_run_seconds', 'Time spent executing a job', ['kind'],
+    buckets=[0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0]
+)
+JOB_WAIT_LATENCY = Histogram(
+    'job_wait_seconds', 'Time from enqueue (or retry) until a worker starts the job', ['kind'],
+    buckets=[0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0]
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 5,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    locked_until REAL,
+    worker TEXT,
+    dedupe_key TEXT UNIQUE,
+    last_error TEXT,
+    result TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_ready ON jobs (status, priority, run_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_lease ON jobs (status, locked_until);
+"""
+
+# Oldest, most urgent job that is queued and due, or running with a lapsed lease
+_CLAIM = """
+UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = :worker,
+                locked_until = :now + :timeout, started_at = :now
+WHERE id = (
+    SELECT id FROM jobs
+    WHERE ((status = 'queued' AND run_at <= :now) OR (status = 'running' AND locked_until <= :now))
+      {kind_filter}
+    ORDER BY priority, run_at, id
+    LIMIT 1
+)
+RETURNING id, kind, payload, priority, attempts, max_attempts, run_at, created_at
+"""
+
+
+class JobError(Exception):
+    """Raise from a handler to fail a job without a traceback in the logs"""
+
+
+class Job:
+    __slots__ = ('id', 'kind', 'payload', 'priority', 'attempts', 'max_attempts',
+                 'run_at', 'created_at', 'queue', 'worker')
+
+    def __init__(self, queue: 'JobQueue', worker: str, row: tuple):
+        (self.id, self.kind, payload, self.priority, self.attempts,
+         self.max_attempts, self.run_at, self.created_at) = row
+        self.payload = json.loads(payload)
+        self.queue = queue
+        self.worker = worker
+
+    def heartbeat(self, timeout: float = JOB_VISIBILITY_TIMEOUT) -> bool:
+        """Extend the lease of a long-running job; False if it was lost to another worker"""
+        return self.queue.extend_lease(self.id, self.worker, timeout)
+
+
+class JobQueue:
+    def __init__(self, path: str = JOB_QUEUE_PATH,
+                 visibility_timeout: float = JOB_VISIBILITY_TIMEOUT,
+                 max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+        self.handlers: Dict[str, Callable[[dict, Job], object]] = {}
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    # ----- connections -----
+    def _connect(self) -> sqlite3.Connection:
+        """One autocommit connection per thread, reopened in forked children"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=30000')
+        with self._init_lock:
+            if not self._initialized:
+                conn.executescript(_SCHEMA)
+                self._initialized = True
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    # ----- producers -----
+    def handler(self, kind: str):
+        """Register the function that executes jobs of this kind"""
+        def decorator(func):
+            self.handlers[kind] = func
+            return func
+        return decorator
+
+    def enqueue(self, kind: str, payload: dict, priority: int = PRIORITY_NORMAL,
+                delay: float = 0, max_attempts: Optional[int] = None,
+                dedupe_key: Optional[str] = None) -> Optional[int]:
+        """Add a job and return its id.
+
+        With dedupe_key, a job whose key already exists is not added again and
+        None is returned (e.g. one retention run per day across all workers).
+        """
+        now = time.time()
+        cursor = self._connect().execute(
+            "INSERT INTO jobs (kind, payload, priority, max_attempts, run_at, dedupe_key, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(dedupe_key) DO NOTHING",
+            (kind, json.dumps(payload), priority, max_attempts or self.max_attempts,
+             now + delay, dedupe_key, now)
+        )
+        if not cursor.rowcount:
+            return None
+        self._wakeup.set()
+        return cursor.lastrowid
+
+    # ----- consumers -----
+    def claim(self, worker: str, kinds: Optional[List[str]] = None) -> Optional[Job]:
+        now = time.time()
+        kind_filter, params = '', {'worker': worker, 'now': now, 'timeout': self.visibility_timeout}
+        if kinds:
+            placeholders = ', '.join(f':kind{i}' for i in range(len(kinds)))
+            kind_filter = f"AND kind IN ({placeholders})"
+            params.update({f'kind{i}': kind for i, kind in enumerate(kinds)})
+
+        conn = self._connect()
+        while True:
+            row = conn.execute(_CLAIM.format(kind_filter=kind_filter), params).fetchone()
+            if row is None:
+                return None
+            job = Job(self, worker, row)
+            if job.attempts <= job.max_attempts:
+                return job
+            # Lease lapsed on the final attempt (the worker died): dead-letter it
+            self._finish(job, DEAD, error='Visibility timeout expired on final attempt')
+            JOBS_PROCESSED.labels(kind=job.kind, outcome='dead').inc()
+
+    def extend_lease(self, job_id: int, worker: str, timeout: float) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET locked_until = ? WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + timeout, job_id, worker)
+        )
+        return cursor.rowcount == 1
+
+    def _finish(self, job: Job, status: str, result=None, error: Optional[str] = None) -> bool:
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, last_error = ?, finished_at = ?, locked_until = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (status, json.dumps(result) if result is not None else None, error,
+             time.time(), job.id, job.worker)
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job: Job, result=None) -> bool:
+        return self._finish(job, DONE, result=result)
+
+    def fail(self, job: Job, error: str) -> str:
+        """Schedule a retry with exponential backoff, or dead-letter the job"""
+        if job.attempts >= job.max_attempts:
+            self._finish(job, DEAD, error=error)
+            return DEAD
+
+        backoff = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (job.attempts - 1))
+        backoff *= 0.5 + random.random()  # jitter
+        self._connect().execute(
+            "UPDATE jobs SET status = 'queued', run_at = ?, last_error = ?, locked_until = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (time.time() + backoff, error, job.id, job.worker)
+        )
+        return QUEUED
+
+    def execute(self, job: Job) -> str:
+        """Run a claimed job's handler and record the outcome"""
+        handler = self.handlers.get(job.kind)
+        JOB_WAIT_LATENCY.labels(kind=job.kind).observe(max(0.0, time.time() - job.run_at))
+
+        start = time.perf_counter()
+        try:
+            if handler is None:
+                raise JobError(f"No handler registered for job kind '{job.kind}'")
+            result = handler(job.payload, job)
+        except Exception as e:
+            if isinstance(e, JobError):
+                logger.warning(f"Job {job.id} ({job.kind}) failed: {e}")
+            else:
+                logger.error(f"Job {job.id} ({job.kind}) raised: {e}", exc_info=True)
+            outcome = self.fail(job, f"{type(e).__name__}: {e}")
+            outcome = 'dead' if outcome == DEAD else 'retry'
+        else:
+            self.complete(job, result)
+            outcome = 'success'
+        finally:
+            JOB_RUN_LATENCY.labels(kind=job.kind).observe(time.perf_counter() - start)
+
+        JOBS_PROCESSED.labels(kind=job.kind, outcome=outcome).inc()
+        return outcome
+
+    def wait_for_work(self, timeout: float) -> None:
+        """Sleep until a job is enqueued in this process or the timeout passes"""
+        if self._wakeup.wait(timeout):
+            self._wakeup.clear()
+
+    # ----- inspection and maintenance -----
+    def get(self, job_id: int) -> Optional[dict]:
+        conn = self._connect()
+        cursor = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        job = dict(zip([c[0] for c in cursor.description], row))
+        job['payload'] = json.loads(job['payload'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def list(self, status: Optional[str] = None, kind: Optional[str] = None, limit: int = 50) -> List[dict]:
+        clauses, params = [], []
+        if status:
+            clauses.append("status = ?")
+            params.append(status)
+        if kind:
+            clauses.append("kind = ?")
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        cursor = self._connect().execute(
+            f"SELECT id, kind, status, priority, attempts, max_attempts, run_at, created_at, "
+            f"finished_at, last_error FROM jobs {where} ORDER BY id DESC LIMIT ?", (*params, limit)
+        )
+        columns = [c[0] for c in cursor.description]
+        return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Job counts by kind and status; also refreshes the depth gauge"""
+        rows = self._connect().execute(
+            "SELECT kind, status, COUNT(*) FROM jobs GROUP BY kind, status"
+        ).fetchall()
+        counts: Dict[str, Dict[str, int]] = {}
+        for kind, status, count in rows:
+            counts.setdefault(kind, {s: 0 for s in STATUSES})[status] = count
+        for kind, by_status in counts.items():
+            for status, count in by_status.items():
+                JOB_QUEUE_DEPTH.labels(kind=kind, status=status).set(count)
+        return counts
+
+    def retry(self, job_id: Optional[int] = None, kind: Optional[str] = None) -> int:
+        """Requeue one job, or every dead job (optionally of one kind)"""
+        if job_id is not None:
+            sql, params = "WHERE id = ? AND status IN ('dead', 'done')", (job_id,)
+        elif kind:
+            sql, params = "WHERE status = 'dead' AND kind = ?", (kind,)
+        else:
+            sql, params = "WHERE status = 'dead'", ()
+        cursor = self._connect().execute(
+            f"UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, last_error = NULL, "
+            f"finished_at = NULL {sql}", (time.time(), *params)
+        )
+        if cursor.rowcount:
+            self._wakeup.set()
+        return cursor.rowcount
+
+    def purge(self, status: str = DONE, older_than_seconds: float = 0) -> int:
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE status = ? AND COALESCE(finished_at, created_at) <= ?",
+            (status, time.time() - older_than_seconds)
+        )
+        return cursor.rowcount
+
+
+class WorkerPool:
+    """Threads that claim and execute jobs inside the Flask app context"""
+
+    def __init__(self, queue: JobQueue, app=None, threads: int = 1,
+                 kinds: Optional[List[str]] = None, poll_interval: float = JOB_POLL_INTERVAL):
+        self.queue = queue
+        self.app = app
+        self.threads = threads
+        self.kinds = kinds
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def _run_one(self, worker: str) -> bool:
+        job = self.queue.claim(worker, self.kinds)
+        if job is None:
+            return False
+        if self.app is not None:
+            with self.app.app_context():
+                self.queue.execute(job)
+        else:
+            self.queue.execute(job)
+        return True
+
+    def _loop(self, index: int) -> None:
+        worker = f"{self._name}:{index}"
+        last_stats = 0.0
+        while not self._stop.is_set():
+            try:
+                ran = self._run_one(worker)
+                if index == 0 and time.monotonic() - last_stats > 15:
+                    self.queue.stats()
+                    last_stats = time.monotonic()
+            except Exception as e:
+                logger.error(f"Job worker {worker} error: {e}", exc_info=True)
+                ran = False
+            if not ran:
+                self.queue.wait_for_work(self.poll_interval)
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for index in range(self.threads):
+            thread = threading.Thread(target=self._loop, args=(index,),
+                                      name=f'job-worker-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self.threads} job worker thread(s) on {self.queue.path}")
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        self.queue._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def drain(self) -> int:
+        """Run jobs on the calling thread until none are due; returns how many ran"""
+        ran = 0
+        worker = f"{self._name}:drain"
+        while self._run_one(worker):
+            ran += 1
+        return ran
+
+
+job_queue = JobQueue()
@@ -0,0 +1,609 @@
+"""
+Shared gateway for outbound LLM completions.
+
+All LLM traffic from the analyzer and the chat service goes through a single
+pooled backend (Groq by default, or any OpenAI-compatible server set via
+LLM_BACKEND_URL). A bounded semaphore caps concurrent upstream calls, every call
+carries a deadline, and a circuit breaker fails fast while the upstream error
+rate is high so a slow or failing API cannot pin every web worker thread.
+
+The ASGI serving mode (asgi.py) uses acomplete(), which awaits the upstream
+response on the event loop through an async pooled client instead of holding
+a thread; it has its own, larger concurrency limit.
+"""
+
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+import groq
+from prometheus_client import Counter, Gauge, Histogram
+
+from api.singleflight import AsyncSingleFlight, SingleFlight
+
+logger = logging.getLogger(__name__)
+
+# ===================== CONFIGURATION =====================
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '8'))
+LLM_ASYNC_MAX_CONCURRENCY = int(os.getenv('LLM_ASYNC_MAX_CONCURRENCY', '256'))
+LLM_ACQUIRE_TIMEOUT = float(os.getenv('LLM_ACQUIRE_TIMEOUT', '2.0'))
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '20.0'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '5.0'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '0'))
+LLM_POOL_KEEPALIVE = int(os.getenv('LLM_POOL_KEEPALIVE', str(LLM_MAX_CONCURRENCY)))
+LLM_PROBE_INTERVAL = float(os.getenv('LLM_PROBE_INTERVAL', '300'))
+LLM_PROBE_TIMEOUT = float(os.getenv('LLM_PROBE_TIMEOUT', '5.0'))
+
+BREAKER_WINDOW = int(os.getenv('LLM_BREAKER_WINDOW', '20'))
+BREAKER_MIN_CALLS = int(os.getenv('LLM_BREAKER_MIN_CALLS', '5'))
+BREAKER_ERROR_RATE = float(os.getenv('LLM_BREAKER_ERROR_RATE', '0.5'))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv('LLM_BREAKER_COOLDOWN', '30.0'))
+
+# ===================== METRICS =====================
+LLM_IN_FLIGHT = Gauge(
+    'llm_in_flight_requests', 'Outbound LLM calls currently in flight'
+)
+LLM_LATENCY = Histogram(
+    'llm_request_latency_seconds', 'Latency of outbound LLM calls',
+    ['outcome'], buckets=[0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0]
+)
+LLM_REJECTED = Counter(
+    'llm_rejected_requests_total', 'LLM calls refused without reaching upstream',
+    ['reason']
+)
+LLM_BREAKER_STATE = Gauge(
+    'llm_circuit_breaker_state', 'Circuit breaker state (0=closed, 1=half-open, 2=open)'
+)
+
+
+class LLMUnavailableError(Exception):
+    """Raised when the gateway refuses a call (breaker open or concurrency limit reached)"""
+
+
+class CircuitBreaker:
+    """Error-rate circuit breaker over a sliding window of recent call outcomes"""
+    CLOSED = 'closed'
+    HALF_OPEN = 'half_open'
+    OPEN = 'open'
+
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, window: int = BREAKER_WINDOW, min_calls: int = BREAKER_MIN_CALLS,
+                 error_rate: float = BREAKER_ERROR_RATE, cooldown: float = BREAKER_COOLDOWN_SECONDS):
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.cooldown = cooldown
+        self._outcomes = deque(maxlen=window)
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        LLM_BREAKER_STATE.set(0)
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def _set_state(self, state: str) -> None:
+        if state != self._state:
+            logger.warning(f"LLM circuit breaker {self._state} -> {state}")
+        self._state = state
+        LLM_BREAKER_STATE.set(self._STATE_VALUES[state])
+
+    def allow(self) -> bool:
+        """Return True if a call may proceed; in half-open state only one probe call is let through"""
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self._set_state(self.HALF_OPEN)
+
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    return False
+                self._probe_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._outcomes.clear()
+                self._probe_in_flight = False
+                self._set_state(self.CLOSED)
+            self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probe_in_flight = False
+                self._trip()
+                return
+
+            self._outcomes.append(False)
+            failures = self._outcomes.count(False)
+            if (len(self._outcomes) >= self.min_calls and
+                    failures / len(self._outcomes) >= self.error_rate):
+                self._trip()
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot when the call never reached upstream"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _trip(self) -> None:
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._set_state(self.OPEN)
+
+
+def _is_upstream_failure(error: Exception) -> bool:
+    """Errors that indicate upstream trouble, as opposed to a bad request"""
+    if isinstance(error, (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError,
+                          httpx.TransportError)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code >= 500
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def _pooled_http_client(deadline: float, **kwargs) -> httpx.Client:
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONCURRENCY,
+            max_keepalive_connections=LLM_POOL_KEEPALIVE,
+            keepalive_expiry=60.0
+        ),
+        timeout=httpx.Timeout(deadline, connect=LLM_CONNECT_TIMEOUT),
+        **kwargs
+    )
+
+
+def _pooled_async_http_client(deadline: float, **kwargs) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_ASYNC_MAX_CONCURRENCY,
+            max_keepalive_connections=LLM_POOL_KEEPALIVE,
+            keepalive_expiry=60.0
+        ),
+        timeout=httpx.Timeout(deadline, connect=LLM_CONNECT_TIMEOUT),
+        **kwargs
+    )
+
+
+# ===================== BACKENDS =====================
+class CompletionBackend:
+    """Interface for the upstream that actually serves completions"""
+    name = 'base'
+
+    def is_configured(self) -> bool:
+        return True
+
+    def complete(self, messages: List[Dict[str, str]], model: str, temperature: float,
+                 max_tokens: int, timeout: float) -> str:
+        raise NotImplementedError
+
+    def ping(self, timeout: float) -> None:
+        """Cheap reachability check; raises on failure"""
+        raise NotImplementedError
+
+    async def acomplete(self, messages: List[Dict[str, str]], model: str, temperature: float,
+                        max_tokens: int, timeout: float) -> str:
+        """Async variant of complete(); backends without an async client use a thread"""
+        return await asyncio.to_thread(self.complete, messages, model, temperature, max_tokens, timeout)
+
+    def after_fork(self) -> None:
+        """Drop pooled connections inherited from the parent process"""
+
+
+class GroqBackend(CompletionBackend):
+    """Groq cloud API via the official SDK"""
+    name = 'groq'
+
+    def __init__(self, api_key: Optional[str] = None, deadline: float = LLM_DEADLINE_SECONDS):
+        self.api_key = api_key
+        self.deadline = deadline
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_client = None
+        self._async_loop = None
+
+    def is_configured(self) -> bool:
+        return bool(self.api_key)
+
+    @property
+    def client(self) -> groq.Groq:
+        """Pooled Groq client, built on first use"""
+        if self._client is None:
+            if not self.api_key:
+                raise ValueError("GROQ_API_KEY not found in environment variables")
+            with self._client_lock:
+                if self._client is None:
+                    self._client = groq.Groq(
+                        api_key=self.api_key,
+                        http_client=_pooled_http_client(self.deadline),
+                        max_retries=LLM_MAX_RETRIES
+                    )
+        return self._client
+
+    @property
+    def async_client(self) -> groq.AsyncGroq:
+        """Pooled async Groq client bound to the running event loop"""
+        loop = asyncio.get_running_loop()
+        if self._async_client is None or self._async_loop is not loop:
+            if not self.api_key:
+                raise ValueError("GROQ_API_KEY not found in environment variables")
+            self._async_client = groq.AsyncGroq(
+                api_key=self.api_key,
+                http_client=_pooled_async_http_client(self.deadline),
+                max_retries=LLM_MAX_RETRIES
+            )
+            self._async_loop = loop
+        return self._async_client
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        completion = self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        if not completion or not completion.choices:
+            raise ValueError("No response received from Groq API")
+        return completion.choices[0].message.content.strip()
+
+    async def acomplete(self, messages, model, temperature, max_tokens, timeout):
+        completion = await self.async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=timeout
+        )
+        if not completion or not completion.choices:
+            raise ValueError("No response received from Groq API")
+        return completion.choices[0].message.content.strip()
+
+    def ping(self, timeout):
+        # Listing models costs no tokens, unlike a one-token completion
+        self.client.models.list(timeout=timeout)
+
+    def after_fork(self):
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_client = None
+        self._async_loop = None
+
+
+class HTTPCompletionBackend(CompletionBackend):
+    """Any OpenAI-compatible /chat/completions server, e.g. a local stand-in for tests"""
+    name = 'http'
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None,
+                 deadline: float = LLM_DEADLINE_SECONDS):
+        self.base_url = base_url.rstrip('/')
+        self.deadline = deadline
+        self._headers = {'Authorization': f'Bearer {api_key}'} if api_key else {}
+        self._http = _pooled_http_client(deadline, base_url=self.base_url, headers=self._headers)
+        self._async_http = None
+        self._async_loop = None
+
+    def _completion_body(self, messages, model, temperature, max_tokens) -> dict:
+        return {
+            'model': model,
+            'messages': messages,
+            'temperature': temperature,
+            'max_tokens': max_tokens
+        }
+
+    def _content(self, response: httpx.Response) -> str:
+        response.raise_for_status()
+        choices = response.json().get('choices')
+        if not choices:
+            raise ValueError(f"No response received from {self.base_url}")
+        return choices[0]['message']['content'].strip()
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        response = self._http.post('/chat/completions', timeout=timeout,
+                                   json=self._completion_body(messages, model, temperature, max_tokens))
+        return self._content(response)
+
+    async def acomplete(self, messages, model, temperature, max_tokens, timeout):
+        loop = asyncio.get_running_loop()
+        if self._async_http is None or self._async_loop is not loop:
+            self._async_http = _pooled_async_http_client(self.deadline, base_url=self.base_url,
+                                                         headers=self._headers)
+            self._async_loop = loop
+        response = await self._async_http.post('/chat/completions', timeout=timeout,
+                                               json=self._completion_body(messages, model, temperature, max_tokens))
+        return self._content(response)
+
+    def ping(self, timeout):
+        response = self._http.get('/models', timeout=timeout)
+        if response.status_code >= 500:
+            response.raise_for_status()
+
+    def after_fork(self):
+        self._http = _pooled_http_client(self.deadline, base_url=self.base_url, headers=self._headers)
+        self._async_http = None
+        self._async_loop = None
+
+
+def create_backend() -> CompletionBackend:
+    """Build the backend selected by the environment (LLM_BACKEND_URL overrides Groq)"""
+    backend_url = os.getenv('LLM_BACKEND_URL')
+    if backend_url:
+        logger.info(f"Using OpenAI-compatible LLM backend at {backend_url}")
+        return HTTPCompletionBackend(backend_url, api_key=os.getenv('LLM_BACKEND_API_KEY'))
+    return GroqBackend(api_key=os.getenv('GROQ_API_KEY'))
+
+
+# ===================== CONNECTIVITY PROBE =====================
+class ConnectivityProbe:
+    """Background reachability check whose latest result feeds the health endpoints"""
+
+    def __init__(self, gateway: 'LLMGateway', interval: float = LLM_PROBE_INTERVAL,
+                 timeout: float = LLM_PROBE_TIMEOUT):
+        self.gateway = gateway
+        self.interval = interval
+        self.timeout = timeout
+        self._status = {
+            'status': 'unknown',
+            'backend': gateway.backend.name,
+            'checked_at': None,
+            'latency_ms': None,
+            'error': None
+        }
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        """Start the probe thread; safe to call repeatedly and after a fork"""
+        with self._lock:
+            if self._thread and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='llm-connectivity-probe', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self.check()
+            self._stop.wait(self.interval)
+
+    def check(self) -> Dict[str, object]:
+        backend = self.gateway.backend
+        status = {'backend': backend.name, 'checked_at': datetime.utcnow().isoformat(),
+                  'latency_ms': None, 'error': None}
+
+        if not backend.is_configured():
+            status['status'] = 'unconfigured'
+        else:
+            start = time.perf_counter()
+            try:
+                backend.ping(self.timeout)
+                status['status'] = 'reachable'
+            except Exception as e:
+                status['status'] = 'unreachable'
+                status['error'] = str(e)
+                logger.warning(f"LLM connectivity probe failed: {str(e)}")
+            status['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+
+        with self._lock:
+            self._status = status
+        return status
+
+    def status(self) -> Dict[str, object]:
+        self.start()
+        with self._lock:
+            return dict(self._status)
+
+
+# ===================== GATEWAY =====================
+def prompt_key(model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> str:
+    """Key identifying a completion request after whitespace and case normalization"""
+    normalized = [
+        (m['role'], re.sub(r'\s+', ' ', m['content']).strip().lower())
+        for m in messages
+    ]
+    payload = json.dumps([model, normalized, temperature, max_tokens], separators=(',', ':'))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMGateway:
+    def __init__(self, backend: Optional[CompletionBackend] = None,
+                 max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 deadline: float = LLM_DEADLINE_SECONDS,
+                 async_max_concurrency: int = LLM_ASYNC_MAX_CONCURRENCY):
+        self.backend = backend or create_backend()
+        self.deadline = deadline
+        self.breaker = CircuitBreaker()
+        self.probe = ConnectivityProbe(self)
+        self.max_concurrency = max_concurrency
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._flight = SingleFlight('llm')
+        self._in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        # Async path: one event loop per process, so plain asyncio primitives suffice
+        self.async_max_concurrency = async_max_concurrency
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        self._async_flight = AsyncSingleFlight('llm_async')
+        self._async_in_flight = 0
+
+    def set_backend(self, backend: CompletionBackend) -> None:
+        """Swap the completion backend, e.g. to a local stand-in server"""
+        self.backend = backend
+        self.probe.check()
+
+    def start_probe(self) -> None:
+        self.probe.start()
+
+    def connectivity(self) -> Dict[str, object]:
+        return self.probe.status()
+
+    def complete(self, messages: List[Dict[str, str]], model: str,
+                 temperature: float = 0.7, max_tokens: int = 1000,
+                 deadline: Optional[float] = None,
+                 coalesce_key: Optional[str] = None) -> str:
+        """Run a chat completion and return the stripped message content.
+
+        Concurrent calls with the same normalized prompt (or the same explicit
+        coalesce_key) share a single upstream request. Raises
+        LLMUnavailableError if the call is refused locally; errors from the
+        backend are re-raised unchanged.
+        """
+        key = coalesce_key or prompt_key(model, messages, temperature, max_tokens)
+        return self._flight.do(
+            key, lambda: self._complete(messages, model, temperature, max_tokens, deadline)
+        )
+
+    def _complete(self, messages, model, temperature, max_tokens, deadline) -> str:
+        if not self.breaker.allow():
+            LLM_REJECTED.labels(reason='circuit_open').inc()
+            raise LLMUnavailableError("LLM service temporarily unavailable (circuit open)")
+
+        if not self._semaphore.acquire(timeout=LLM_ACQUIRE_TIMEOUT):
+            self.breaker.release_probe()
+            LLM_REJECTED.labels(reason='concurrency_limit').inc()
+            raise LLMUnavailableError("LLM service busy (concurrency limit reached)")
+
+        LLM_IN_FLIGHT.inc()
+        with self._in_flight_lock:
+            self._in_flight += 1
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            content = self.backend.complete(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=deadline or self.deadline
+            )
+            self.breaker.record_success()
+            outcome = 'success'
+            return content
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+            raise
+        finally:
+            LLM_IN_FLIGHT.dec()
+            with self._in_flight_lock:
+                self._in_flight -= 1
+            LLM_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - start)
+            self._semaphore.release()
+
+    async def acomplete(self, messages: List[Dict[str, str]], model: str,
+                        temperature: float = 0.7, max_tokens: int = 1000,
+                        deadline: Optional[float] = None,
+                        coalesce_key: Optional[str] = None) -> str:
+        """Async variant of complete() for the ASGI serving mode; same semantics"""
+        key = coalesce_key or prompt_key(model, messages, temperature, max_tokens)
+        return await self._async_flight.do(
+            key, lambda: self._acomplete(messages, model, temperature, max_tokens, deadline)
+        )
+
+    async def _acomplete(self, messages, model, temperature, max_tokens, deadline) -> str:
+        if not self.breaker.allow():
+            LLM_REJECTED.labels(reason='circuit_open').inc()
+            raise LLMUnavailableError("LLM service temporarily unavailable (circuit open)")
+
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.async_max_concurrency)
+        try:
+            await asyncio.wait_for(self._async_semaphore.acquire(), LLM_ACQUIRE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.breaker.release_probe()
+            LLM_REJECTED.labels(reason='concurrency_limit').inc()
+            raise LLMUnavailableError("LLM service busy (concurrency limit reached)")
+
+        LLM_IN_FLIGHT.inc()
+        self._async_in_flight += 1
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            content = await self.backend.acomplete(
+                messages=messages,
+                model=model,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=deadline or self.deadline
+            )
+            self.breaker.record_success()
+            outcome = 'success'
+            return content
+        except Exception as e:
+            if _is_upstream_failure(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.release_probe()
+            raise
+        finally:
+            LLM_IN_FLIGHT.dec()
+            self._async_in_flight -= 1
+            LLM_LATENCY.labels(outcome=outcome).observe(time.perf_counter() - start)
+            self._async_semaphore.release()
+
+    def load(self) -> float:
+        """Fraction of the concurrency limit currently in use (the busier of the sync and async paths)"""
+        with self._in_flight_lock:
+            sync_load = self._in_flight / self.max_concurrency
+        return max(sync_load, self._async_in_flight / self.async_max_concurrency)
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            'backend': self.backend.name,
+            'load': self.load(),
+            'breaker_state': self.breaker.state,
+            'deadline_seconds': self.deadline,
+            'connectivity': self.connectivity()
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway() -> LLMGateway:
+    """Return the process-wide LLM gateway"""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = LLMGateway()
+    return _gateway
+
+
+def _after_fork_in_child() -> None:
+    # A keep-alive socket shared by parent and child would interleave their
+    # requests on one connection; each process opens its own pool instead.
+    global _gateway_lock
+    _gateway_lock = threading.Lock()
+    if _gateway is not None:
+        _gateway.backend.after_fork()
+        _gateway._async_semaphore = None
+        _gateway._async_flight = AsyncSingleFlight('llm_async')
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,170 @@
+"""
+Asynchronous structured logging.
+
+Request threads only put records on a bounded in-memory queue; a
+QueueListener thread formats them as JSON and does the file and console I/O.
+If the queue is full the record is dropped and counted rather than blocking
+the request. Debug records are sampled, and request bodies are only logged
+when explicitly enabled for local debugging.
+
+Configuration (environment):
+    LOG_LEVEL               root level (INFO)
+    LOG_FORMAT              'json' or 'text' for the console (json)
+    LOG_DIR                 directory for app.log (logs)
+    LOG_QUEUE_SIZE          max queued records before dropping (10000)
+    LOG_DEBUG_SAMPLE_RATE   fraction of DEBUG records kept (0.1)
+    LOG_REQUEST_BODIES      'true' to log request bodies; only honoured at DEBUG
+"""
+
+import os
+import copy
+import queue
+import atexit
+import random
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Optional
+
+from prometheus_client import Counter
+from pythonjsonlogger import jsonlogger
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'json').lower()
+LOG_DIR = os.getenv('LOG_DIR', 'logs')
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))
+LOG_DEBUG_SAMPLE_RATE = float(os.getenv('LOG_DEBUG_SAMPLE_RATE', '0.1'))
+LOG_REQUEST_BODIES = (
+    os.getenv('LOG_REQUEST_BODIES', 'false').lower() == 'true' and LOG_LEVEL == 'DEBUG'
+)
+
+JSON_FIELDS = '%(asctime)s %(levelname)s %(name)s %(message)s %(module)s %(lineno)d %(process)d %(threadName)s'
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(name)s - %(message)s'
+
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Log records dropped before reaching a handler', ['reason']
+)
+
+
+class DebugSampler(logging.Filter):
+    """Keep only a fraction of records below INFO"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.INFO or random.random() < self.rate:
+            return True
+        LOG_RECORDS_DROPPED.labels(reason='sampled').inc()
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that never blocks the caller and does minimal work on its thread"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self._exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Merge args and render any traceback now (frames are not safe to keep
+        # around), but leave the real formatting to the listener thread
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self._exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        _ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels(reason='queue_full').inc()
+
+
+def _json_formatter() -> logging.Formatter:
+    return jsonlogger.JsonFormatter(JSON_FIELDS)
+
+
+def _build_handlers():
+    os.makedirs(LOG_DIR, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        os.path.join(LOG_DIR, 'app.log'), maxBytes=10485760, backupCount=10
+    )
+    file_handler.setFormatter(_json_formatter())
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(
+        _json_formatter() if LOG_FORMAT == 'json' else logging.Formatter(TEXT_FORMAT)
+    )
+    return file_handler, console_handler
+
+
+_log_queue: Optional[queue.Queue] = None
+_queue_handler: Optional[NonBlockingQueueHandler] = None
+_listener: Optional[QueueListener] = None
+_listener_pid: Optional[int] = None
+_lock = threading.Lock()
+
+
+def _ensure_listener() -> None:
+    """Start the listener, or restart it in a child after fork (threads do not survive fork)"""
+    global _listener, _listener_pid
+    if _listener_pid == os.getpid():
+        return
+    with _lock:
+        if _listener_pid == os.getpid():
+            return
+        _listener = QueueListener(_log_queue, *_build_handlers(), respect_handler_level=True)
+        _listener.start()
+        _listener_pid = os.getpid()
+
+
+def stop_logging() -> None:
+    """Flush queued records and stop the listener thread"""
+    global _listener_pid
+    with _lock:
+        if _listener is not None and _listener_pid == os.getpid():
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener_pid = None
+
+
+def _after_fork_in_child() -> None:
+    """Give a forked child its own queue: the parent's listener thread may have
+    held the queue's mutex at the moment of the fork, and never releases it here."""
+    global _log_queue, _lock, _listener, _listener_pid
+    _lock = threading.Lock()
+    _listener, _listener_pid = None, None
+    if _queue_handler is not None:
+        _log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        _queue_handler.queue = _log_queue
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def configure_logging() -> None:
+    """Route all logging through the queue. Safe to call more than once."""
+    global _log_queue, _queue_handler
+    root = logging.getLogger()
+    if _log_queue is not None:
+        return
+
+    _log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    handler = _queue_handler = NonBlockingQueueHandler(_log_queue)
+    handler.addFilter(DebugSampler(LOG_DEBUG_SAMPLE_RATE))
+
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    _ensure_listener()
+    atexit.register(stop_logging)
@@ -0,0 +1,288 @@
+"""
+Versioned model registry and zero-downtime hot swap.
+
+    models/registry/
+        manifest.json     {"active": "v2", "history": ["v1", "v2"], "versions": {"v2": {...}, ...}}
+        v1.pth
+        v2.pth
+
+``model_cli.py`` registers checkpoints (verifying that they load) and changes
+the active version. Every serving process polls the manifest every
+MODEL_REGISTRY_POLL_SECONDS, or immediately after POST /admin/models/activate
+on that process. When the active version differs from the one it serves, the
+process loads and warms up the new checkpoint on the watcher thread, then
+replaces its model reference in a single assignment. Requests already running
+finish on the model they started with, so no traffic is dropped and the first
+requests on the new version do not pay for a cold start. Before loading, the
+checkpoint is hashed and compared with the manifest's sha256; a file that was
+replaced or corrupted after registration is refused and the old version keeps
+serving.
+
+Without a manifest the analyzer serves the checkpoint at MODEL_PATH
+(models/best_model.pth), versioned by its content hash.
+
+    MODEL_REGISTRY_DIR            models/registry
+    MODEL_PATH                    fallback checkpoint when no version is active
+    MODEL_REGISTRY_POLL_SECONDS   manifest polling interval (30; 0 disables polling)
+"""
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'models')
+MODEL_REGISTRY_DIR = os.getenv('MODEL_REGISTRY_DIR', os.path.join(MODELS_DIR, 'registry'))
+MODEL_PATH = os.getenv('MODEL_PATH', os.path.join(MODELS_DIR, 'best_model.pth'))
+MODEL_REGISTRY_POLL_SECONDS = float(os.getenv('MODEL_REGISTRY_POLL_SECONDS', '30'))
+
+MODEL_SWAPS = Counter('model_swaps_total', 'Model hot-swap attempts by outcome', ['outcome'])
+MODEL_LOAD_SECONDS = Histogram(
+    'model_load_seconds', 'Time to load and warm up a model version before switching to it',
+    buckets=[0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0]
+)
+MODEL_ACTIVE = Gauge('model_active_info', 'Model version served by this process (1 = active)', ['version'])
+
+
+class ModelVersion(NamedTuple):
+    version: str
+    path: str
+    sha256: str
+    registered_at: Optional[str] = None
+    notes: str = ''
+
+
+class ChecksumMismatch(ValueError):
+    """A registered checkpoint's contents no longer match the manifest"""
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def verify_checksum(entry: ModelVersion) -> None:
+    """Raise ChecksumMismatch unless the checkpoint file hashes to entry.sha256"""
+    actual = file_sha256(entry.path)
+    if actual != entry.sha256:
+        raise ChecksumMismatch(f"Checkpoint {entry.path} of model version {entry.version} has sha256 "
+                               f"{actual[:12]}, the manifest records {entry.sha256[:12]}")
+
+
+class ModelRegistry:
+    def __init__(self, directory: str = MODEL_REGISTRY_DIR):
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, 'manifest.json')
+
+    def manifest(self) -> dict:
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'active': None, 'history': [], 'versions': {}}
+
+    def _write_manifest(self, manifest: dict) -> None:
+        # Readers in other processes see either the old or the new manifest, never a partial one
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def _entry(self, version: str, info: dict) -> ModelVersion:
+        return ModelVersion(version, os.path.join(self.directory, info['file']), info['sha256'],
+                            info.get('registered_at'), info.get('notes', ''))
+
+    def get(self, version: str) -> Optional[ModelVersion]:
+        info = self.manifest()['versions'].get(version)
+        return self._entry(version, info) if info else None
+
+    def versions(self) -> List[ModelVersion]:
+        return [self._entry(v, info) for v, info in sorted(self.manifest()['versions'].items())]
+
+    def active(self) -> Optional[ModelVersion]:
+        active = self.manifest().get('active')
+        return self.get(active) if active else None
+
+    def register(self, checkpoint_path: str, version: Optional[str] = None, notes: str = '') -> ModelVersion:
+        """Copy a checkpoint into the registry as a new version (not activated)"""
+        sha256 = file_sha256(checkpoint_path)
+        version = version or f"{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}-{sha256[:8]}"
+        if '/' in version or version.startswith('.'):
+            raise ValueError(f"Invalid version name '{version}'")
+        manifest = self.manifest()
+        if version in manifest['versions']:
+            raise ValueError(f"Version '{version}' is already registered")
+
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{version}.pth"
+        tmp_path = os.path.join(self.directory, f".{filename}.{os.getpid()}.tmp")
+        shutil.copyfile(checkpoint_path, tmp_path)
+        os.replace(tmp_path, os.path.join(self.directory, filename))
+
+        manifest['versions'][version] = {
+            'file': filename,
+            'sha256': sha256,
+            'registered_at': datetime.utcnow().isoformat(),
+            'source': os.path.abspath(checkpoint_path),
+            'notes': notes
+        }
+        self._write_manifest(manifest)
+        return self.get(version)
+
+    def activate(self, version: str) -> ModelVersion:
+        manifest = self.manifest()
+        if version not in manifest['versions']:
+            raise KeyError(f"Unknown model version '{version}'")
+        if manifest.get('active') != version:
+            manifest['active'] = version
+            manifest.setdefault('history', []).append(version)
+            self._write_manifest(manifest)
+        return self.get(version)
+
+    def rollback(self) -> ModelVersion:
+        """Re-activate the version that was active before the current one"""
+        manifest = self.manifest()
+        for version in reversed(manifest.get('history', [])):
+            if version != manifest.get('active') and version in manifest['versions']:
+                return self.activate(version)
+        raise KeyError("No earlier version to roll back to")
+
+    def remove(self, version: str) -> None:
+        manifest = self.manifest()
+        if manifest.get('active') == version:
+            raise ValueError(f"Version '{version}' is active; activate another version first")
+        info = manifest['versions'].pop(version, None)
+        if info is None:
+            raise KeyError(f"Unknown model version '{version}'")
+        manifest['history'] = [v for v in manifest.get('history', []) if v != version]
+        self._write_manifest(manifest)
+        path = os.path.join(self.directory, info['file'])
+        if os.path.exists(path):
+            os.remove(path)
+
+
+registry = ModelRegistry()
+
+
+def resolve_active() -> ModelVersion:
+    """The version to serve: the registry's active version, else the MODEL_PATH checkpoint"""
+    entry = registry.active()
+    if entry is not None:
+        return entry
+    if not os.path.exists(MODEL_PATH):
+        raise FileNotFoundError(f"No active model in {registry.manifest_path} and no checkpoint at {MODEL_PATH}")
+    sha256 = file_sha256(MODEL_PATH)
+    return ModelVersion(f"local-{sha256[:12]}", MODEL_PATH, sha256)
+
+
+class ModelWatcher:
+    """Polls the manifest on a background thread and hands version changes to the loader"""
+
+    def __init__(self, interval: float = MODEL_REGISTRY_POLL_SECONDS):
+        self.interval = interval
+        self._loader: Optional[Callable[[ModelVersion], None]] = None
+        self._current: Optional[Callable[[], Optional[str]]] = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.state = 'idle'
+        self.last_error: Optional[str] = None
+        self.last_swap_at: Optional[str] = None
+        self._failed: Optional[ModelVersion] = None
+
+    def attach(self, loader: Callable[[ModelVersion], None], current: Callable[[], Optional[str]]) -> None:
+        """loader(entry) loads, warms up and activates a version; current() names the served one"""
+        self._loader = loader
+        self._current = current
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='model-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+
+    def check_now(self) -> None:
+        """Check the manifest without waiting for the next poll (when the thread is running)"""
+        self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.interval if self.interval > 0 else None)
+            self._wake.clear()
+            if not self._stop.is_set():
+                self.check()
+
+    def check(self) -> bool:
+        """Swap to the manifest's active version if it changed; True when a swap happened"""
+        if self._loader is None:
+            return False
+        try:
+            entry = registry.active()
+        except (OSError, ValueError) as e:
+            logger.error(f"Cannot read model manifest: {e}")
+            return False
+        if entry is None or entry.version == self._current():
+            return False
+        if entry == self._failed:
+            return False  # retried once the manifest changes, not on every poll
+
+        self.state = f"loading {entry.version}"
+        try:
+            with MODEL_LOAD_SECONDS.time():
+                self._loader(entry)
+        except Exception as e:
+            MODEL_SWAPS.labels(outcome='failed').inc()
+            self._failed = entry
+            self.last_error = f"{entry.version}: {e}"
+            logger.error(f"Model swap to {entry.version} failed, still serving {self._current()}: {e}",
+                         exc_info=True)
+            return False
+        finally:
+            self.state = 'idle'
+        MODEL_SWAPS.labels(outcome='swapped').inc()
+        self._failed = None
+        self.last_error = None
+        self.last_swap_at = datetime.utcnow().isoformat()
+        return True
+
+    def status(self) -> dict:
+        return {
+            'serving': self._current() if self._current else None,
+            'state': self.state,
+            'polling': self._thread is not None and self._thread.is_alive(),
+            'poll_seconds': self.interval,
+            'last_swap_at': self.last_swap_at,
+            'last_error': self.last_error
+        }
+
+
+model_watcher = ModelWatcher()
+
+
+def _after_fork_in_child() -> None:
+    # The watcher thread does not survive fork; start_worker_services starts it per process
+    model_watcher._thread = None
+    model_watcher._wake = threading.Event()
+    model_watcher._stop = threading.Event()
+    model_watcher.state = 'idle'
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,177 @@
+"""
+On-demand request profiling.
+
+An admin arms the profiler for the next N requests and/or T seconds. While
+armed, each claimed request runs under cProfile and the model forward pass
+additionally under torch.profiler; results are written to logs/profiles as
+.pstats and Chrome-trace .json files. When disarmed the request hooks do a
+single attribute check and nothing else.
+
+Arming is per process: with several workers, arm each one (or run a single
+worker) to be sure the target requests are captured. Routes served by a native
+async handler in the ASGI mode are not profiled.
+"""
+
+import os
+import io
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import torch
+from flask import g, has_request_context, request
+from torch.profiler import profile, ProfilerActivity
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.path.join('logs', 'profiles')
+
+
+class ProfilerControl:
+    def __init__(self, output_dir: str = PROFILE_DIR):
+        self.output_dir = output_dir
+        self.armed = False
+        self._lock = threading.Lock()
+        self._remaining: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._torch = False
+        self._path_prefix: Optional[str] = None
+        self._session: Optional[str] = None
+        self._captured = 0
+
+    def init_app(self, app) -> None:
+        app.before_request(self._before_request)
+        app.teardown_request(self._teardown_request)
+
+    # ----- arming -----
+    def arm(self, requests: Optional[int] = None, seconds: Optional[float] = None,
+            torch_trace: bool = True, path_prefix: Optional[str] = None) -> Dict[str, object]:
+        if not requests and not seconds:
+            raise ValueError("Specify a number of requests and/or a duration in seconds")
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        with self._lock:
+            self._remaining = requests
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._torch = torch_trace
+            self._path_prefix = path_prefix
+            self._session = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+            self._captured = 0
+            self.armed = True
+        logger.info(f"Profiler armed: requests={requests} seconds={seconds} torch={torch_trace} path={path_prefix}")
+        return self.status()
+
+    def disarm(self) -> Dict[str, object]:
+        with self._lock:
+            self.armed = False
+        logger.info("Profiler disarmed")
+        return self.status()
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                'armed': self.armed,
+                'session': self._session,
+                'remaining_requests': self._remaining,
+                'seconds_left': max(0.0, self._deadline - time.monotonic()) if self._deadline else None,
+                'torch_trace': self._torch,
+                'path_prefix': self._path_prefix,
+                'captured': self._captured
+            }
+
+    def _claim(self) -> Optional[str]:
+        """Claim the current request for profiling, returning its capture name.
+
+        Disarms once the request or time budget runs out.
+        """
+        with self._lock:
+            if not self.armed:
+                return None
+            if self._deadline and time.monotonic() > self._deadline:
+                self.armed = False
+                return None
+            if self._path_prefix and not request.path.startswith(self._path_prefix):
+                return None
+            if self._remaining is not None:
+                self._remaining -= 1
+                if self._remaining <= 0:
+                    self.armed = False
+            self._captured += 1
+            return f"{self._session}_{self._captured:04d}_{request.endpoint or 'unknown'}"
+
+    # ----- request hooks -----
+    def _before_request(self):
+        if not self.armed or request.path.startswith('/admin/'):
+            return
+        if request.environ.get('dermai.async'):
+            # Native ASGI handlers hop between threads; cProfile only sees one
+            return
+        name = self._claim()
+        if name is None:
+            return
+
+        profiler = cProfile.Profile()
+        g.profile = {'profiler': profiler, 'name': name, 'torch': self._torch}
+        profiler.enable()
+
+    def _teardown_request(self, exc=None):
+        if 'profile' not in g:
+            return
+        capture = g.pop('profile')
+        capture['profiler'].disable()
+        path = os.path.join(self.output_dir, f"{capture['name']}.pstats")
+        try:
+            capture['profiler'].dump_stats(path)
+            logger.info(f"Wrote request profile to {path}")
+        except Exception as e:
+            logger.error(f"Failed to write profile {path}: {str(e)}")
+
+    # ----- torch operator profiling -----
+    def torch_profile(self, label: str):
+        """Context manager profiling model operators when the current request is being captured"""
+        if not has_request_context() or 'profile' not in g or not g.profile['torch']:
+            return nullcontext()
+        return self._torch_profile(f"{g.profile['name']}_{label}")
+
+    @contextmanager
+    def _torch_profile(self, name: str):
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+
+        with profile(activities=activities, record_shapes=True) as prof:
+            yield
+        path = os.path.join(self.output_dir, f"{name}.trace.json")
+        try:
+            prof.export_chrome_trace(path)
+        except Exception as e:
+            logger.error(f"Failed to write torch trace {path}: {str(e)}")
+
+    # ----- results -----
+    def list_files(self) -> List[Dict[str, object]]:
+        if not os.path.isdir(self.output_dir):
+            return []
+        files = []
+        for name in sorted(os.listdir(self.output_dir), reverse=True):
+            path = os.path.join(self.output_dir, name)
+            files.append({
+                'name': name,
+                'size': os.path.getsize(path),
+                'modified': datetime.utcfromtimestamp(os.path.getmtime(path)).isoformat()
+            })
+        return files
+
+    def summarize(self, name: str, sort: str = 'cumulative', limit: int = 40) -> str:
+        """Render a pstats file as the usual text table"""
+        out = io.StringIO()
+        stats = pstats.Stats(os.path.join(self.output_dir, name), stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+profiler = ProfilerControl()
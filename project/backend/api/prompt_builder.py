@@ -0,0 +1,135 @@
+"""
+Token-budgeted prompt assembly for DermAI chat.
+
+Older turns are folded into a compact rolling summary that is extended
+incrementally as the conversation grows; recent turns are selected by
+relevance to the new question until the prompt token budget is spent.
+Token counts are a local estimate, so no tokenizer download or API call is
+needed.
+"""
+
+import re
+import math
+from typing import Dict, List, Optional, Tuple
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+_SECTION_TITLE = re.compile(r"\*\*(.+?)\*\*")
+
+# Words too common to signal relevance between a question and a past turn
+_STOPWORDS = frozenset("""
+a an and are as at be but by can do does for from has have how i if in is it its
+me my of on or so that the their there this to was what when where which who why
+will with you your should could would about any some into than then them they
+""".split())
+
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate BPE token count: long words split into ~4 character pieces"""
+    return sum(math.ceil(len(piece) / 4) for piece in _TOKEN_PATTERN.findall(text))
+
+
+def _content_words(text: str) -> set:
+    return {w for w in _WORD_PATTERN.findall(text.lower()) if w not in _STOPWORDS and len(w) > 2}
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Keep whole leading sentences of text within max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+
+    kept, used = [], 0
+    for sentence in _SENTENCE_END.split(text):
+        cost = estimate_tokens(sentence)
+        if used + cost > max_tokens:
+            break
+        kept.append(sentence)
+        used += cost
+
+    if not kept:
+        words = text.split()
+        return ' '.join(words[:max(1, max_tokens // 2)]) + ' ...'
+    return ' '.join(kept) + ' ...'
+
+
+class PromptBuilder:
+    def __init__(self, token_budget: int, history_window: int,
+                 summary_token_limit: int, max_message_tokens: int):
+        self.token_budget = token_budget
+        self.history_window = history_window
+        self.summary_token_limit = summary_token_limit
+        self.max_message_tokens = max_message_tokens
+
+    # ----- rolling summary -----
+    @staticmethod
+    def _summarize_message(message: Dict[str, str]) -> str:
+        content = message['content'].strip()
+        if message['role'] == 'user':
+            return f"User asked: {truncate_to_tokens(content, 40)}"
+
+        titles = [t for t in _SECTION_TITLE.findall(content) if t.lower() != 'introduction']
+        first_sentence = truncate_to_tokens(_SECTION_TITLE.sub('', content).strip(), 30)
+        if titles:
+            return f"Assistant covered {', '.join(titles[:4])}: {first_sentence}"
+        return f"Assistant replied: {first_sentence}"
+
+    def split_history(self, history: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+        """Split history into (messages to fold into the summary, recent window)"""
+        if len(history) <= self.history_window:
+            return [], history
+        return history[:-self.history_window], history[-self.history_window:]
+
+    def extend_summary(self, summary: Optional[str], messages: List[Dict]) -> str:
+        """Fold messages into the rolling summary, dropping the oldest lines over the limit"""
+        lines = summary.splitlines() if summary else []
+        lines.extend(self._summarize_message(m) for m in messages)
+
+        while len(lines) > 1 and estimate_tokens('\n'.join(lines)) > self.summary_token_limit:
+            lines.pop(0)
+        return '\n'.join(lines)
+
+    # ----- prompt assembly -----
+    def _message_cost(self, content: str) -> int:
+        return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+    def build(self, system_prompt: str, user_prompt: str, query: str,
+              recent: List[Dict], summary: Optional[str] = None) -> List[Dict[str, str]]:
+        """Assemble chat messages within the token budget.
+
+        The system prompt and the new user prompt are always sent. The summary
+        is added next, then recent turns in order of relevance to the query
+        (ties broken by recency), and finally restored to chronological order.
+        """
+        system_content = system_prompt
+        if summary:
+            system_content = f"{system_prompt}\n\nEarlier in this conversation:\n{summary}"
+
+        remaining = self.token_budget - self._message_cost(system_content) - self._message_cost(user_prompt)
+        if remaining < 0 and summary:
+            system_content = system_prompt
+            remaining = self.token_budget - self._message_cost(system_content) - self._message_cost(user_prompt)
+
+        query_words = _content_words(query)
+        candidates = []
+        for position, message in enumerate(recent):
+            content = truncate_to_tokens(message['content'], self.max_message_tokens)
+            overlap = len(query_words & _content_words(content))
+            recency = position / max(len(recent), 1)
+            candidates.append((overlap + recency, position, {'role': message['role'], 'content': content}))
+
+        selected = []
+        for _, position, message in sorted(candidates, key=lambda c: c[0], reverse=True):
+            cost = self._message_cost(message['content'])
+            if cost <= remaining:
+                selected.append((position, message))
+                remaining -= cost
+
+        selected.sort(key=lambda item: item[0])
+        return [
+            {"role": "system", "content": system_content},
+            *[message for _, message in selected],
+            {"role": "user", "content": user_prompt}
+        ]
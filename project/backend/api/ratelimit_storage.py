@@ -0,0 +1,157 @@
+"""
+Host-wide rate-limit storage for flask-limiter backed by a SQLite WAL table.
+
+With ``memory://`` every gunicorn worker keeps its own counters, so a limit
+of 10/minute really allows 10 x workers. This storage keeps the counters in
+one SQLite file that all workers on the host share, without needing Redis:
+
+    Limiter(..., storage_uri="sqlite:////abs/path/ratelimit.db")
+
+Each hit is a single upsert (one row per limit key, O(1) regardless of the
+limit size) executed in autocommit mode, so the write lock is held only for
+that statement. Counters follow the fixed-window semantics of the limits
+strategies; expired rows are reset in place and purged occasionally.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to SQLite's busy timeout
+    fcntl = None
+
+from limits.storage import Storage
+
+BUSY_TIMEOUT_MS = 5000
+PURGE_PROBABILITY = 0.001
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    count INTEGER NOT NULL,
+    expiry REAL NOT NULL
+) WITHOUT ROWID
+"""
+
+# Start a new window if the stored one has expired, otherwise add to it.
+# Column references on the right-hand side see the row's old values.
+_INCR = """
+INSERT INTO rate_limits (key, count, expiry) VALUES (:key, :amount, :expiry)
+ON CONFLICT(key) DO UPDATE SET
+    count = CASE WHEN expiry <= :now THEN excluded.count ELSE count + excluded.count END,
+    expiry = CASE WHEN expiry <= :now OR :elastic THEN excluded.expiry ELSE expiry END
+RETURNING count
+"""
+
+
+class SQLiteStorage(Storage):
+    """limits storage shared by every process that opens the same database file"""
+
+    STORAGE_SCHEME = ["sqlite"]
+
+    def __init__(self, uri: str, wrap_exceptions: bool = False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        # SQLAlchemy-style URIs: sqlite:///relative.db or sqlite:////absolute.db
+        self.path = uri[len('sqlite:///'):] if uri.startswith('sqlite:///') else uri[len('sqlite://'):]
+        if not self.path:
+            raise ValueError("sqlite rate limit storage needs a database path, e.g. sqlite:///ratelimit.db")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+
+        self._local = threading.local()
+        self._thread_lock = threading.Lock()
+        self._lock_path = self.path + '.lock'
+        self._lock_file = None
+        self._lock_pid = None
+        self._connect().execute(_SCHEMA)
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread, reopened in forked children"""
+        conn: Optional[sqlite3.Connection] = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_MS / 1000,
+                               isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # Counters are cheap to lose on power failure; skip the fsync per commit
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _write_lock(self):
+        """Serialize writers on a kernel file lock.
+
+        SQLite's busy handler polls with sleeps of up to 100 ms, which shows up
+        as multi-millisecond tail latency under contention; a blocking flock
+        hands the lock over as soon as it is released.
+        """
+        with self._thread_lock:
+            if fcntl is None:
+                yield
+                return
+            if self._lock_pid != os.getpid():
+                self._lock_file = open(self._lock_path, 'a+')
+                self._lock_pid = os.getpid()
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def incr(self, key: str, expiry: float, elastic_expiry: bool = False, amount: int = 1) -> int:
+        # limits 3.x passes elastic_expiry; newer versions only pass amount
+        conn = self._connect()
+        with self._write_lock():
+            now = time.time()
+            count = conn.execute(_INCR, {
+                'key': key, 'amount': amount, 'expiry': now + expiry,
+                'now': now, 'elastic': int(elastic_expiry)
+            }).fetchone()[0]
+
+            if random.random() < PURGE_PROBABILITY:
+                conn.execute('DELETE FROM rate_limits WHERE expiry <= ?', (now,))
+        return count
+
+    def get(self, key: str) -> int:
+        row = self._connect().execute(
+            'SELECT count FROM rate_limits WHERE key = ? AND expiry > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key: str) -> float:
+        now = time.time()
+        row = self._connect().execute(
+            'SELECT expiry FROM rate_limits WHERE key = ? AND expiry > ?', (key, now)
+        ).fetchone()
+        return row[0] if row else now
+
+    def check(self) -> bool:
+        try:
+            self._connect().execute('SELECT 1').fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self) -> Optional[int]:
+        conn = self._connect()
+        with self._write_lock():
+            return conn.execute('DELETE FROM rate_limits').rowcount
+
+    def clear(self, key: str) -> None:
+        conn = self._connect()
+        with self._write_lock():
+            conn.execute('DELETE FROM rate_limits WHERE key = ?', (key,))
@@ -0,0 +1,315 @@
+"""
+Shadow evaluation of a candidate model on sampled live traffic.
+
+A SHADOW_SAMPLE_RATE fraction of the preprocessed tensors classified by
+/api/analyze is handed, together with the served top-3 and the stage that
+produced it (full model, cascade student or TTA), to a bounded in-process
+queue. A background thread scores each one with the candidate
+registry version and records agreement, the top-1 confidence delta and the
+candidate's latency as metrics and as one JSON line per sample in
+SHADOW_REPORT_DIR/<candidate>.jsonl. The candidate always runs a single
+full-model view, so the report breaks agreement down by the served stage:
+only the ``full`` row compares like with like. Users never wait for the
+candidate:
+
+* submitting never blocks - when the queue is full the sample is dropped
+* the thread runs at the lowest OS priority and only starts a forward pass
+  while no request is running or waiting for an inference slot; samples
+  that wait longer than SHADOW_MAX_AGE seconds are dropped
+* after every forward pass it sleeps long enough to keep its share of one
+  core at SHADOW_CPU_BUDGET. The pass is metered in process CPU time, which
+  includes torch's intra-op threads (nothing else runs inference meanwhile),
+  so the budget holds for any TORCH_NUM_THREADS. Those pool threads are
+  shared with request handling and are not reniced, though: with more than
+  one intra-op thread, a request arriving mid-pass competes with the
+  candidate at normal priority for up to one forward pass. Run with
+  TORCH_NUM_THREADS=1 (the gunicorn default) for strict priority isolation.
+
+The candidate is loaded on the shadow thread the first time it is needed
+(it costs one more model's memory per process). ``model_cli.py shadow-report``
+and GET /admin/shadow summarise the report.
+
+    SHADOW_MODEL_VERSION  registry version to evaluate (unset: shadow mode off)
+    SHADOW_SAMPLE_RATE    fraction of analyses scored (0.1)
+    SHADOW_QUEUE_SIZE     samples waiting at most (16)
+    SHADOW_CPU_BUDGET     fraction of one core the shadow thread may use (0.2)
+    SHADOW_MAX_AGE        seconds a sample may wait for an idle moment (60)
+    SHADOW_REPORT_DIR     instance/shadow
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import logging
+import threading
+from datetime import datetime
+from typing import Callable, Dict, NamedTuple, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from prometheus_client import Counter, Gauge, Histogram
+
+from api.admission import admission
+from api.model_registry import registry, verify_checksum
+
+logger = logging.getLogger(__name__)
+
+SHADOW_MODEL_VERSION = os.getenv('SHADOW_MODEL_VERSION', '')
+SHADOW_SAMPLE_RATE = float(os.getenv('SHADOW_SAMPLE_RATE', '0.1'))
+SHADOW_QUEUE_SIZE = int(os.getenv('SHADOW_QUEUE_SIZE', '16'))
+SHADOW_CPU_BUDGET = float(os.getenv('SHADOW_CPU_BUDGET', '0.2'))
+SHADOW_MAX_AGE = float(os.getenv('SHADOW_MAX_AGE', '60'))
+SHADOW_REPORT_DIR = os.getenv(
+    'SHADOW_REPORT_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance', 'shadow')
+)
+IDLE_POLL_SECONDS = 0.01
+
+SHADOW_PREDICTIONS = Counter('shadow_predictions_total', 'Shadow-scored samples by top-1 agreement', ['agreement'])
+SHADOW_DROPPED = Counter('shadow_dropped_total', 'Sampled tensors not scored, by reason', ['reason'])
+SHADOW_CONFIDENCE_DELTA = Histogram(
+    'shadow_confidence_delta', 'Candidate minus served top-1 probability',
+    buckets=[-0.5, -0.2, -0.1, -0.05, -0.01, 0.01, 0.05, 0.1, 0.2, 0.5]
+)
+SHADOW_INFERENCE_SECONDS = Histogram(
+    'shadow_inference_seconds', 'Candidate forward pass',
+    buckets=[0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5]
+)
+SHADOW_CPU_SECONDS = Counter('shadow_cpu_seconds_total', 'CPU time of candidate forward passes (all intra-op threads)')
+SHADOW_QUEUE_DEPTH = Gauge('shadow_queue_depth', 'Samples waiting to be scored by the candidate')
+
+
+class ShadowSample(NamedTuple):
+    tensor: torch.Tensor       # preprocessed (1, C, H, W); never modified after classification
+    top_prob: torch.Tensor     # served top-3
+    top_idx: torch.Tensor
+    primary_version: str
+    primary_stage: str         # STAGE_* of api/skin_analysis.py that produced the served top-3
+    queued_at: float
+
+
+def report_path(candidate: str, directory: str = SHADOW_REPORT_DIR) -> str:
+    return os.path.join(directory, f"{candidate}.jsonl")
+
+
+def summarize(path: str) -> Dict[str, object]:
+    """Agreement, confidence delta, latency and the most frequent disagreements in a report,
+    overall and by the stage that produced the served answer"""
+    samples = agree = 0
+    deltas, latencies, confusions, stages = [], [], {}, {}
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # partially written last line
+                samples += 1
+                agree += record['agree']
+                deltas.append(record['confidence_delta'])
+                stage = stages.setdefault(record.get('primary_stage', 'unknown'), [0, 0, 0.0])
+                stage[0] += 1
+                stage[1] += record['agree']
+                stage[2] += record['confidence_delta']
+                latencies.append(record['candidate_ms'])
+                if not record['agree']:
+                    pair = f"{record['primary']['condition']} -> {record['candidate']['condition']}"
+                    confusions[pair] = confusions.get(pair, 0) + 1
+    except FileNotFoundError:
+        pass
+    if not samples:
+        return {'samples': 0}
+    latencies.sort()
+    return {
+        'samples': samples,
+        'agreement': agree / samples,
+        'mean_confidence_delta': sum(deltas) / samples,
+        'mean_abs_confidence_delta': sum(abs(d) for d in deltas) / samples,
+        'candidate_ms_p50': latencies[samples // 2],
+        'candidate_ms_p95': latencies[min(samples - 1, int(samples * 0.95))],
+        'disagreements': dict(sorted(confusions.items(), key=lambda item: -item[1])[:10]),
+        'by_stage': {name: {'samples': count, 'agreement': agreed / count, 'mean_confidence_delta': delta / count}
+                     for name, (count, agreed, delta) in sorted(stages.items())}
+    }
+
+
+class ShadowEvaluator:
+    def __init__(self, candidate: str = SHADOW_MODEL_VERSION, sample_rate: float = SHADOW_SAMPLE_RATE,
+                 queue_size: int = SHADOW_QUEUE_SIZE, cpu_budget: float = SHADOW_CPU_BUDGET,
+                 max_age: float = SHADOW_MAX_AGE, report_dir: str = SHADOW_REPORT_DIR):
+        self.candidate = candidate or None
+        self.sample_rate = sample_rate
+        self.cpu_budget = min(max(cpu_budget, 0.01), 1.0)
+        self.max_age = max_age
+        self.report_dir = report_dir
+        self.class_names = None
+        self._queue_size = queue_size
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._loader: Optional[Callable[[str], torch.nn.Module]] = None
+        self._model: Optional[torch.nn.Module] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.scored = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.candidate is not None and self.sample_rate > 0
+
+    def attach(self, loader: Callable[[str], torch.nn.Module], class_names) -> None:
+        """loader(checkpoint_path) builds an eval-mode model like the served one"""
+        self._loader = loader
+        self.class_names = class_names
+
+    # ----- request side -----
+    def submit(self, tensor: torch.Tensor, top_prob: torch.Tensor, top_idx: torch.Tensor,
+               primary_version: str, primary_stage: str) -> bool:
+        """Offer a classified tensor for shadow scoring; never blocks"""
+        if not self.enabled or self._thread is None or primary_version == self.candidate:
+            return False
+        if random.random() >= self.sample_rate:
+            return False
+        try:
+            self._queue.put_nowait(ShadowSample(tensor, top_prob, top_idx, primary_version,
+                                                  primary_stage, time.monotonic()))
+        except queue.Full:
+            SHADOW_DROPPED.labels(reason='queue_full').inc()
+            return False
+        SHADOW_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    # ----- shadow thread -----
+    def start(self) -> None:
+        if not self.enabled or self._loader is None:
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='shadow-eval', daemon=True)
+        self._thread.start()
+        logger.info(f"Shadow evaluation of {self.candidate} on {self.sample_rate:.0%} of analyses "
+                    f"(CPU budget {self.cpu_budget:.0%} of a core)")
+        if torch.get_num_threads() > 1:
+            logger.warning(f"Shadow forward passes use torch's {torch.get_num_threads()} intra-op threads at "
+                           f"normal priority; set TORCH_NUM_THREADS=1 to keep them off the request path")
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _run(self) -> None:
+        try:
+            # Linux applies niceness per thread; elsewhere this lowers the whole process, so skip it
+            if sys.platform.startswith('linux'):
+                os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        except OSError as e:
+            logger.warning(f"Could not lower shadow thread priority: {e}")
+
+        while not self._stop.is_set():
+            try:
+                sample = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            SHADOW_QUEUE_DEPTH.set(self._queue.qsize())
+            if not self._wait_for_idle(sample):
+                continue
+            try:
+                used = self._score(sample)
+            except Exception as e:
+                SHADOW_DROPPED.labels(reason='failed').inc()
+                self.last_error = str(e)
+                logger.error(f"Shadow evaluation of {self.candidate} failed: {e}")
+                if self._model is None:
+                    self._stop.wait(60)  # candidate does not load; do not retry on every sample
+                continue
+            # Duty cycle: `cpu` core-seconds used in `elapsed`; idle until cpu / budget has passed
+            cpu, elapsed = used
+            self._stop.wait(max(0.0, cpu / self.cpu_budget - elapsed))
+
+    def _wait_for_idle(self, sample: ShadowSample) -> bool:
+        while not admission.inference_idle():
+            if time.monotonic() - sample.queued_at > self.max_age:
+                SHADOW_DROPPED.labels(reason='stale').inc()
+                return False
+            if self._stop.wait(IDLE_POLL_SECONDS):
+                return False
+        return True
+
+    def _candidate_model(self) -> torch.nn.Module:
+        if self._model is None:
+            entry = registry.get(self.candidate)
+            if entry is None:
+                raise KeyError(f"Candidate version '{self.candidate}' is not registered")
+            verify_checksum(entry)
+            self._model = self._loader(entry.path)
+        return self._model
+
+    @torch.inference_mode()
+    def _score(self, sample: ShadowSample) -> Tuple[float, float]:
+        """Score one sample; returns (CPU seconds, wall seconds) of the forward pass"""
+        model = self._candidate_model()
+        # Process CPU time also counts the intra-op threads the pass runs on
+        start, cpu_start = time.perf_counter(), time.process_time()
+        probabilities = F.softmax(model(sample.tensor), dim=1)[0]
+        elapsed = time.perf_counter() - start
+        cpu = time.process_time() - cpu_start
+        SHADOW_CPU_SECONDS.inc(cpu)
+        SHADOW_INFERENCE_SECONDS.observe(elapsed)
+
+        top_prob, top_idx = torch.topk(probabilities, k=3)
+        primary_idx, candidate_idx = sample.top_idx[0].item(), top_idx[0].item()
+        agree = primary_idx == candidate_idx
+        delta = top_prob[0].item() - sample.top_prob[0].item()
+        SHADOW_PREDICTIONS.labels(agreement='agree' if agree else 'disagree').inc()
+        SHADOW_CONFIDENCE_DELTA.observe(delta)
+        self.scored += 1
+
+        self._append({
+            'timestamp': datetime.utcnow().isoformat(),
+            'primary_version': sample.primary_version,
+            'primary_stage': sample.primary_stage,
+            'candidate_version': self.candidate,
+            'primary': {'condition': self.class_names[primary_idx], 'confidence': sample.top_prob[0].item(),
+                        'top3': [self.class_names[i] for i in sample.top_idx.tolist()]},
+            'candidate': {'condition': self.class_names[candidate_idx], 'confidence': top_prob[0].item(),
+                          'top3': [self.class_names[i] for i in top_idx.tolist()]},
+            'agree': agree,
+            'confidence_delta': delta,
+            'candidate_ms': elapsed * 1000,
+            'queued_ms': (time.monotonic() - sample.queued_at) * 1000 - elapsed * 1000
+        })
+        return cpu, elapsed
+
+    def _append(self, record: dict) -> None:
+        os.makedirs(self.report_dir, exist_ok=True)
+        # One short O_APPEND write per line, so workers sharing the file do not interleave
+        with open(report_path(self.candidate, self.report_dir), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+    def status(self) -> Dict[str, object]:
+        return {
+            'candidate': self.candidate,
+            'enabled': self.enabled,
+            'running': self._thread is not None and self._thread.is_alive(),
+            'sample_rate': self.sample_rate,
+            'cpu_budget': self.cpu_budget,
+            'queue_depth': self._queue.qsize(),
+            'scored': self.scored,
+            'last_error': self.last_error
+        }
+
+
+shadow = ShadowEvaluator()
+
+
+def _after_fork_in_child() -> None:
+    # Neither the thread nor the queue's locks survive fork; start_worker_services restarts it
+    shadow._thread = None
+    shadow._stop = threading.Event()
+    shadow._queue = queue.Queue(maxsize=shadow._queue_size)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
@@ -0,0 +1,102 @@
+"""
+Single-flight call coalescing.
+
+Concurrent callers asking for the same key share one in-flight execution and
+its result (or exception) instead of each doing the work themselves.
+"""
+
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Dict
+
+from prometheus_client import Counter
+
+SINGLEFLIGHT_CALLS = Counter(
+    'singleflight_calls_total', 'Calls that executed the underlying function',
+    ['group']
+)
+SINGLEFLIGHT_COALESCED = Counter(
+    'singleflight_coalesced_calls_total', 'Calls that joined an identical in-flight call',
+    ['group']
+)
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key into one execution"""
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            SINGLEFLIGHT_COALESCED.labels(group=self.group).inc()
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        SINGLEFLIGHT_CALLS.labels(group=self.group).inc()
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines running on one event loop.
+
+    The shared call runs as its own task, so a caller that is cancelled (e.g. a
+    disconnected client) does not cancel the work the other callers wait on.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._calls: Dict[str, asyncio.Task] = {}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            SINGLEFLIGHT_CALLS.labels(group=self.group).inc()
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            SINGLEFLIGHT_COALESCED.labels(group=self.group).inc()
+        return await asyncio.shield(task)
+
+    def _finished(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved even if every caller went away
+
+    def in_flight(self) -> int:
+        return len(self._calls)
@@ -7,20 +7,67 @@ from albumentations.pytorch import ToTensorV2
 import numpy as np
 from PIL import Image
 from datetime import datetime, timedelta
-from groq import Groq
-from typing import Tuple
+from typing import NamedTuple, Optional, Sequence, Tuple
+import asyncio
 import logging
 import json
+import time
+import hashlib
+import threading
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect as sa_inspect, text
+from sqlalchemy.exc import OperationalError
 from tenacity import retry, stop_after_attempt, wait_exponential
+from api.llm_gateway import get_gateway
+from api.timing import stage
+from api.profiling import profiler
+from api.admission import admission, OverloadedError
+from api import image_quality
+from api.image_quality import ImageQualityError
+from api.cascade import ModelCascade, load_cascade
+from api.tta import load_tta
+from api.model_registry import model_watcher, resolve_active, verify_checksum, MODEL_ACTIVE
+from api.shadow import shadow
+from api.images import remove_preview
 
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+ENRICHMENT_MODEL = "llama-3.2-90b-vision-preview"
+
+# Report body used when LLM enrichment is shed under load
+DEGRADED_ANALYSIS = """1. CONDITION OVERVIEW
+• Detailed analysis is temporarily unavailable due to high demand. The classification above is complete.
+5. MEDICAL ATTENTION INDICATORS
+• Seek prompt medical care for spreading redness, fever, severe pain or rapidly worsening symptoms.
+"""
+
+# Class names with common names and scientific references, in model output order
+CLASS_NAMES = (
+    'Bacterial Cellulitis',  # BA-cellulitis
+    'Bacterial Impetigo',    # BA-impetigo
+    'Athletes Foot',         # FU-athlete-foot
+    'Nail Fungus',          # FU-nail-fungus
+    'Ringworm',             # FU-ringworm
+    'Creeping Eruption',    # PA-cutaneous-larva-migrans
+    'Chickenpox',           # VI-chickenpox
+    'Shingles'              # VI-shingles
+)
+
+# Mapping between common names and scientific codes
+CONDITION_CODES = {
+    'Bacterial Cellulitis': 'BA-cellulitis',
+    'Bacterial Impetigo': 'BA-impetigo',
+    'Athletes Foot': 'FU-athlete-foot',
+    'Nail Fungus': 'FU-nail-fungus',
+    'Ringworm': 'FU-ringworm',
+    'Creeping Eruption': 'PA-cutaneous-larva-migrans',
+    'Chickenpox': 'VI-chickenpox',
+    'Shingles': 'VI-shingles'
+}
+
 class RetryableDBOperation:
     """Decorator for database operations that should be retried on failure"""
     @staticmethod
@@ -64,6 +111,9 @@ class ChatMessage(db.Model):
             raise
 
 class SkinAnalysisResult(db.Model):
+    # Per-user history, and the first/last-seen lookups of api/analytics.py
+    __table_args__ = (db.Index('ix_analysis_user_condition_time', 'user_id', 'primary_condition', 'timestamp'),)
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(50), nullable=False)
     timestamp = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
@@ -71,6 +121,8 @@ class SkinAnalysisResult(db.Model):
     primary_condition = db.Column(db.String(100), nullable=False)
     confidence = db.Column(db.Float, nullable=False)
     detailed_analysis = db.Column(db.Text, nullable=False)
+    model_version = db.Column(db.String(64))
+    model_stage = db.Column(db.String(16))  # STAGE_* that produced the prediction
 
     @RetryableDBOperation.with_retry
     def save(self):
@@ -81,10 +133,128 @@ class SkinAnalysisResult(db.Model):
             db.session.rollback()
             raise
 
+    def to_dict(self) -> dict:
+        """Serialize for the history API (image preview is added by the caller)"""
+        return {
+            'id': str(self.id),
+            'timestamp': self.timestamp.isoformat(),
+            'primary_condition': self.primary_condition,
+            'confidence': self.confidence,
+            'model_version': self.model_version,
+            'model_stage': self.model_stage,
+            'detailed_analysis': json.loads(self.detailed_analysis)
+        }
+
+class ConversationSummary(db.Model):
+    """Rolling summary of a user's chat turns that have left the prompt window"""
+    user_id = db.Column(db.String(50), primary_key=True)
+    summary = db.Column(db.Text, nullable=False, default='')
+    last_message_id = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class ResourceVersion(db.Model):
+    """Per-user change counter for a resource, used to derive ETags"""
+    user_id = db.Column(db.String(50), primary_key=True)
+    resource = db.Column(db.String(20), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class ConditionSummary(db.Model):
+    """Per-user, per-condition analysis totals, maintained by api/analytics.py"""
+    user_id = db.Column(db.String(50), primary_key=True)
+    condition = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Float, nullable=False, default=0.0)
+    first_seen = db.Column(db.DateTime)
+    last_seen = db.Column(db.DateTime)
+
+class ConditionTrend(db.Model):
+    """Per-user, per-condition, per-month analysis totals, maintained by api/analytics.py"""
+    user_id = db.Column(db.String(50), primary_key=True)
+    condition = db.Column(db.String(100), primary_key=True)
+    period = db.Column(db.String(7), primary_key=True)  # YYYY-MM
+    count = db.Column(db.Integer, nullable=False, default=0)
+    confidence_sum = db.Column(db.Float, nullable=False, default=0.0)
+
+# Columns and indexes added to tables after their first release. db.create_all()
+# only creates missing tables, so upgrade_schema() adds these to existing databases.
+ADDED_COLUMNS = (
+    ('skin_analysis_result', 'model_version', 'VARCHAR(64)'),
+    ('skin_analysis_result', 'model_stage', 'VARCHAR(16)'),
+)
+ADDED_INDEXES = tuple(SkinAnalysisResult.__table__.indexes)
+
+def upgrade_schema() -> None:
+    """ALTER TABLE ... ADD COLUMN for ADDED_COLUMNS and CREATE INDEX for ADDED_INDEXES
+    missing from an existing database.
+
+    Call after db.create_all() inside an app context.
+    """
+    inspector = sa_inspect(db.engine)
+    for table, column, ddl in ADDED_COLUMNS:
+        if column in {c['name'] for c in inspector.get_columns(table)}:
+            continue
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+            logger.info(f"Added column {table}.{column}")
+        except OperationalError as e:
+            if 'duplicate column' not in str(e):
+                raise  # otherwise another process added it first
+    for index in ADDED_INDEXES:
+        try:
+            index.create(db.engine, checkfirst=True)
+        except OperationalError as e:
+            if 'already exists' not in str(e):
+                raise
+
+
+def build_transform() -> A.Compose:
+    """Preprocessing shared by the classifier, the cascade student and its training"""
+    return A.Compose([
+        A.Resize(224, 224, interpolation=Image.BILINEAR),
+        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ToTensorV2()
+    ])
+
+def load_checkpoint_weights(model_path: str, device) -> dict:
+    """Model weights from a checkpoint saved either as a bare state dict or as {'model_state_dict': ...}"""
+    checkpoint = torch.load(model_path, map_location=device)
+    if isinstance(checkpoint, dict):
+        return checkpoint.get('model_state_dict', checkpoint)
+    return checkpoint
+
+# Which part of the pipeline produced a prediction
+STAGE_FULL = 'full'        # one forward pass of the served model
+STAGE_STUDENT = 'student'  # the cascade student, without escalation
+STAGE_TTA = 'tta'          # the served model's test-time augmentation views
+
+
+class Classification(NamedTuple):
+    """Outcome of DermatologyAnalyzer.classify"""
+    top_prob: torch.Tensor
+    top_idx: torch.Tensor
+    initial_report: str
+    quality: Optional[object]  # image_quality.QualityReport, None when the gate is off
+    tta: Optional[dict]  # test-time augmentation details, None when it did not run
+    embedding: Optional[torch.Tensor]  # pooled full-model features, None when the cascade student answered
+    model_version: str
+    model_stage: str  # STAGE_*
+
+
+class ActiveModel(NamedTuple):
+    """The served model, its registry version and the cascade valid for it, swapped as one reference"""
+    version: str
+    model: 'SkinDiseaseModel'
+    sha256: Optional[str] = None
+    cascade: Optional[ModelCascade] = None  # None unless the student was distilled from this checkpoint
+
+
 class SkinDiseaseModel(nn.Module):
-    def __init__(self, num_classes: int):
+    def __init__(self, num_classes: int, pretrained: bool = True):
         super().__init__()
-        self.base_model = models.efficientnet_b0(weights=models.EfficientNet_B0_Weights.IMAGENET1K_V1)
+        weights = models.EfficientNet_B0_Weights.IMAGENET1K_V1 if pretrained else None
+        self.base_model = models.efficientnet_b0(weights=weights)
         in_features = self.base_model.classifier[1].in_features
         self.base_model.classifier = nn.Sequential(
             nn.Dropout(p=0.5, inplace=True),
@@ -94,44 +264,37 @@ class SkinDiseaseModel(nn.Module):
     def forward(self, x: torch.Tensor) -> torch.Tensor:
         return self.base_model(x)
 
+    def forward_with_embedding(self, x: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Logits and the pooled backbone features they are computed from (inference only)"""
+        pooled = torch.flatten(self.base_model.avgpool(self.base_model.features(x)), 1)
+        return self.base_model.classifier(pooled), pooled
+
 class DermatologyAnalyzer:
     def __init__(self, username: str = "DefaultUser"):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         logger.info(f"Using device: {self.device}")
         
-        # Initialize Groq client with API key from environment variable
-        self.api_key = os.getenv('GROQ_API_KEY', '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')
-        self.groq_client = Groq(api_key=self.api_key)
-
-        # Define class names with common names and scientific references
-        self.class_names = (
-            'Bacterial Cellulitis',  # BA-cellulitis
-            'Bacterial Impetigo',    # BA-impetigo
-            'Athletes Foot',         # FU-athlete-foot
-            'Nail Fungus',          # FU-nail-fungus
-            'Ringworm',             # FU-ringworm
-            'Creeping Eruption',    # PA-cutaneous-larva-migrans
-            'Chickenpox',           # VI-chickenpox
-            'Shingles'              # VI-shingles
-        )
+        # Outbound LLM calls share the process-wide pooled gateway
+        self.llm = get_gateway()
 
-        # Define mapping between common names and scientific codes
-        self.condition_codes = {
-            'Bacterial Cellulitis': 'BA-cellulitis',
-            'Bacterial Impetigo': 'BA-impetigo',
-            'Athletes Foot': 'FU-athlete-foot',
-            'Nail Fungus': 'FU-nail-fungus',
-            'Ringworm': 'FU-ringworm',
-            'Creeping Eruption': 'PA-cutaneous-larva-migrans',
-            'Chickenpox': 'VI-chickenpox',
-            'Shingles': 'VI-shingles'
-        }
+        self.class_names = CLASS_NAMES
+        self.condition_codes = CONDITION_CODES
 
-        self.model = None
-        self._initialize_model()
+        # Served model version; replaced as a whole on hot swap (see api/model_registry.py)
+        self._active: Optional[ActiveModel] = None
+        self._swap_lock = threading.Lock()
         self._setup_transformations()
+        # Optional distilled first-stage model; only used with the checkpoint it was distilled from
+        self.cascade = load_cascade(self.class_names, self.device)
+        self._initialize_model()
         self._response_cache = {}
 
+        # Optional test-time augmentation of low-confidence predictions
+        self.tta = load_tta()
+        model_watcher.attach(self.load_version, lambda: self.model_version)
+        # Optional candidate version scored on sampled traffic in the background
+        shadow.attach(self._load_model, self.class_names)
+
     def initialize_with_app(self, app):
         """Initialize database-related operations within app context"""
         with app.app_context():
@@ -142,82 +305,181 @@ class DermatologyAnalyzer:
                 logger.error(f"Database cleanup failed: {str(e)}")
                 # Don't raise the error, as this is not critical for model operation
 
-    def _initialize_model(self) -> None:
-        try:
-            self.model = SkinDiseaseModel(num_classes=len(self.class_names)).to(self.device)
-            # Use absolute path for the model file
-            model_path = r"C:\Users\GAURAV PATIL\Desktop\gaurav's code\mini project derm ai\project\project\best_model_acc_0.9978.pth"
-            
-            logger.info(f"Attempting to load model from: {model_path}")
-
-            if not os.path.exists(model_path):
-                logger.error(f"Model file not found at {model_path}")
-                raise FileNotFoundError(f"Model file not found at {model_path}")
+    @property
+    def model(self) -> Optional['SkinDiseaseModel']:
+        active = self._active
+        return active.model if active is not None else None
 
-            try:
-                checkpoint = torch.load(model_path, map_location=self.device)
-                if isinstance(checkpoint, dict):
-                    self.model.load_state_dict(checkpoint.get('model_state_dict', checkpoint))
-                else:
-                    self.model.load_state_dict(checkpoint)
-
-                self.model.eval()
-                torch.set_grad_enabled(False)
-                logger.info(f"Model loaded successfully from {model_path}")
-                
-                # Verify model loaded correctly by running a test inference
-                dummy_input = torch.randn(1, 3, 224, 224).to(self.device)
-                try:
-                    with torch.no_grad():
-                        _ = self.model(dummy_input)
-                    logger.info("Model verification successful - test inference passed")
-                except Exception as e:
-                    logger.error(f"Model verification failed: {str(e)}")
-                    raise RuntimeError(f"Model verification failed: {str(e)}")
+    @property
+    def model_version(self) -> Optional[str]:
+        active = self._active
+        return active.version if active is not None else None
 
-            except Exception as e:
-                logger.error(f"Error loading model weights: {str(e)}")
-                raise RuntimeError(f"Error loading model weights: {str(e)}")
+    @property
+    def active_cascade(self) -> Optional[ModelCascade]:
+        active = self._active
+        return active.cascade if active is not None else None
 
+    def _initialize_model(self) -> None:
+        try:
+            entry = resolve_active()
+            logger.info(f"Loading model version {entry.version} from {entry.path}")
+            verify_checksum(entry)
+            self._activate(entry.version, self._load_model(entry.path), entry.sha256)
         except Exception as e:
             logger.error(f"Error initializing model: {str(e)}")
-            self.model = None
+            self._active = None
             raise
 
-    def _setup_transformations(self) -> None:
-        self.transform = A.Compose([
-            A.Resize(224, 224, interpolation=Image.BILINEAR),
-            A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-            ToTensorV2()
-        ])
+    def _load_model(self, model_path: str) -> 'SkinDiseaseModel':
+        """Build the network and load a checkpoint; the weights replace any pretrained ones"""
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model file not found at {model_path}")
+        model = SkinDiseaseModel(num_classes=len(self.class_names), pretrained=False).to(self.device)
+        try:
+            model.load_state_dict(load_checkpoint_weights(model_path, self.device))
+        except Exception as e:
+            raise RuntimeError(f"Error loading model weights from {model_path}: {str(e)}")
+        model.eval()
+        torch.set_grad_enabled(False)
 
-    def is_model_loaded(self) -> bool:
+        # Verify the model once by running a test inference
         try:
-            if self.model is None:
-                return False
-            
-            # Try a test inference to verify model is working
-            dummy_input = torch.randn(1, 3, 224, 224).to(self.device)
-            with torch.no_grad():
-                _ = self.model(dummy_input)
-            return True
+            with torch.inference_mode():
+                model(torch.randn(1, 3, 224, 224).to(self.device))
         except Exception as e:
-            logger.error(f"Model health check failed: {str(e)}")
-            return False
+            raise RuntimeError(f"Model verification failed: {str(e)}")
+        logger.info(f"Model loaded successfully from {model_path}")
+        return model
+
+    def _cascade_for(self, version: str, sha256: Optional[str]) -> Optional[ModelCascade]:
+        """The cascade if its student was distilled from and calibrated against this checkpoint"""
+        if self.cascade is None:
+            return None
+        if self.cascade.teacher_sha256 is None or self.cascade.teacher_sha256 != sha256:
+            logger.warning(f"Cascade disabled for model version {version}: the student was distilled from "
+                           f"another checkpoint; re-run cascade_cli.py distill or calibrate against it")
+            return None
+        return self.cascade
+
+    def _activate(self, version: str, model: 'SkinDiseaseModel', sha256: Optional[str] = None) -> None:
+        previous = self.model_version
+        # One reference assignment: a request sees either the old or the new model (and its cascade), never a mix
+        self._active = ActiveModel(version, model, sha256, self._cascade_for(version, sha256))
+        if previous is not None and previous != version:
+            MODEL_ACTIVE.labels(version=previous).set(0)
+        MODEL_ACTIVE.labels(version=version).set(1)
+
+    def load_version(self, entry) -> None:
+        """Load, warm up and switch to a registry version (called on the watcher thread).
+
+        Traffic keeps being served by the current model until the switch.
+        """
+        with self._swap_lock:
+            if entry.version == self.model_version:
+                return
+            start = time.perf_counter()
+            # The recorded sha256 is what binds the cascade student and the stored
+            # provenance to this checkpoint; refuse a file that no longer matches it
+            verify_checksum(entry)
+            model = self._load_model(entry.path)
+            self._warm(model)
+            self._activate(entry.version, model, entry.sha256)
+            logger.info(f"Switched to model version {entry.version} "
+                        f"(loaded and warmed up in {time.perf_counter() - start:.1f}s)")
 
+    def _setup_transformations(self) -> None:
+        self.transform = build_transform()
+
+    def is_model_loaded(self) -> bool:
+        return self._active is not None
+
+    def warmup(self, iterations: int = 2) -> float:
+        """Run the preprocessing and forward path on a blank image.
+
+        The first real request otherwise pays for thread-pool start-up and
+        kernel selection. Returns the duration of the last iteration in seconds.
+        """
+        return self._warm(self.model, iterations)
+
+    def _warm(self, model: 'SkinDiseaseModel', iterations: int = 2) -> float:
+        image = np.zeros((256, 256, 3), dtype=np.uint8)
+        elapsed = 0.0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            image_tensor = self.transform(image=image)['image'].unsqueeze(0).to(self.device)
+            self._predict_with_embedding(model, image_tensor)
+            if self.cascade is not None:
+                # The student directly, so warmup does not count towards the escalation metrics
+                with torch.inference_mode():
+                    self.cascade.student(image_tensor)
+            if self.tta is not None:
+                self.tta.predict(model, image_tensor)
+            elapsed = time.perf_counter() - start
+        return elapsed
+
+    @staticmethod
     @torch.inference_mode()
-    def _predict_image(self, image_tensor: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
-        outputs = self.model(image_tensor)
+    def _predict_with_embedding(model: 'SkinDiseaseModel', image_tensor: torch.Tensor):
+        """Top-3 and the pooled embedding of the first image, from one forward pass"""
+        outputs, embeddings = model.forward_with_embedding(image_tensor)
         probabilities = torch.nn.functional.softmax(outputs, dim=1)[0]
-        return torch.topk(probabilities, k=3)
+        top_prob, top_idx = torch.topk(probabilities, k=3)
+        return top_prob, top_idx, embeddings[0]
+
+    def _predict(self, active: ActiveModel, image_tensor: torch.Tensor):
+        """Top-3, embedding and stage through the cascade when the active model has
+        one, otherwise the full model. The embedding is None when the student answered."""
+        if active.cascade is not None:
+            full = {}
+
+            def full_model(tensor):
+                top_prob, top_idx, full['embedding'] = self._predict_with_embedding(active.model, tensor)
+                return top_prob, top_idx
+
+            top_prob, top_idx = active.cascade.predict(image_tensor, full_model)
+            if 'embedding' not in full:
+                return top_prob, top_idx, None, STAGE_STUDENT
+            return top_prob, top_idx, full['embedding'], STAGE_FULL
+        with stage('forward'):
+            return (*self._predict_with_embedding(active.model, image_tensor), STAGE_FULL)
+
+    def _classify_tensor(self, active: ActiveModel, image_tensor: torch.Tensor):
+        """Top-3 for a preprocessed image, refined by test-time augmentation when
+        TTA is enabled and the prediction is borderline.
+
+        Returns (top_prob, top_idx, embedding, tta, model_stage).
+        """
+        top_prob, top_idx, embedding, model_stage = self._predict(active, image_tensor)
+        if self.tta is None or top_prob[0].item() >= self.tta.threshold:
+            return top_prob, top_idx, embedding, None, model_stage
+        with stage('tta'):
+            top_prob, top_idx, tta = self.tta.refine(active.model, image_tensor, top_prob, top_idx)
+        return top_prob, top_idx, embedding, tta, STAGE_TTA
+
+    def embed(self, image_path: str) -> Tuple[str, torch.Tensor]:
+        """(model version, pooled embedding) of a stored image, for the similar-case index"""
+        image_tensor = self._load_tensor(image_path)
+        active = self._active
+        with admission.inference_slot():
+            return active.version, self._predict_with_embedding(active.model, image_tensor)[2]
 
-    def _get_groq_analysis(self, initial_report: str) -> str:
-        try:
-            cache_key = hash(initial_report)
-            if (cache_key in self._response_cache):
-                return self._response_cache[cache_key]
+    @staticmethod
+    def _enrichment_key(initial_report: str) -> str:
+        """Cache/coalescing key for the LLM enrichment of a report.
+
+        The requested sections depend on the predicted conditions and their
+        assessment bands, not on the upload's file name or exact percentages,
+        so those lines are left out of the key.
+        """
+        lines = [
+            line for line in initial_report.splitlines()
+            if not line.startswith('Image Reference:') and 'Confidence:' not in line
+        ]
+        return hashlib.sha256('\n'.join(lines).encode()).hexdigest()
 
-            prompt = f"""
+    def _enrichment_messages(self, initial_report: str) -> list:
+        prompt = f"""
 Please provide a detailed dermatological analysis following this exact structure:
 
 1. CONDITION OVERVIEW
@@ -254,18 +516,25 @@ Format each section with bullet points (•) for clear readability.
 Ensure each point is concise but informative.
 Use medical terminology with layman explanations where needed.
 """
+        return [
+            {"role": "system", "content": "You are a specialized dermatology AI assistant. Provide structured, clear, and professional analysis using bullet points."},
+            {"role": "user", "content": prompt}
+        ]
+
+    def _get_groq_analysis(self, initial_report: str) -> str:
+        try:
+            cache_key = self._enrichment_key(initial_report)
+            if (cache_key in self._response_cache):
+                return self._response_cache[cache_key]
 
-            response = self.groq_client.chat.completions.create(
-                model="llama-3.2-90b-vision-preview",
-                messages=[
-                    {"role": "system", "content": "You are a specialized dermatology AI assistant. Provide structured, clear, and professional analysis using bullet points."},
-                    {"role": "user", "content": prompt}
-                ],
+            analysis = self.llm.complete(
+                model=ENRICHMENT_MODEL,
+                messages=self._enrichment_messages(initial_report),
                 temperature=0.7,
-                max_tokens=2000
+                max_tokens=2000,
+                coalesce_key=cache_key
             )
 
-            analysis = response.choices[0].message.content.strip()
             # Clean up and standardize the bullet points
             analysis = analysis.replace('*', '•').replace('-', '•')
             self._response_cache[cache_key] = analysis
@@ -275,49 +544,171 @@ Use medical terminology with layman explanations where needed.
             logger.error(f"Groq API error: {str(e)}")
             return "Unable to get enhanced analysis. Please try again later."
 
-    def analyze_image(self, image_path: str) -> dict:
-        if not self.is_model_loaded():
+    async def _aget_groq_analysis(self, initial_report: str) -> str:
+        """Async variant of _get_groq_analysis for the ASGI serving mode"""
+        try:
+            cache_key = self._enrichment_key(initial_report)
+            if (cache_key in self._response_cache):
+                return self._response_cache[cache_key]
+
+            analysis = await self.llm.acomplete(
+                model=ENRICHMENT_MODEL,
+                messages=self._enrichment_messages(initial_report),
+                temperature=0.7,
+                max_tokens=2000,
+                coalesce_key=cache_key
+            )
+
+            analysis = analysis.replace('*', '•').replace('-', '•')
+            self._response_cache[cache_key] = analysis
+            return analysis
+
+        except Exception as e:
+            logger.error(f"Groq API error: {str(e)}")
+            return "Unable to get enhanced analysis. Please try again later."
+
+    @staticmethod
+    def _load_image(image_path: str) -> Image.Image:
+        return Image.open(image_path).convert('RGB')
+
+    def _to_tensor(self, image: Image.Image) -> torch.Tensor:
+        return self.transform(image=np.array(image))['image'].unsqueeze(0).to(self.device)
+
+    def _load_tensor(self, image_path: str) -> torch.Tensor:
+        return self._to_tensor(self._load_image(image_path))
+
+    def enrich_analysis(self, image_path: str, predictions: Sequence[Tuple[str, float]]) -> dict:
+        """Return LLM-enriched sections for a stored analysis.
+
+        Used by background jobs for analyses whose enrichment was shed.
+        predictions are the stored (condition, confidence %) pairs, primary
+        first: the report is rebuilt from them without another forward pass,
+        so it describes the stored prediction whichever model version is
+        served now. Returns None if the LLM did not produce an analysis so
+        the job can be retried.
+        """
+        report = self._generate_initial_report(
+            image_path, [self._format_prediction(condition, confidence) for condition, confidence in predictions]
+        )
+        sections = self._parse_analysis_sections(self._get_groq_analysis(report))
+        return sections if any(sections.values()) else None
+
+    def classify(self, image_path: str):
+        """Preprocess and run the model.
+
+        Returns a Classification. Images that fail the quality gate raise
+        ImageQualityError before the forward pass (QUALITY_GATE_MODE=reject)
+        or come back with the problems in quality.
+        """
+        # The whole request uses the version active now, even if a swap completes meanwhile
+        active = self._active
+        if active is None:
             logger.error("ML model is not properly initialized")
             raise RuntimeError("ML model is not properly initialized. Please try again later.")
 
+        if not os.path.exists(image_path):
+            raise FileNotFoundError(f"Image not found: {image_path}")
+
+        with stage('preprocess'):
+            image = self._load_image(image_path)
+        with stage('quality'):
+            quality = image_quality.check(image)
+        with stage('preprocess'):
+            image_tensor = self._to_tensor(image)
+
+        with admission.inference_slot():
+            with profiler.torch_profile('forward'):
+                top_prob, top_idx, embedding, tta, model_stage = self._classify_tensor(active, image_tensor)
+        shadow.submit(image_tensor, top_prob, top_idx, active.version, model_stage)
+        return Classification(top_prob, top_idx, self._generate_initial_report(image_path, self._format_predictions(top_prob, top_idx)),
+                              quality, tta, embedding, active.version, model_stage)
+
+    def _cached_or_degraded_analysis(self, initial_report: str) -> str:
+        return self._response_cache.get(self._enrichment_key(initial_report), DEGRADED_ANALYSIS)
+
+    def analyze_image(self, image_path: str, enrich: bool = True) -> dict:
+        """Classify an image and build the report.
+
+        With enrich=False (load shedding) the LLM enrichment is only served
+        from cache; otherwise the detailed sections say it was skipped.
+        The report's 'embedding' (a tensor, or None) is for the similar-case
+        index and must be popped before the report is serialized.
+        """
         try:
-            if not os.path.exists(image_path):
-                raise FileNotFoundError(f"Image not found: {image_path}")
-
-            image = Image.open(image_path).convert('RGB')
-            image_tensor = self.transform(image=np.array(image))['image'].unsqueeze(0).to(self.device)
-
-            top_prob, top_idx = self._predict_image(image_tensor)
-            initial_report = self._generate_initial_report(image_path, top_prob, top_idx)
-            enhanced_analysis = self._get_groq_analysis(initial_report)
-            sections = self._parse_analysis_sections(enhanced_analysis)
+            result = self.classify(image_path)
+            if enrich:
+                with stage('llm'):
+                    enhanced_analysis = self._get_groq_analysis(result.initial_report)
+            else:
+                enhanced_analysis = self._cached_or_degraded_analysis(result.initial_report)
+            return self._build_report(result, enhanced_analysis)
+
+        except (OverloadedError, ImageQualityError):
+            raise
+        except Exception as e:
+            error_msg = f"Error analyzing image: {str(e)}"
+            logger.error(error_msg)
+            raise RuntimeError(error_msg)
 
-            return {
-                'report_metadata': {
-                    'timestamp': datetime.now().isoformat(),
-                    'report_id': f"DERM-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
-                    'analysis_type': 'AI-Assisted Dermatological Assessment'
-                },
-                'primary_analysis': self._format_predictions(top_prob, top_idx)[0],
-                'differential_diagnoses': self._format_predictions(top_prob, top_idx)[1:],
-                'detailed_analysis': {
-                    'overview': sections['overview'],
-                    'symptoms': sections['symptoms'],
-                    'treatment': sections['treatment'],
-                    'prevention': sections['prevention'],
-                    'warning': sections['warning']
-                },
-                'patient_guidance': {
-                    'disclaimer': self._get_disclaimer(),
-                    'next_steps': self._get_next_steps()
-                }
-            }
+    async def analyze_image_async(self, image_path: str, enrich: bool = True, offload=None) -> dict:
+        """Async variant of analyze_image for the ASGI serving mode.
 
+        The CPU-bound classification runs through ``offload`` (a coroutine
+        function that executes a callable on an executor, default a thread);
+        the LLM enrichment is awaited without holding a thread.
+        """
+        offload = offload or asyncio.to_thread
+        try:
+            result = await offload(self.classify, image_path)
+            if enrich:
+                with stage('llm'):
+                    enhanced_analysis = await self._aget_groq_analysis(result.initial_report)
+            else:
+                enhanced_analysis = self._cached_or_degraded_analysis(result.initial_report)
+            return self._build_report(result, enhanced_analysis)
+
+        except (OverloadedError, ImageQualityError):
+            raise
         except Exception as e:
             error_msg = f"Error analyzing image: {str(e)}"
             logger.error(error_msg)
             raise RuntimeError(error_msg)
 
+    def _build_report(self, result: Classification, enhanced_analysis: str) -> dict:
+        with stage('parse'):
+            sections = self._parse_analysis_sections(enhanced_analysis)
+
+        metadata = {
+            'timestamp': datetime.now().isoformat(),
+            'report_id': f"DERM-{datetime.now().strftime('%Y%m%d-%H%M%S')}",
+            'analysis_type': 'AI-Assisted Dermatological Assessment',
+            'enrichment_skipped': enhanced_analysis is DEGRADED_ANALYSIS,
+            'model_version': result.model_version,
+            'model_stage': result.model_stage
+        }
+        if result.quality is not None:
+            metadata['image_quality'] = result.quality.to_dict()
+        if result.tta is not None:
+            metadata['test_time_augmentation'] = result.tta
+
+        return {
+            'report_metadata': metadata,
+            'primary_analysis': self._format_predictions(result.top_prob, result.top_idx)[0],
+            'differential_diagnoses': self._format_predictions(result.top_prob, result.top_idx)[1:],
+            'detailed_analysis': {
+                'overview': sections['overview'],
+                'symptoms': sections['symptoms'],
+                'treatment': sections['treatment'],
+                'prevention': sections['prevention'],
+                'warning': sections['warning']
+            },
+            'patient_guidance': {
+                'disclaimer': self._get_disclaimer(),
+                'next_steps': self._get_next_steps()
+            },
+            'embedding': result.embedding
+        }
+
     def _parse_analysis_sections(self, analysis: str) -> dict:
         sections = {
             'overview': [],
@@ -350,17 +741,20 @@ Use medical terminology with layman explanations where needed.
 
     def _format_predictions(self, probabilities: torch.Tensor, indices: torch.Tensor) -> list:
         return [
-            {
-                'condition': self.class_names[idx],
-                'confidence': prob.item() * 100,
-                'assessment': self._get_confidence_level(prob.item() * 100),
-                'confidence_level': self._get_confidence_category(prob.item() * 100)
-            }
+            self._format_prediction(self.class_names[idx], prob.item() * 100)
             for prob, idx in zip(probabilities, indices)
         ]
 
-    def _generate_initial_report(self, image_path: str, probabilities: torch.Tensor, indices: torch.Tensor) -> str:
-        predictions = self._format_predictions(probabilities, indices)
+    @classmethod
+    def _format_prediction(cls, condition: str, confidence: float) -> dict:
+        return {
+            'condition': condition,
+            'confidence': confidence,
+            'assessment': cls._get_confidence_level(confidence),
+            'confidence_level': cls._get_confidence_category(confidence)
+        }
+
+    def _generate_initial_report(self, image_path: str, predictions: list) -> str:
         primary = predictions[0]
         differentials = predictions[1:]
 
@@ -441,6 +835,7 @@ DIFFERENTIAL CONSIDERATIONS
                     try:
                         if os.path.exists(analysis.image_path):
                             os.remove(analysis.image_path)
+                        remove_preview(analysis.image_path)
                     except Exception as e:
                         logger.error(f"Error deleting image file: {e}")
                         
@@ -0,0 +1,63 @@
+"""
+Per-stage latency instrumentation.
+
+Wrap a unit of work in ``with stage('name'):`` to observe it in the
+``request_stage_latency_seconds`` histogram. Inside a request the timing is
+also collected on ``flask.g`` so ``app.after_request`` can return it in a
+``Server-Timing`` header.
+"""
+
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+from flask import g, has_request_context
+from prometheus_client import Histogram
+
+STAGE_LATENCY = Histogram(
+    'request_stage_latency_seconds', 'Time spent in each stage of request handling',
+    ['stage'], buckets=[0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+)
+
+model_prediction_latency = Histogram(
+    'model_prediction_latency_seconds',
+    'Time spent processing model predictions',
+    buckets=[0.1, 0.5, 1.0, 2.0, 5.0]
+)
+
+database_operation_latency = Histogram(
+    'database_operation_latency_seconds',
+    'Time spent on database operations',
+    buckets=[0.1, 0.25, 0.5, 1.0, 2.5]
+)
+
+
+def record(name: str, seconds: float) -> None:
+    STAGE_LATENCY.labels(stage=name).observe(seconds)
+    if name == 'forward':
+        model_prediction_latency.observe(seconds)
+    elif name.startswith('db_'):
+        database_operation_latency.observe(seconds)
+
+    if has_request_context():
+        timings = g.setdefault('stage_timings', {})
+        timings[name] = timings.get(name, 0.0) + seconds
+
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def server_timing_header(total: Optional[float] = None) -> Optional[str]:
+    """Format the stages recorded for the current request as a Server-Timing value"""
+    timings = dict(g.get('stage_timings') or {})
+    if total is not None:
+        timings['total'] = total
+    if not timings:
+        return None
+    return ', '.join(f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items())
@@ -0,0 +1,106 @@
+"""
+Test-time augmentation for borderline predictions.
+
+When the single-view top-1 probability is below TTA_THRESHOLD, the image is
+classified again from several views - flips, small rotations and zoomed
+crops - and the softmax probabilities are averaged. Every view is an affine
+transform of the preprocessed tensor, so all of them are produced by one
+batched ``affine_grid`` / ``grid_sample`` call and classified in a single
+forward pass; confident predictions never pay for it.
+
+    TTA_MODE              off (default) or on
+    TTA_THRESHOLD         top-1 probability below which TTA runs (0.70, the
+                          "Low Confidence" band of the report)
+    TTA_ROTATION_DEGREES  rotation of the rotated views (10)
+    TTA_CROP_SCALE        side of the zoomed crops relative to the image (0.88)
+"""
+
+import os
+import math
+import logging
+from typing import Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from prometheus_client import Counter
+
+logger = logging.getLogger(__name__)
+
+TTA_MODE = os.getenv('TTA_MODE', 'off').lower()
+TTA_THRESHOLD = float(os.getenv('TTA_THRESHOLD', '0.70'))
+TTA_ROTATION_DEGREES = float(os.getenv('TTA_ROTATION_DEGREES', '10'))
+TTA_CROP_SCALE = float(os.getenv('TTA_CROP_SCALE', '0.88'))
+
+TTA_RUNS = Counter('tta_runs_total', 'Test-time augmentation runs, by whether the top-1 class changed', ['top1'])
+
+
+def _view_specs(rotation: float, crop: float):
+    """(flip_x, flip_y, degrees, scale, shift_x, shift_y) per view; shifts in [-1, 1] image units"""
+    corner = 1 - crop
+    return [
+        (1, 1, 0, 1, 0, 0),                  # original
+        (-1, 1, 0, 1, 0, 0),                 # horizontal flip
+        (1, -1, 0, 1, 0, 0),                 # vertical flip
+        (1, 1, rotation, 1, 0, 0),
+        (1, 1, -rotation, 1, 0, 0),
+        (1, 1, 0, crop, 0, 0),               # centre crop
+        (1, 1, 0, crop, -corner, -corner),   # top-left crop
+        (-1, 1, 0, crop, corner, corner),    # bottom-right crop, flipped
+    ]
+
+
+class TestTimeAugmentation:
+    def __init__(self, threshold: float = TTA_THRESHOLD, rotation: float = TTA_ROTATION_DEGREES,
+                 crop: float = TTA_CROP_SCALE):
+        self.threshold = threshold
+        specs = torch.tensor(_view_specs(rotation, crop), dtype=torch.float32)
+        flip_x, flip_y, degrees, scale, shift_x, shift_y = specs.unbind(1)
+        radians = degrees * math.pi / 180
+        cos, sin = torch.cos(radians) * scale, torch.sin(radians) * scale
+        # Sampling grid of each view: output coordinates -> input coordinates
+        self.theta = torch.stack([
+            torch.stack([cos * flip_x, -sin, shift_x], dim=1),
+            torch.stack([sin, cos * flip_y, shift_y], dim=1),
+        ], dim=1)
+
+    @property
+    def num_views(self) -> int:
+        return self.theta.shape[0]
+
+    def views(self, image_tensor: torch.Tensor) -> torch.Tensor:
+        """All augmented views of a (1, C, H, W) tensor as one (V, C, H, W) batch"""
+        batch = image_tensor.expand(self.num_views, -1, -1, -1)
+        theta = self.theta.to(image_tensor.device, image_tensor.dtype)
+        grid = F.affine_grid(theta, list(batch.shape), align_corners=False)
+        # Reflection keeps rotated corners skin-coloured instead of zero (mean) padding
+        return F.grid_sample(batch, grid, mode='bilinear', padding_mode='reflection', align_corners=False)
+
+    @torch.inference_mode()
+    def predict(self, model: torch.nn.Module, image_tensor: torch.Tensor,
+                k: int = 3) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Top-k of the probabilities averaged over all views, from one forward pass"""
+        probabilities = F.softmax(model(self.views(image_tensor)), dim=1).mean(dim=0)
+        return torch.topk(probabilities, k=k)
+
+    def refine(self, model, image_tensor, top_prob, top_idx):
+        """Replace a borderline single-view top-k with the TTA one.
+
+        Returns (top_prob, top_idx, info), info describing the TTA run.
+        """
+        single = top_prob[0].item()
+        tta_prob, tta_idx = self.predict(model, image_tensor)
+        changed = tta_idx[0].item() != top_idx[0].item()
+        TTA_RUNS.labels(top1='changed' if changed else 'same').inc()
+        return tta_prob, tta_idx, {
+            'views': self.num_views,
+            'single_view_confidence': single * 100,
+            'top1_changed': changed
+        }
+
+
+def load_tta() -> Optional[TestTimeAugmentation]:
+    if TTA_MODE != 'on':
+        return None
+    tta = TestTimeAugmentation()
+    logger.info(f"Test-time augmentation enabled: {tta.num_views} views below {tta.threshold:.0%} confidence")
+    return tta
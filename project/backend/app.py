@@ -9,30 +9,32 @@ import json
 import time
 import logging
 import stat
-from logging.handlers import RotatingFileHandler
-from pythonjsonlogger import jsonlogger
-from api.skin_analysis import DermatologyAnalyzer, db, ChatMessage, SkinAnalysisResult
+from api.skin_analysis import DermatologyAnalyzer, db, ChatMessage, SkinAnalysisResult, upgrade_schema
 from werkzeug.utils import secure_filename
-from PIL import Image
-import io
-import base64
+from api.images import create_image_preview, cached_preview, write_preview
+from api.ingest import IngestRequest, UploadRejected
 from api.derm_ai_chat import bp as chat_bp
+from api.http_cache import RESOURCE_ANALYSES, check_not_modified, apply_validators, bump_version
+from api.llm_gateway import get_gateway
+from api.timing import stage, server_timing_header
+from api.admin import bp as admin_bp, has_admin_key
+from api.profiling import profiler
+from api.logging_config import configure_logging
+from api.admission import admission, OverloadedError
+from api.image_quality import ImageQualityError
+from api.ratelimit_storage import SQLiteStorage  # registers the sqlite:// limiter storage
+from api.jobs import job_queue, WorkerPool, JobError, PRIORITY_HIGH, PRIORITY_LOW, DONE
+from api.embedding_index import EMBEDDING_STUDENT_JOBS, get_embedding_index
+from api.model_registry import model_watcher, MODEL_REGISTRY_POLL_SECONDS
+from api.shadow import shadow
+from api.analytics import user_summary, backfill_if_empty  # also registers the summary flush hook
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.interval import IntervalTrigger
 
-# Configure logging
-if not os.path.exists('logs'):
-    os.makedirs('logs')
-
-logging.basicConfig(level=logging.INFO)
+# Configure logging: records are queued here and written by a background listener
+configure_logging()
 logger = logging.getLogger(__name__)
-file_handler = RotatingFileHandler('logs/app.log', maxBytes=10485760, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-logger.addHandler(file_handler)
-logger.setLevel(logging.INFO)
 logger.info('DermAI startup')
 
 # Create instance directory if it doesn't exist
@@ -42,6 +44,8 @@ if not os.path.exists(instance_path):
     logger.info(f"Created instance directory at {instance_path}")
 
 app = Flask(__name__)
+# Uploads are hashed and header-checked while the body is parsed (see api/ingest.py)
+app.request_class = IngestRequest
 
 # Initialize Prometheus metrics
 metrics = PrometheusMetrics(app)
@@ -53,31 +57,23 @@ by_endpoint_counter = metrics.counter(
     labels={'endpoint': lambda: request.endpoint}
 )
 
-model_prediction_latency = metrics.histogram(
-    'model_prediction_latency_seconds',
-    'Time spent processing model predictions',
-    buckets=[0.1, 0.5, 1.0, 2.0, 5.0]
-)
-
-database_operation_latency = metrics.histogram(
-    'database_operation_latency_seconds',
-    'Time spent on database operations',
-    buckets=[0.1, 0.25, 0.5, 1.0, 2.5]
-)
-
-# Initialize rate limiter
+# Initialize rate limiter (RATELIMIT_ENABLED=false turns it off, e.g. for load tests)
+app.config['RATELIMIT_ENABLED'] = os.getenv('RATELIMIT_ENABLED', 'true').lower() != 'false'
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
     default_limits=["200 per day", "50 per hour"],
-    storage_uri="memory://"
+    # Counters shared by every worker on the host (see api/ratelimit_storage.py)
+    storage_uri=os.getenv(
+        'RATELIMIT_STORAGE_URI', f"sqlite:///{os.path.join(instance_path, 'ratelimit.db')}"
+    )
 )
 
 # Database configuration
 db_path = os.path.join(instance_path, 'app.db')
 app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['SQLALCHEMY_ECHO'] = True  # Enable SQL logging
+app.config['SQLALCHEMY_ECHO'] = os.getenv('SQLALCHEMY_ECHO', 'false').lower() == 'true'  # SQL logging is synchronous; debug only
 
 # Initialize database with app
 db.init_app(app)
@@ -102,11 +98,20 @@ except Exception as e:
     logger.error(f"Error registering chat blueprint: {e}")
     raise
 
+app.register_blueprint(admin_bp, url_prefix='/admin')
+profiler.init_app(app)
+
+# The LLM reachability probe is started by the serving process (__main__ or the
+# gunicorn worker hooks), never at import: a preloading master must not open
+# connections that its forked workers would inherit. Health checks also start it lazily.
+
 # Initialize the analyzer within app context
 with app.app_context():
     try:
         # Create database tables
         db.create_all()
+        upgrade_schema()
+        backfill_if_empty()
         logger.info("Database tables created successfully")
         
         # Initialize the analyzer
@@ -143,46 +148,6 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_IMAGE_SIZE
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def validate_image(file_path):
-    try:
-        with Image.open(file_path) as img:
-            # Validate image dimensions
-            if any(dim > 4096 for dim in img.size):
-                return False, "Image dimensions too large. Maximum dimension is 4096px."
-            
-            # Validate image format
-            if img.format.lower() not in ['jpeg', 'jpg', 'png']:
-                return False, "Invalid image format. Only JPEG and PNG are supported."
-            
-            # Basic image quality check
-            if img.mode not in ['RGB', 'RGBA']:
-                return False, "Invalid image mode. Only RGB images are supported."
-            
-            return True, None
-    except Exception as e:
-        return False, f"Invalid image file: {str(e)}"
-
-def create_image_preview(file_path, max_size=(800, 800)):
-    try:
-        with Image.open(file_path) as img:
-            # Convert RGBA to RGB if necessary
-            if img.mode == 'RGBA':
-                img = img.convert('RGB')
-            
-            # Resize image while maintaining aspect ratio
-            img.thumbnail(max_size)
-            
-            # Save to bytes
-            img_byte_arr = io.BytesIO()
-            img.save(img_byte_arr, format='JPEG', quality=85)
-            img_byte_arr = img_byte_arr.getvalue()
-            
-            # Convert to base64
-            return base64.b64encode(img_byte_arr).decode()
-    except Exception as e:
-        logger.error(f"Error creating image preview: {str(e)}")
-        return None
-
 def ensure_upload_dir():
     """Ensure upload directory exists and has proper permissions"""
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
@@ -218,81 +183,181 @@ def ensure_upload_dir():
 @limiter.limit("10 per minute")
 def analyze_image():
     """Handle image upload and analysis"""
+    if request.form.get('async', '').lower() == 'true':
+        # Queued uploads are not admitted here; the job workers bound their own concurrency
+        return _enqueue_upload()
+
+    decision = admission.acquire('analyze')
+    if not decision.admitted:
+        return overloaded_response(decision.retry_after)
     try:
-        # Ensure upload directory exists and is writable
-        ensure_upload_dir()
-        
-        if 'image' not in request.files:
-            return jsonify({'success': False, 'error': 'No image file provided'}), 400
-        
-        file = request.files['image']
-        user_id = request.form.get('user_id', 'anonymous')
-        
-        if file.filename == '':
-            return jsonify({'success': False, 'error': 'No selected file'}), 400
-        
-        if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
-            return jsonify({'success': False, 'error': 'Invalid file type. Only PNG and JPEG files are allowed'}), 400
+        return _analyze_upload(enrich=not decision.degrade)
+    finally:
+        admission.release(decision)
 
-        # Generate secure filename with timestamp
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = secure_filename(f"{timestamp}_{file.filename}")
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        
+def overloaded_response(retry_after):
+    response = jsonify({
+        'success': False,
+        'error': 'Service is at capacity, please retry shortly',
+        'retry_after': retry_after,
+        'timestamp': datetime.utcnow().isoformat()
+    })
+    response.status_code = 503
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+def quality_rejected_response(error):
+    """422 with feedback for an image the quality gate refused (see api/image_quality.py)"""
+    return {
+        'success': False,
+        'error': str(error),
+        'quality': error.report.to_dict(),
+        'timestamp': datetime.utcnow().isoformat()
+    }, 422
+
+def _save_upload():
+    """Save the uploaded image once ingestion has accepted it.
+
+    Returns (user_id, filepath, None) on success or (None, None, error_response).
+    """
+    # Ensure upload directory exists and is writable
+    ensure_upload_dir()
+
+    if 'image' not in request.files:
+        return None, None, (jsonify({'success': False, 'error': 'No image file provided'}), 400)
+
+    file = request.files['image']
+    user_id = request.form.get('user_id', 'anonymous')
+
+    if file.filename == '':
+        return None, None, (jsonify({'success': False, 'error': 'No selected file'}), 400)
+
+    if not file.filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+        return None, None, (jsonify({'success': False, 'error': 'Invalid file type. Only PNG and JPEG files are allowed'}), 400)
+
+    # Format, mode and size were checked from the header while the body streamed in
+    ingest = file.stream
+    try:
+        with stage('validate'):
+            header = ingest.finish()
+    except UploadRejected as e:
+        return None, None, (jsonify({'success': False, 'error': e.description}), 400)
+
+    # Generate secure filename with timestamp
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = secure_filename(f"{timestamp}_{file.filename}")
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+
+    with stage('upload_save'):
+        file.save(filepath)
+
+        # Set proper file permissions (644 - rw-r--r--)
+        os.chmod(filepath,
+                stat.S_IRUSR | stat.S_IWUSR |
+                stat.S_IRGRP |
+                stat.S_IROTH)
+
+    logger.info(f"Accepted upload {filename}: {header.format} {header.width}x{header.height}, "
+                f"{ingest.size} bytes, sha256 {ingest.sha256[:16]}")
+    return user_id, filepath, None
+
+def _store_analysis(user_id, filepath, result):
+    """Persist an analysis result, index its embedding and queue its follow-up jobs"""
+    embedding = result.pop('embedding', None)
+    analysis = SkinAnalysisResult(
+        user_id=user_id,
+        image_path=filepath,
+        primary_condition=result['primary_analysis']['condition'],
+        confidence=result['primary_analysis']['confidence'],
+        detailed_analysis=json.dumps(result['detailed_analysis']),
+        model_version=result['report_metadata'].get('model_version'),
+        model_stage=result['report_metadata'].get('model_stage')
+    )
+
+    with stage('db_commit'):
+        db.session.add(analysis)
+        db.session.commit()
+
+    try:
+        job_queue.enqueue('thumbnail', {'image_path': filepath},
+                          priority=PRIORITY_LOW, dedupe_key=f"thumbnail:{filepath}")
+        if result['report_metadata'].get('enrichment_skipped'):
+            # Shed under load: fill in the LLM sections once there is capacity, for this prediction
+            predictions = [result['primary_analysis'], *result['differential_diagnoses']]
+            job_queue.enqueue('enrich', {
+                'analysis_id': analysis.id,
+                'predictions': [[p['condition'], p['confidence']] for p in predictions]
+            })
+    except Exception as e:
+        logger.error(f"Failed to enqueue follow-up jobs for analysis {analysis.id}: {e}")
+
+    _index_embedding(analysis.id, analysis.model_version, embedding)
+    return analysis
+
+def _index_embedding(analysis_id, model_version, embedding):
+    """Add an analysis to the similar-case index of the model version that classified it
+    (see api/embedding_index.py).
+
+    The embedding comes from the classification pass. Images the cascade
+    student answered have none; they wait for ``embeddings_cli.py backfill``
+    unless EMBEDDING_STUDENT_JOBS queues a low-priority job for them.
+    """
+    index = get_embedding_index(model_version or analyzer.model_version)
+    if index is None:
+        return
+    try:
+        if embedding is not None:
+            index.add(analysis_id, embedding)
+        elif EMBEDDING_STUDENT_JOBS:
+            job_queue.enqueue('embed', {'analysis_id': analysis_id},
+                              priority=PRIORITY_LOW, dedupe_key=f"embed:{analysis_id}")
+    except Exception as e:
+        logger.error(f"Failed to index embedding of analysis {analysis_id}: {e}")
+
+def _remove_upload(filepath):
+    if filepath and os.path.exists(filepath):
         try:
-            # Save and validate file
-            file.save(filepath)
-            
-            # Set proper file permissions (644 - rw-r--r--)
-            os.chmod(filepath, 
-                    stat.S_IRUSR | stat.S_IWUSR | 
-                    stat.S_IRGRP | 
-                    stat.S_IROTH)
-            
-            is_valid, error_msg = validate_image(filepath)
-            if not is_valid:
-                os.remove(filepath)
-                return jsonify({'success': False, 'error': error_msg}), 400
+            os.remove(filepath)
+        except Exception as del_e:
+            logger.error(f"Failed to delete file after error: {str(del_e)}")
+
+def _analyze_upload(enrich):
+    filepath = None
+    try:
+        user_id, filepath, error = _save_upload()
+        if error:
+            return error
 
-            # Create preview before analysis
+        # Create preview before analysis
+        with stage('preview'):
             preview = create_image_preview(filepath)
-            
-            # Analyze image
-            result = analyzer.analyze_image(filepath)
-            
-            # Store analysis in database
-            analysis = SkinAnalysisResult(
-                user_id=user_id,
-                image_path=filepath,
-                primary_condition=result['primary_analysis']['condition'],
-                confidence=result['primary_analysis']['confidence'],
-                detailed_analysis=json.dumps(result['detailed_analysis'])
-            )
-            
-            db.session.add(analysis)
-            db.session.commit()
-            
-            # Add analysis ID and preview to result
-            result['id'] = str(analysis.id)
-            if preview:
-                result['image_preview'] = preview
-            
-            return jsonify({
-                'success': True,
-                'result': result,
-                'timestamp': datetime.utcnow().isoformat()
-            })
-            
-        except Exception as e:
-            # Clean up on error
-            if os.path.exists(filepath):
-                try:
-                    os.remove(filepath)
-                except Exception as del_e:
-                    logger.error(f"Failed to delete file after error: {str(del_e)}")
-            raise e
-            
+
+        # Analyze image (LLM enrichment is skipped when shedding load)
+        result = analyzer.analyze_image(filepath, enrich=enrich)
+
+        # Store analysis in database
+        analysis = _store_analysis(user_id, filepath, result)
+
+        # Add analysis ID and preview to result
+        result['id'] = str(analysis.id)
+        if preview:
+            result['image_preview'] = preview
+
+        return jsonify({
+            'success': True,
+            'result': result,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+
+    except OverloadedError as e:
+        _remove_upload(filepath)
+        return overloaded_response(e.retry_after)
+    except ImageQualityError as e:
+        _remove_upload(filepath)
+        return quality_rejected_response(e)
     except Exception as e:
+        # Clean up on error
+        _remove_upload(filepath)
         logger.error(f"Error analyzing image: {str(e)}", exc_info=True)
         return jsonify({
             'success': False,
@@ -300,6 +365,121 @@ def analyze_image():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+async def analyze_image_async(req):
+    """Native async version of analyze_image() served by the ASGI app (see api/asgi_server.py)"""
+    if await req.run(lambda: request.form.get('async', '').lower() == 'true'):
+        return await req.run(_enqueue_upload)
+
+    decision = admission.acquire('analyze')
+    if not decision.admitted:
+        return await req.run(overloaded_response, decision.retry_after)
+    try:
+        return await _analyze_upload_async(req, enrich=not decision.degrade)
+    finally:
+        admission.release(decision)
+
+async def _analyze_upload_async(req, enrich):
+    filepath = None
+    try:
+        user_id, filepath, error = await req.run(_save_upload)
+        if error:
+            return error
+
+        def make_preview():
+            with stage('preview'):
+                return create_image_preview(filepath)
+        preview = await req.run(make_preview)
+
+        # Inference runs on the bounded inference pool; the LLM call is awaited
+        result = await analyzer.analyze_image_async(filepath, enrich=enrich, offload=req.run_inference)
+
+        analysis = await req.run(_store_analysis, user_id, filepath, result)
+
+        result['id'] = str(analysis.id)
+        if preview:
+            result['image_preview'] = preview
+
+        return {
+            'success': True,
+            'result': result,
+            'timestamp': datetime.utcnow().isoformat()
+        }
+
+    except OverloadedError as e:
+        await req.run(_remove_upload, filepath)
+        return await req.run(overloaded_response, e.retry_after)
+    except ImageQualityError as e:
+        await req.run(_remove_upload, filepath)
+        return quality_rejected_response(e)
+    except Exception as e:
+        await req.run(_remove_upload, filepath)
+        logger.error(f"Error analyzing image: {str(e)}", exc_info=True)
+        return {
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }, 500
+
+def _enqueue_upload():
+    """Save the upload and analyze it in the background; poll /api/jobs/<id> for the result"""
+    filepath = None
+    try:
+        user_id, filepath, error = _save_upload()
+        if error:
+            return error
+
+        job_id = job_queue.enqueue('analyze', {'image_path': filepath, 'user_id': user_id},
+                                   priority=PRIORITY_HIGH)
+        response = jsonify({
+            'success': True,
+            'job_id': str(job_id),
+            'status': 'queued',
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        response.status_code = 202
+        response.headers['Location'] = f"/api/jobs/{job_id}?user_id={user_id}"
+        return response
+
+    except Exception as e:
+        _remove_upload(filepath)
+        logger.error(f"Error queueing image analysis: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    try:
+        job = job_queue.get(int(job_id)) if job_id.isdigit() else None
+        user_id = request.args.get('user_id', 'anonymous')
+        if not job or job['payload'].get('user_id') != user_id:
+            return jsonify({
+                "success": False,
+                "error": "Job not found",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 404
+
+        return jsonify({
+            "success": True,
+            "job_id": str(job['id']),
+            "kind": job['kind'],
+            "status": job['status'],
+            "attempts": job['attempts'],
+            "result": job['result'],
+            "error": job['last_error'] if job['status'] == 'dead' else None,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Error fetching job status: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }), 500
+
 @app.route('/api/init', methods=['POST'])
 def initialize_system():
     try:
@@ -348,8 +528,12 @@ def health_check():
         return jsonify({
             'status': 'healthy' if (model_loaded and db_status) else 'unhealthy',
             'model_loaded': model_loaded,
+            'model_version': analyzer.model_version,
             'database_connected': db_status,
-            'upload_folder': os.path.exists(app.config['UPLOAD_FOLDER'])
+            'llm_backend': get_gateway().connectivity()['status'],
+            'upload_folder': os.path.exists(app.config['UPLOAD_FOLDER']),
+            'cascade': dict(analyzer.cascade.stats(), active=analyzer.active_cascade is not None)
+                       if analyzer.cascade is not None else None
         })
     except Exception as e:
         logger.error(f"Health check error: {str(e)}")
@@ -358,38 +542,49 @@ def health_check():
             'error': str(e)
         }), 500
 
+def _stored_preview(image_path):
+    """Precomputed preview if the thumbnail job has run, otherwise render it now and queue the job"""
+    try:
+        with stage('preview'):
+            preview = cached_preview(image_path)
+            if preview is None and os.path.exists(image_path):
+                preview = create_image_preview(image_path)
+                job_queue.enqueue('thumbnail', {'image_path': image_path},
+                                  priority=PRIORITY_LOW, dedupe_key=f"thumbnail:{image_path}")
+        return preview
+    except Exception as e:
+        logger.warning(f"Failed to create image preview: {e}")
+        return None
+
 @app.route('/api/analysis/history', methods=['GET'])
 def get_analysis_history():
     try:
         user_id = request.args.get('user_id', 'anonymous')
-        analyses = SkinAnalysisResult.query.filter_by(user_id=user_id).order_by(SkinAnalysisResult.timestamp.desc()).all()
+
+        not_modified, etag, last_modified = check_not_modified(user_id, RESOURCE_ANALYSES)
+        if not_modified:
+            return not_modified
+
+        with stage('db_query'):
+            analyses = SkinAnalysisResult.query.filter_by(user_id=user_id).order_by(SkinAnalysisResult.timestamp.desc()).all()
         
         history = []
         for analysis in analyses:
-            result = {
-                'id': str(analysis.id),
-                'timestamp': analysis.timestamp.isoformat(),
-                'primary_condition': analysis.primary_condition,
-                'confidence': analysis.confidence,
-                'detailed_analysis': json.loads(analysis.detailed_analysis)
-            }
+            result = analysis.to_dict()
             
             # Add image preview if available
-            try:
-                if os.path.exists(analysis.image_path):
-                    preview = create_image_preview(analysis.image_path)
-                    if preview:
-                        result['image_preview'] = preview
-            except Exception as e:
-                logger.warning(f"Failed to create image preview: {e}")
+            preview = _stored_preview(analysis.image_path)
+            if preview:
+                result['image_preview'] = preview
             
             history.append(result)
         
-        return jsonify({
+        response = jsonify({
             'success': True,
             'history': history,
             'timestamp': datetime.utcnow().isoformat()
         })
+        return apply_validators(response, etag, last_modified)
         
     except Exception as e:
         logger.error(f"Error fetching analysis history: {e}", exc_info=True)
@@ -399,6 +594,45 @@ def get_analysis_history():
             'timestamp': datetime.utcnow().isoformat()
         }), 500
 
+@app.route('/api/analysis/summary', methods=['GET'])
+def get_analysis_summary():
+    """Per-condition counts, average confidence and monthly trend, from the precomputed tables"""
+    try:
+        user_id = request.args.get('user_id', 'anonymous')
+        try:
+            months = int(request.args.get('months', 12))
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "months must be an integer",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 400
+
+        # The monthly window also moves when a new month starts
+        not_modified, etag, last_modified = check_not_modified(
+            user_id, RESOURCE_ANALYSES, extra=f"summary:{months}:{datetime.utcnow():%Y-%m}"
+        )
+        if not_modified:
+            return not_modified
+
+        with stage('db_query'):
+            summary = user_summary(user_id, months)
+
+        response = jsonify({
+            'success': True,
+            'summary': summary,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        return apply_validators(response, etag, last_modified)
+
+    except Exception as e:
+        logger.error(f"Error fetching analysis summary: {e}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat()
+        }), 500
+
 @app.route('/api/analysis/delete', methods=['POST'])
 def delete_analysis():
     try:
@@ -487,19 +721,29 @@ def system_status():
                 'message': f'Model error: {str(e)}'
             }
 
-        # Check chat service
+        # Check chat service using the last background connectivity probe
         try:
-            groq_key = os.getenv('GROQ_API_KEY')
-            if groq_key:
+            connectivity = get_gateway().connectivity()
+            if connectivity['status'] == 'reachable':
                 status['chat_service'] = {
                     'status': 'healthy',
-                    'message': 'Chat service configured'
+                    'message': f"LLM backend reachable ({connectivity['latency_ms']} ms)"
                 }
-            else:
+            elif connectivity['status'] == 'unknown':
+                status['chat_service'] = {
+                    'status': 'unknown',
+                    'message': 'LLM connectivity check pending'
+                }
+            elif connectivity['status'] == 'unconfigured':
                 status['chat_service'] = {
                     'status': 'error',
                     'message': 'Missing GROQ API key'
                 }
+            else:
+                status['chat_service'] = {
+                    'status': 'error',
+                    'message': f"LLM backend unreachable: {connectivity['error']}"
+                }
         except Exception as e:
             status['chat_service'] = {
                 'status': 'error',
@@ -511,7 +755,8 @@ def system_status():
         return jsonify({
             'success': overall_status,
             'timestamp': datetime.utcnow().isoformat(),
-            'services': status
+            'services': status,
+            'load': admission.stats()
         })
 
     except Exception as e:
@@ -543,10 +788,17 @@ def get_analysis_details(analysis_id):
                 "timestamp": datetime.utcnow().isoformat()
             }), 400
 
-        analysis = SkinAnalysisResult.query.filter_by(
-            id=analysis_id,
-            user_id=user_id
-        ).first()
+        not_modified, etag, last_modified = check_not_modified(
+            user_id, RESOURCE_ANALYSES, extra=str(analysis_id)
+        )
+        if not_modified:
+            return not_modified
+
+        with stage('db_query'):
+            analysis = SkinAnalysisResult.query.filter_by(
+                id=analysis_id,
+                user_id=user_id
+            ).first()
 
         if not analysis:
             return jsonify({
@@ -562,7 +814,9 @@ def get_analysis_details(analysis_id):
             "confidence": analysis.confidence,
             "detailed_analysis": json.loads(analysis.detailed_analysis),
             "report_metadata": {
-                "timestamp": analysis.timestamp.isoformat()
+                "timestamp": analysis.timestamp.isoformat(),
+                "model_version": analysis.model_version,
+                "model_stage": analysis.model_stage
             },
             "primary_analysis": {
                 "condition": analysis.primary_condition,
@@ -571,19 +825,16 @@ def get_analysis_details(analysis_id):
         }
 
         # Try to get the image preview if it exists
-        try:
-            if os.path.exists(analysis.image_path):
-                image_preview = create_image_preview(analysis.image_path)
-                if image_preview:
-                    result["image_preview"] = image_preview
-        except Exception as e:
-            logger.warning(f"Failed to create image preview: {e}")
+        image_preview = _stored_preview(analysis.image_path)
+        if image_preview:
+            result["image_preview"] = image_preview
 
-        return jsonify({
+        response = jsonify({
             "success": True,
             "result": result,
             "timestamp": datetime.utcnow().isoformat()
         })
+        return apply_validators(response, etag, last_modified)
 
     except Exception as e:
         logger.error(f"Error retrieving analysis details: {e}", exc_info=True)
@@ -593,6 +844,126 @@ def get_analysis_details(analysis_id):
             "timestamp": datetime.utcnow().isoformat()
         }), 500
 
+SIMILAR_MAX_RESULTS = 50
+
+@app.route('/api/analysis/<analysis_id>/similar', methods=['GET'])
+def get_similar_analyses(analysis_id):
+    """Past analyses whose images look most like this one.
+
+    Searches the user's own analyses; with scope=all and the admin API key,
+    the whole archive (clinician review).
+    """
+    try:
+        user_id = request.args.get('user_id')
+        if not user_id:
+            return jsonify({
+                "success": False,
+                "error": "Missing required parameter: user_id",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 400
+
+        try:
+            analysis_id = int(analysis_id)
+            k = min(max(int(request.args.get('k', 10)), 1), SIMILAR_MAX_RESULTS)
+        except ValueError:
+            return jsonify({
+                "success": False,
+                "error": "Invalid analysis ID or k",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 400
+
+        scope = request.args.get('scope', 'user')
+        if scope not in ('user', 'all'):
+            return jsonify({
+                "success": False,
+                "error": "scope must be 'user' or 'all'",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 400
+        if scope == 'all' and not has_admin_key():
+            return jsonify({
+                "success": False,
+                "error": "Admin API key required to search all analyses",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 403
+
+        # Embeddings are only comparable within one model version: search the served one
+        index = get_embedding_index(analyzer.model_version)
+        if index is None:
+            return jsonify({
+                "success": False,
+                "error": "Similar-case search is disabled",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 503
+
+        with stage('db_query'):
+            analysis = SkinAnalysisResult.query.filter_by(id=analysis_id, user_id=user_id).first()
+        if not analysis:
+            return jsonify({
+                "success": False,
+                "error": "Analysis not found",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 404
+
+        query = index.get(analysis_id)
+        if query is None:
+            return jsonify({
+                "success": False,
+                "error": "Analysis has not been indexed yet",
+                "timestamp": datetime.utcnow().isoformat()
+            }), 404
+
+        restrict_to = None
+        if scope == 'user':
+            with stage('db_query'):
+                restrict_to = [row.id for row in
+                               db.session.query(SkinAnalysisResult.id).filter_by(user_id=user_id)]
+
+        with stage('similar'):
+            matches = index.search(query, k=k, restrict_to=restrict_to, exclude=[analysis_id])
+
+        with stage('db_query'):
+            found = {a.id: a for a in SkinAnalysisResult.query.filter(
+                SkinAnalysisResult.id.in_([match_id for match_id, _ in matches]))}
+
+        similar = []
+        for match_id, score in matches:
+            match = found.get(match_id)
+            if match is None:
+                continue  # deleted since it was indexed
+            result = match.to_dict()
+            result['similarity'] = round(score, 4)
+            if scope == 'all':
+                result['user_id'] = match.user_id
+            preview = _stored_preview(match.image_path)
+            if preview:
+                result['image_preview'] = preview
+            similar.append(result)
+
+        return jsonify({
+            "success": True,
+            "analysis_id": str(analysis_id),
+            "scope": scope,
+            "similar": similar,
+            "timestamp": datetime.utcnow().isoformat()
+        })
+
+    except Exception as e:
+        logger.error(f"Error finding similar analyses: {e}", exc_info=True)
+        return jsonify({
+            "success": False,
+            "error": str(e),
+            "timestamp": datetime.utcnow().isoformat()
+        }), 500
+
+@app.errorhandler(UploadRejected)
+def upload_rejected_handler(e):
+    logger.info(f"Upload rejected ({e.reason}): {e.description}")
+    return jsonify({
+        "success": False,
+        "error": e.description,
+        "timestamp": datetime.utcnow().isoformat()
+    }), 400
+
 @app.errorhandler(429)
 def ratelimit_handler(e):
     logger.warning(f"Rate limit exceeded for IP {get_remote_address()}")
@@ -604,17 +975,20 @@ def ratelimit_handler(e):
 
 @app.before_request
 def before_request():
-    request._start_time = datetime.utcnow()
+    request._start_time = time.perf_counter()
 
 @app.after_request
 def after_request(response):
     if hasattr(request, '_start_time'):
-        elapsed = datetime.utcnow() - request._start_time
+        elapsed = time.perf_counter() - request._start_time
+        timing = server_timing_header(total=elapsed)
+        if timing:
+            response.headers['Server-Timing'] = timing
         logger.info('Request completed', extra={
             'method': request.method,
             'path': request.path,
             'status': response.status_code,
-            'duration': elapsed.total_seconds(),
+            'duration': elapsed,
             'ip': request.remote_addr
         })
     return response
@@ -625,13 +999,12 @@ def init_app():
         # Create database tables
         with app.app_context():
             db.create_all()
+            upgrade_schema()
+            backfill_if_empty()
             logger.info("Database tables created successfully")
 
-        # Initialize the analyzer
-        global analyzer
-        analyzer = DermatologyAnalyzer()
-        
-        # Initialize database-related operations
+        # The analyzer (and its model) was already created at import time;
+        # only run the database-related initialization here
         analyzer.initialize_with_app(app)
         
         # Ensure upload directory exists
@@ -662,12 +1035,79 @@ def init_app():
         logger.error(f"Application initialization failed: {e}", exc_info=True)
         return False
 
+# ----- background jobs -----
+JOB_RETENTION_DAYS = int(os.getenv('JOB_RETENTION_DAYS', '7'))
+
+@job_queue.handler('analyze')
+def run_analyze_job(payload, job):
+    if not os.path.exists(payload['image_path']):
+        raise JobError(f"Image not found: {payload['image_path']}")
+    try:
+        result = analyzer.analyze_image(payload['image_path'])
+    except ImageQualityError as e:
+        # Final: retrying cannot make the photo better
+        _remove_upload(payload['image_path'])
+        return quality_rejected_response(e)[0]
+    analysis = _store_analysis(payload['user_id'], payload['image_path'], result)
+    result['id'] = str(analysis.id)
+    return result
+
+@job_queue.handler('enrich')
+def run_enrich_job(payload, job):
+    analysis = SkinAnalysisResult.query.get(payload['analysis_id'])
+    if analysis is None:
+        return {'skipped': 'analysis deleted'}
+    # Jobs queued before the differentials were carried in the payload only have the primary
+    predictions = payload.get('predictions') or [[analysis.primary_condition, analysis.confidence]]
+    sections = analyzer.enrich_analysis(analysis.image_path, predictions)
+    if sections is None:
+        raise JobError("LLM enrichment unavailable")
+    analysis.detailed_analysis = json.dumps(sections)
+    # Updates are not seen by the insert/delete flush hook; invalidate cached history explicitly
+    bump_version(analysis.user_id, RESOURCE_ANALYSES)
+    db.session.commit()
+    return {'analysis_id': analysis.id}
+
+@job_queue.handler('thumbnail')
+def run_thumbnail_job(payload, job):
+    if not os.path.exists(payload['image_path']):
+        return {'skipped': 'image deleted'}
+    return {'preview': write_preview(payload['image_path'])}
+
+@job_queue.handler('embed')
+def run_embed_job(payload, job):
+    if get_embedding_index(analyzer.model_version) is None:
+        return {'skipped': 'embedding index disabled'}
+    analysis = SkinAnalysisResult.query.get(payload['analysis_id'])
+    if analysis is None:
+        return {'skipped': 'analysis deleted'}
+    if not os.path.exists(analysis.image_path):
+        return {'skipped': 'image deleted'}
+    # The version may have changed since the job was queued; index under the one that embedded it
+    model_version, embedding = analyzer.embed(analysis.image_path)
+    get_embedding_index(model_version).add(analysis.id, embedding)
+    return {'analysis_id': analysis.id, 'model_version': model_version}
+
+@job_queue.handler('retention')
+def run_retention_job(payload, job):
+    analyzer._cleanup_old_records(payload.get('days_to_keep', 30))
+    purged = job_queue.purge(DONE, older_than_seconds=JOB_RETENTION_DAYS * 86400)
+    return {'jobs_purged': purged}
+
+def start_job_workers(threads=None):
+    """Run queued jobs on background threads of this process"""
+    workers = WorkerPool(job_queue, app, threads=threads or int(os.getenv('JOB_WORKER_THREADS', '1')))
+    workers.start()
+    return workers
+
 def scheduled_cleanup():
     """Periodic cleanup and health check task"""
     with app.app_context():
         try:
-            # Cleanup old records
-            analyzer._cleanup_old_records()
+            # Cleanup old records in a job: one run per day even with several schedulers
+            job_queue.enqueue('retention', {'days_to_keep': 30},
+                              priority=PRIORITY_LOW,
+                              dedupe_key=f"retention:{datetime.utcnow().date().isoformat()}")
             
             # Check database connections
             ChatMessage.query.first()
@@ -692,6 +1132,49 @@ def start_scheduler():
     )
     scheduler.start()
     logger.info("Background scheduler started")
+    return scheduler
+
+_worker_services = {}
+
+def start_worker_services(scheduler=True):
+    """Warm up the model and start this process's background threads: the LLM
+    probe, the model registry watcher, the shadow evaluator, JOB_WORKER_THREADS
+    job workers and (optionally) the scheduler.
+
+    Called by whichever server runs the app (__main__, the gunicorn worker hooks
+    or the ASGI lifespan); only the first call in a process has an effect.
+    """
+    if _worker_services.get('pid') == os.getpid():
+        return _worker_services
+    _worker_services.clear()
+    _worker_services['pid'] = os.getpid()
+
+    elapsed = analyzer.warmup()
+    logger.info(f"Process {os.getpid()} warmed up (last forward pass {elapsed * 1000:.0f} ms)")
+
+    get_gateway().start_probe()  # Check LLM reachability in the background
+    if MODEL_REGISTRY_POLL_SECONDS > 0:
+        model_watcher.start()  # Hot-swap to a newly activated model version
+    shadow.start()  # No-op unless SHADOW_MODEL_VERSION names a candidate
+
+    job_threads = int(os.getenv('JOB_WORKER_THREADS', '1'))
+    if job_threads > 0:
+        _worker_services['jobs'] = start_job_workers(job_threads)
+    if scheduler:
+        _worker_services['scheduler'] = start_scheduler()
+    return _worker_services
+
+def stop_worker_services():
+    if _worker_services.get('pid') != os.getpid():
+        return
+    model_watcher.stop()
+    shadow.stop()
+    if 'scheduler' in _worker_services:
+        _worker_services['scheduler'].shutdown(wait=False)
+    if 'jobs' in _worker_services:
+        # Jobs still running are picked up again once their lease expires
+        _worker_services['jobs'].stop(timeout=5)
+    _worker_services.clear()
 
 # Initialize upload directory on startup
 try:
@@ -702,7 +1185,7 @@ except Exception as e:
 
 if __name__ == '__main__':
     if init_app():
-        start_scheduler()  # Start the background scheduler
+        start_worker_services()  # LLM probe, job workers and the background scheduler
         app.run(debug=True, port=5002)
     else:
         logger.error("Failed to initialize application. Exiting...")
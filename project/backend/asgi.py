@@ -0,0 +1,24 @@
+"""
+ASGI entry point: native async chat and analysis, everything else via Flask.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5002
+
+or, with the gunicorn production profile (preloaded model, one scheduler):
+
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+See api/asgi_server.py for how native handlers and the Flask app are combined.
+"""
+
+from app import (app as flask_app, limiter, init_app, analyze_image_async,
+                 start_worker_services, stop_worker_services)
+from api.asgi_server import AsyncDispatcher
+from api.derm_ai_chat import chat_async
+
+if not init_app():
+    raise RuntimeError("Failed to initialize application")
+
+app = AsyncDispatcher(flask_app, on_startup=[start_worker_services], on_shutdown=[stop_worker_services],
+                     limiter=limiter)
+app.route('/api/analyze')(analyze_image_async)
+app.route('/chat/chat')(chat_async)
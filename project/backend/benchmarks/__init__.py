@@ -0,0 +1,7 @@
+"""
+Micro-benchmarks for the analysis and chat hot paths.
+
+Run from the backend directory:
+
+    python -m benchmarks.run --output results.json --baseline benchmarks/baseline.json
+"""
@@ -0,0 +1,227 @@
+"""
+Chat capacity benchmark: the gthread WSGI deployment against the ASGI one.
+
+Both modes run as one gunicorn worker in front of an in-process fake LLM with
+a fixed latency, so throughput is bounded by how many upstream calls a worker
+can keep in flight rather than by the model or the network:
+
+    python -m benchmarks.async_chat --concurrency 16,64,256 --duration 15
+    python -m benchmarks.async_chat --modes asgi --llm-latency fixed:2.0 --output async.json
+
+Each concurrency level runs that many closed-loop clients (distinct user ids)
+for --duration seconds. Chat turns are written to instance/app.db under the
+user ids bench-async-*; they are deleted when the run ends.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import asyncio
+import argparse
+import threading
+import subprocess
+from typing import Dict, List
+
+import httpx
+
+from benchmarks.core import format_seconds
+from loadtest.fake_llm import FakeLLMConfig, make_server
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DB_PATH = os.path.join(BACKEND_DIR, 'instance', 'app.db')
+USER_PREFIX = 'bench-async-'
+
+QUESTIONS = [
+    "How do I treat a mild fungal infection?",
+    "Is it normal for eczema to flare up in winter?",
+    "What sunscreen should I use for sensitive skin?",
+    "When should I see a dermatologist about a mole?",
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _server_env(llm_url: str, pythonpath: str = None) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        'LLM_BACKEND_URL': llm_url,
+        'RATELIMIT_ENABLED': 'false',
+        'CHAT_ANSWER_CACHE_ENABLED': '0',
+        # Measure how requests are held, not the gateway's own concurrency cap
+        'LLM_MAX_CONCURRENCY': '4096',
+        'LLM_ASYNC_MAX_CONCURRENCY': '4096',
+        'GUNICORN_WORKERS': '1',
+        'GUNICORN_MAX_REQUESTS': '0',
+        'JOB_WORKER_THREADS': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    if pythonpath:
+        env['PYTHONPATH'] = os.pathsep.join(filter(None, [pythonpath, env.get('PYTHONPATH')]))
+    return env
+
+
+def start_server(mode: str, app_spec: str, port: int, threads: int, env: Dict[str, str]) -> subprocess.Popen:
+    cmd = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}']
+    if mode == 'wsgi':
+        cmd += ['--threads', str(threads)]
+    else:
+        env = dict(env, GUNICORN_WORKER_CLASS='uvicorn.workers.UvicornWorker')
+    return subprocess.Popen(cmd + [app_spec], cwd=BACKEND_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 180.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with status {proc.returncode}")
+        try:
+            if httpx.get(f"{url}/api/health", timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {url} not ready after {timeout:.0f}s")
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+
+async def drive(url: str, concurrency: int, duration: float) -> dict:
+    """Closed loop: each client sends its next message as soon as the last one is answered"""
+    latencies: List[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=url, timeout=120, limits=limits) as client:
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        stop_at = started + duration
+
+        async def user(index: int):
+            nonlocal errors
+            n = 0
+            while loop.time() < stop_at:
+                payload = {'message': f"{QUESTIONS[n % len(QUESTIONS)]} ({index}-{n})",
+                           'user_id': f"{USER_PREFIX}{index}"}
+                start = time.perf_counter()
+                try:
+                    r = await client.post('/chat/chat', json=payload)
+                    ok = r.status_code == 200 and r.json().get('success')
+                except (httpx.HTTPError, ValueError):
+                    ok = False
+                if ok:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+                n += 1
+
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+        elapsed = loop.time() - started
+
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] if ordered else None
+
+    return {
+        'concurrency': concurrency,
+        'completed': len(ordered),
+        'errors': errors,
+        'elapsed_s': elapsed,
+        'requests_per_s': len(ordered) / elapsed,
+        'latency_s': {'p50': pct(50), 'p99': pct(99), 'max': ordered[-1] if ordered else None},
+    }
+
+
+def cleanup_db() -> None:
+    if not os.path.exists(DB_PATH):
+        return
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    try:
+        for table in ('chat_message', 'conversation_summary', 'resource_version'):
+            conn.execute(f"DELETE FROM {table} WHERE user_id LIKE ?", (USER_PREFIX + '%',))
+        conn.commit()
+    except sqlite3.OperationalError:
+        pass  # tables not created yet
+    finally:
+        conn.close()
+
+
+def run(modes: List[str], apps: Dict[str, str], levels: List[int], duration: float,
+        threads: int, llm_latency: str, pythonpath: str = None) -> dict:
+    llm = make_server('127.0.0.1', _free_port(), FakeLLMConfig(latency=llm_latency))
+    threading.Thread(target=llm.serve_forever, daemon=True).start()
+    env = _server_env(f"http://127.0.0.1:{llm.server_address[1]}/v1", pythonpath)
+
+    results = {'llm_latency': llm_latency, 'duration_s': duration, 'wsgi_threads': threads, 'modes': {}}
+    try:
+        for mode in modes:
+            port = _free_port()
+            url = f"http://127.0.0.1:{port}"
+            proc = start_server(mode, apps[mode], port, threads, env)
+            try:
+                wait_ready(url, proc)
+                results['modes'][mode] = [asyncio.run(drive(url, c, duration)) for c in levels]
+            finally:
+                stop_server(proc)
+    finally:
+        llm.shutdown()
+        llm.server_close()
+        cleanup_db()
+    return results
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Chat throughput: gthread WSGI vs ASGI')
+    parser.add_argument('--modes', default='wsgi,asgi', help='Comma-separated subset of wsgi,asgi')
+    parser.add_argument('--concurrency', default='16,64,256', help='Comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=15.0, help='Seconds per concurrency level')
+    parser.add_argument('--threads', type=int, default=4, help='gthread threads for the WSGI worker')
+    parser.add_argument('--llm-latency', default='fixed:1.0', help='Fake LLM latency spec')
+    parser.add_argument('--wsgi-app', default='wsgi:app')
+    parser.add_argument('--asgi-app', default='asgi:app')
+    parser.add_argument('--pythonpath', help='Prepended to PYTHONPATH of the servers (for alternative app modules)')
+    parser.add_argument('--output', help='Write the result JSON here')
+    args = parser.parse_args(argv)
+
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+    if set(modes) - {'wsgi', 'asgi'}:
+        parser.error("--modes accepts wsgi and asgi")
+    levels = [int(c) for c in args.concurrency.split(',')]
+
+    result = run(modes, {'wsgi': args.wsgi_app, 'asgi': args.asgi_app}, levels,
+                 args.duration, args.threads, args.llm_latency, args.pythonpath)
+
+    print(f"LLM latency {result['llm_latency']}, {result['duration_s']:.0f}s per level, "
+          f"WSGI threads {result['wsgi_threads']}")
+    for mode, rows in result['modes'].items():
+        print(f"{mode}:")
+        for row in rows:
+            lat = row['latency_s']
+            p50 = format_seconds(lat['p50']) if lat['p50'] is not None else '-'
+            p99 = format_seconds(lat['p99']) if lat['p99'] is not None else '-'
+            print(f"  {row['concurrency']:>5} clients: {row['requests_per_s']:8.1f} req/s, "
+                  f"p50 {p50}, p99 {p99}, {row['errors']} error(s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
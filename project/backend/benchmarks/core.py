@@ -0,0 +1,117 @@
+"""
+Timing, result and baseline-comparison helpers for the benchmark runner.
+"""
+
+import gc
+import json
+import time
+import statistics
+from typing import Callable, Dict, List, Optional
+
+# Each measured sample runs the case enough times to take at least this long
+MIN_SAMPLE_SECONDS = 0.05
+
+
+class Case:
+    """A named benchmark; setup() returns the zero-argument callable to time.
+
+    If reset is given it runs, untimed, before every call (e.g. to re-seed
+    rows a destructive case deletes) and each sample is a single call.
+    """
+
+    def __init__(self, name: str, setup: Callable[[], Callable[[], object]],
+                 group: str, repeat: int = 7, items: int = 1, slow: bool = False,
+                 reset: Optional[Callable[[], None]] = None):
+        self.name = name
+        self.setup = setup
+        self.group = group
+        self.repeat = repeat
+        self.items = items
+        self.slow = slow
+        self.reset = reset
+
+
+def _calibrate(fn: Callable[[], object]) -> int:
+    """Number of calls per sample so that one sample takes MIN_SAMPLE_SECONDS"""
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= MIN_SAMPLE_SECONDS or number >= 1 << 16:
+            return number
+        number *= 2 if elapsed == 0 else max(2, min(10, int(MIN_SAMPLE_SECONDS / elapsed) + 1))
+
+
+def measure(case: Case, repeat: Optional[int] = None) -> Dict[str, object]:
+    fn = case.setup()
+    number = 1 if case.reset else _calibrate(fn)
+    samples: List[float] = []
+
+    # GC pauses are noise here; the hot paths allocate little that survives
+    gc_was_enabled = gc.isenabled()
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(repeat or case.repeat):
+            if case.reset:
+                case.reset()
+            start = time.perf_counter()
+            for _ in range(number):
+                fn()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    samples.sort()
+    median = statistics.median(samples)
+    return {
+        'group': case.group,
+        'median_s': median,
+        'min_s': samples[0],
+        'max_s': samples[-1],
+        'p95_s': samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))],
+        'stdev_s': statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        'samples': len(samples),
+        'calls_per_sample': number,
+        'items': case.items,
+        'items_per_s': case.items / median if median else None
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict],
+            threshold: float) -> List[Dict[str, object]]:
+    """Compare medians against the baseline; ratio > 1 + threshold is a regression"""
+    rows = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            rows.append({'name': name, 'status': 'new', 'ratio': None})
+            continue
+        ratio = current['median_s'] / previous['median_s'] if previous['median_s'] else None
+        if ratio is None:
+            status = 'unknown'
+        elif ratio > 1 + threshold:
+            status = 'regression'
+        elif ratio < 1 / (1 + threshold):
+            status = 'improvement'
+        else:
+            status = 'ok'
+        rows.append({'name': name, 'status': status, 'ratio': ratio,
+                     'baseline_median_s': previous['median_s'], 'median_s': current['median_s']})
+    return rows
+
+
+def load_results(path: str) -> Dict[str, Dict]:
+    with open(path) as f:
+        return json.load(f)['results']
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds >= 1:
+        return f"{seconds:.3f} s"
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.1f} us"
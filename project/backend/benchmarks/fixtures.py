@@ -0,0 +1,130 @@
+"""
+Benchmark fixtures: the upload corpus, an offline analyzer with a stubbed LLM
+backend, and throwaway SQLite databases seeded with analysis history.
+"""
+
+import os
+import json
+import random
+import tempfile
+from datetime import datetime, timedelta
+from typing import List
+
+import torch
+from flask import Flask
+
+from api.llm_gateway import CompletionBackend, LLMGateway
+from api.skin_analysis import DermatologyAnalyzer, SkinDiseaseModel, SkinAnalysisResult, db
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(BACKEND_DIR, 'static', 'uploads')
+
+CANNED_ANALYSIS = """1. CONDITION OVERVIEW
+• A common superficial fungal infection of the skin
+• Spreads through direct contact with infected people, animals or surfaces
+2. KEY SYMPTOMS
+• Ring-shaped, scaly, red patch with a clearer centre
+• Itching and mild burning around the border
+3. TREATMENT APPROACHES
+• Topical antifungal cream applied twice daily for 2-4 weeks
+• Oral antifungals for extensive or resistant infection
+4. PREVENTION GUIDELINES
+• Keep skin clean and dry
+• Do not share towels, clothing or combs
+5. MEDICAL ATTENTION INDICATORS
+• No improvement after two weeks of treatment
+• Spreading redness, fever or pus
+"""
+
+DETAILED_ANALYSIS = json.dumps({
+    'overview': ['A common superficial fungal infection of the skin'],
+    'symptoms': ['Ring-shaped, scaly, red patch with a clearer centre', 'Itching and mild burning'],
+    'treatment': ['Topical antifungal cream applied twice daily for 2-4 weeks'],
+    'prevention': ['Keep skin clean and dry', 'Do not share towels, clothing or combs'],
+    'warning': ['No improvement after two weeks of treatment', 'Spreading redness, fever or pus']
+})
+
+
+def corpus_images(limit: int = 0) -> List[str]:
+    """Sorted image paths from static/uploads (deterministic order across runs)"""
+    names = sorted(
+        n for n in os.listdir(CORPUS_DIR)
+        if n.lower().endswith(('.png', '.jpg', '.jpeg'))
+    )
+    paths = [os.path.join(CORPUS_DIR, n) for n in names]
+    return paths[:limit] if limit else paths
+
+
+class StubBackend(CompletionBackend):
+    """Completion backend that returns a canned analysis without network I/O"""
+    name = 'stub'
+
+    def complete(self, messages, model, temperature, max_tokens, timeout):
+        return CANNED_ANALYSIS
+
+    def ping(self, timeout):
+        return None
+
+
+class OfflineAnalyzer(DermatologyAnalyzer):
+    """DermatologyAnalyzer with randomly initialised weights and a stub LLM.
+
+    Timing does not depend on the weight values, so the production checkpoint
+    (and the ImageNet download) is not needed.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.llm = LLMGateway(backend=StubBackend())
+
+    def _initialize_model(self) -> None:
+        torch.manual_seed(0)
+        model = SkinDiseaseModel(num_classes=len(self.class_names), pretrained=False).to(self.device)
+        self._activate('offline', model.eval())
+
+
+def make_db_app(path: str) -> Flask:
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+
+def temp_db_path() -> str:
+    fd, path = tempfile.mkstemp(prefix='derm_bench_', suffix='.db')
+    os.close(fd)
+    return path
+
+
+def seed_analyses(app: Flask, rows: int, user_id: str = 'bench-user',
+                  old_fraction: float = 0.0, days_old: int = 60) -> None:
+    """Insert rows analysis results for user_id; old_fraction of them older than days_old"""
+    rng = random.Random(rows)
+    now = datetime.utcnow()
+    old_rows = int(rows * old_fraction)
+
+    records = []
+    for i in range(rows):
+        age = timedelta(days=days_old + rng.random()) if i < old_rows else timedelta(hours=rng.random() * 24)
+        records.append({
+            'user_id': user_id,
+            'timestamp': now - age,
+            'image_path': os.path.join(tempfile.gettempdir(), f'derm_bench_missing_{i}.jpeg'),
+            'primary_condition': 'Ringworm',
+            'confidence': 50 + rng.random() * 50,
+            'detailed_analysis': DETAILED_ANALYSIS
+        })
+
+    with app.app_context():
+        # Core bulk insert: seeding is setup, not part of what is measured
+        db.session.execute(SkinAnalysisResult.__table__.insert(), records)
+        db.session.commit()
+
+
+def clear_analyses(app: Flask) -> None:
+    with app.app_context():
+        db.session.execute(SkinAnalysisResult.__table__.delete())
+        db.session.commit()
@@ -0,0 +1,160 @@
+"""
+Contention benchmark for the shared rate-limit storage.
+
+Several processes (like gunicorn workers), each with several threads, hit
+the same limits for a fixed duration. Reports per-hit latency percentiles in
+microseconds and throughput, and checks that the stored counters equal the
+number of hits made across all processes.
+
+    python -m benchmarks.ratelimit --processes 4 --threads 8 --keys 1 --duration 5
+    python -m benchmarks.ratelimit --storage memory://   # single-process reference
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+from array import array
+
+from limits import parse
+from limits.storage import storage_from_string
+from limits.strategies import FixedWindowRateLimiter
+
+import api.ratelimit_storage  # noqa: F401  (registers sqlite://)
+from benchmarks.core import format_seconds
+
+LIMIT = parse("1000000000 per hour")
+
+
+def _worker(uri: str, threads: int, keys: int, duration: float, results) -> None:
+    import threading
+
+    storage = storage_from_string(uri)
+    limiter = FixedWindowRateLimiter(storage)
+    latencies = [array('d') for _ in range(threads)]
+    stop_at = time.perf_counter() + duration
+
+    def loop(index: int):
+        samples = latencies[index]
+        n = 0
+        while True:
+            key = f"client-{(index + n) % keys}"
+            start = time.perf_counter()
+            limiter.hit(LIMIT, key)
+            end = time.perf_counter()
+            samples.append(end - start)
+            n += 1
+            if end >= stop_at:
+                break
+
+    pool = [threading.Thread(target=loop, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+
+    merged = array('d')
+    for samples in latencies:
+        merged.extend(samples)
+    results.put(merged.tobytes())
+
+
+def run(uri: str, processes: int, threads: int, keys: int, duration: float) -> dict:
+    if uri.startswith('memory://') and processes > 1:
+        raise ValueError("memory:// is per process; use --processes 1 for a reference run")
+
+    storage = storage_from_string(uri)
+    storage.reset()
+
+    ctx = multiprocessing.get_context('fork')
+    results = ctx.Queue()
+    if processes == 1:
+        _worker(uri, threads, keys, duration, results)
+        chunks = [results.get()]
+    else:
+        procs = [ctx.Process(target=_worker, args=(uri, threads, keys, duration, results))
+                 for _ in range(processes)]
+        for p in procs:
+            p.start()
+        chunks = [results.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+    latencies = array('d')
+    for chunk in chunks:
+        part = array('d')
+        part.frombytes(chunk)
+        latencies.extend(part)
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))]
+
+    # A fresh memory:// storage cannot see the workers' counters
+    stored = None
+    if not uri.startswith('memory://'):
+        limiter = FixedWindowRateLimiter(storage)
+        stored = sum(LIMIT.amount - limiter.get_window_stats(LIMIT, f"client-{k}").remaining
+                     for k in range(keys))
+
+    return {
+        'storage': uri.split('://')[0],
+        'processes': processes,
+        'threads': threads,
+        'keys': keys,
+        'duration_s': duration,
+        'hits': len(ordered),
+        'hits_per_s': len(ordered) / duration,
+        'latency_us': {
+            'p50': pct(50) * 1e6, 'p95': pct(95) * 1e6,
+            'p99': pct(99) * 1e6, 'max': ordered[-1] * 1e6
+        },
+        'stored_count': stored,
+        'consistent': stored == len(ordered) if stored is not None else None
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Rate-limit storage contention benchmark')
+    parser.add_argument('--storage', help='Storage URI (default: a temporary sqlite:// file)')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--keys', type=int, default=1, help='Distinct clients; 1 = worst-case contention')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--output', help='Write the result JSON here')
+    args = parser.parse_args(argv)
+
+    uri, path = args.storage, None
+    if uri is None:
+        fd, path = tempfile.mkstemp(prefix='derm_ratelimit_', suffix='.db')
+        os.close(fd)
+        uri = f"sqlite:///{path}"
+
+    try:
+        result = run(uri, args.processes, args.threads, args.keys, args.duration)
+    finally:
+        if path:
+            for suffix in ('', '-wal', '-shm', '.lock'):
+                if os.path.exists(path + suffix):
+                    os.remove(path + suffix)
+
+    lat = result['latency_us']
+    print(f"{result['storage']}: {result['processes']} process(es) x {result['threads']} thread(s), "
+          f"{result['keys']} key(s)")
+    print(f"  {result['hits']} hits, {result['hits_per_s']:.0f} hits/s")
+    print(f"  per hit: p50 {format_seconds(lat['p50'] / 1e6)}, p95 {format_seconds(lat['p95'] / 1e6)}, "
+          f"p99 {format_seconds(lat['p99'] / 1e6)}, max {format_seconds(lat['max'] / 1e6)}")
+    if result['consistent'] is not None:
+        print(f"  stored count {result['stored_count']} ({'consistent' if result['consistent'] else 'MISMATCH'})")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0 if result['consistent'] is not False else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,405 @@
+"""
+Benchmark runner.
+
+    python -m benchmarks.run                       # run everything, print a table
+    python -m benchmarks.run --quick               # skip the slow (100k row) cases
+    python -m benchmarks.run -k history -k parse   # only cases whose name matches
+    python -m benchmarks.run --output results.json --baseline benchmarks/baseline.json
+
+Results are written as JSON. With --baseline the medians are compared against
+a previous results file and the exit status is 1 if any case is slower than
+the baseline by more than --threshold (default 25%). To refresh the baseline,
+run on the reference machine with --output benchmarks/baseline.json.
+"""
+
+import os
+import sys
+import json
+import atexit
+import shutil
+import tempfile
+import logging
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, List
+
+import numpy as np
+import torch
+from PIL import Image
+
+from api.images import validate_image, create_image_preview
+from api.ingest import IngestStream
+from api.image_quality import assess as assess_quality
+from api.tta import TestTimeAugmentation
+from api.embedding_index import EmbeddingIndex, EMBEDDING_DIM
+from api.answer_cache import AnswerCache
+from api.prompt_builder import PromptBuilder
+from api.skin_analysis import ActiveModel, SkinAnalysisResult, db
+from api.cascade import CASCADE_MODE, STUDENT_MODEL_PATH
+import api.ratelimit_storage  # noqa: F401  (registers sqlite://)
+from benchmarks import fixtures
+from benchmarks.core import Case, measure, compare, load_results, format_seconds
+
+HISTORY_ROWS = (10, 1000, 100000)
+BATCH_SIZES = (1, 4, 8, 16)
+CLEANUP_ROWS = 2000
+EMBEDDING_ROWS = (10000, 100000)
+
+_analyzer = None
+
+
+def get_analyzer() -> fixtures.OfflineAnalyzer:
+    global _analyzer
+    if _analyzer is None:
+        _analyzer = fixtures.OfflineAnalyzer()
+    return _analyzer
+
+
+# ===================== IMAGE CASES =====================
+def bench_validate_image():
+    paths = fixtures.corpus_images()
+
+    def run():
+        for path in paths:
+            validate_image(path)
+    return run
+
+
+def bench_ingest_upload():
+    blobs = []
+    for path in fixtures.corpus_images():
+        with open(path, 'rb') as f:
+            blobs.append(f.read())
+
+    def run():
+        # Written in the multipart parser's chunk size
+        for data in blobs:
+            stream = IngestStream()
+            for start in range(0, len(data), 64 * 1024):
+                stream.write(data[start:start + 64 * 1024])
+            stream.finish()
+            stream.close()
+    return run
+
+
+def bench_quality_gate():
+    images = [Image.open(path).convert('RGB') for path in fixtures.corpus_images()]
+
+    def run():
+        for image in images:
+            assess_quality(image)
+    return run
+
+
+def bench_create_image_preview():
+    paths = fixtures.corpus_images()
+
+    def run():
+        for path in paths:
+            create_image_preview(path)
+    return run
+
+
+# ===================== MODEL CASES =====================
+def bench_preprocess():
+    analyzer = get_analyzer()
+    paths = fixtures.corpus_images()
+
+    def run():
+        for path in paths:
+            image = Image.open(path).convert('RGB')
+            analyzer.transform(image=np.array(image))['image'].unsqueeze(0).to(analyzer.device)
+    return run
+
+
+def bench_predict(batch_size: int, cascade: bool = False):
+    """The serving forward pass (top-3 and embedding); with cascade, through the
+    student and, when it is unsure, the full model"""
+    def setup():
+        analyzer = get_analyzer()
+        paths = fixtures.corpus_images(batch_size)
+        tensors = [
+            analyzer.transform(image=np.array(Image.open(p).convert('RGB')))['image']
+            for p in paths
+        ]
+        while len(tensors) < batch_size:
+            tensors.append(tensors[len(tensors) % len(paths)])
+        batch = torch.stack(tensors).to(analyzer.device)
+        if cascade:
+            # The offline teacher's weights are random, so bind the student to it directly
+            active = ActiveModel(analyzer.model_version, analyzer.model, cascade=analyzer.cascade)
+            analyzer._predict(active, batch)  # warm up kernels / allocator
+            return lambda: analyzer._predict(active, batch)
+
+        analyzer._predict_with_embedding(analyzer.model, batch)  # warm up kernels / allocator
+        return lambda: analyzer._predict_with_embedding(analyzer.model, batch)
+    return setup
+
+
+def bench_tta():
+    def setup():
+        analyzer = get_analyzer()
+        tta = TestTimeAugmentation()
+        path = fixtures.corpus_images(1)[0]
+        image_tensor = analyzer.transform(image=np.array(Image.open(path).convert('RGB')))['image']
+        image_tensor = image_tensor.unsqueeze(0).to(analyzer.device)
+        tta.predict(analyzer.model, image_tensor)
+
+        return lambda: tta.predict(analyzer.model, image_tensor)
+    return setup
+
+
+def bench_analyze_image():
+    analyzer = get_analyzer()
+    path = fixtures.corpus_images(1)[0]
+
+    def run():
+        # Measure the full path, not the enrichment cache
+        analyzer._response_cache.clear()
+        analyzer.analyze_image(path)
+    return run
+
+
+def bench_parse_sections():
+    analyzer = get_analyzer()
+    return lambda: analyzer._parse_analysis_sections(fixtures.CANNED_ANALYSIS)
+
+
+def bench_similar_search(rows: int):
+    def setup():
+        directory = tempfile.mkdtemp(prefix='bench-embeddings-')
+        atexit.register(shutil.rmtree, directory, True)
+        index = EmbeddingIndex(directory)
+        rng = np.random.default_rng(0)
+        for start in range(0, rows, 10000):
+            count = min(10000, rows - start)
+            index.add_many(range(start + 1, start + count + 1),
+                           rng.random((count, EMBEDDING_DIM), dtype=np.float32))
+        query = index.get(1)
+        return lambda: index.search(query, k=10, exclude=[1])
+    return setup
+
+
+# ===================== DATABASE CASES =====================
+def _temp_db_app():
+    path = fixtures.temp_db_path()
+    atexit.register(lambda: os.path.exists(path) and os.remove(path))
+    return fixtures.make_db_app(path)
+
+
+def bench_history(rows: int):
+    def setup():
+        app = _temp_db_app()
+        fixtures.seed_analyses(app, rows)
+
+        def run():
+            # Mirrors /api/analysis/history with a fresh session per request
+            with app.app_context():
+                analyses = SkinAnalysisResult.query.filter_by(user_id='bench-user') \
+                    .order_by(SkinAnalysisResult.timestamp.desc()).all()
+                history = []
+                for analysis in analyses:
+                    result = analysis.to_dict()
+                    if os.path.exists(analysis.image_path):
+                        result['image_preview'] = create_image_preview(analysis.image_path)
+                    history.append(result)
+                json.dumps({'success': True, 'history': history})
+        return run
+    return setup
+
+
+def cleanup_case() -> Case:
+    state = {}
+
+    def setup():
+        state['app'] = _temp_db_app()
+        analyzer = get_analyzer()
+
+        def run():
+            with state['app'].app_context():
+                analyzer._cleanup_old_records()
+        return run
+
+    def reset():
+        fixtures.clear_analyses(state['app'])
+        fixtures.seed_analyses(state['app'], CLEANUP_ROWS, old_fraction=0.5)
+
+    return Case('db.cleanup_old_records[2000 rows, 50% expired]', setup, 'database',
+                repeat=5, items=CLEANUP_ROWS, reset=reset)
+
+
+# ===================== CHAT CASES =====================
+def bench_prompt_build():
+    builder = PromptBuilder(token_budget=2500, history_window=6,
+                            summary_token_limit=300, max_message_tokens=350)
+    recent = [
+        {'role': 'user' if i % 2 == 0 else 'assistant', 'content': fixtures.CANNED_ANALYSIS * (1 + i % 2)}
+        for i in range(6)
+    ]
+    summary = builder.extend_summary(None, recent)
+    return lambda: builder.build('You are DermAI.', 'How do I treat ringworm?',
+                                 'How do I treat ringworm?', recent, summary)
+
+
+def bench_answer_cache_lookup():
+    cache = AnswerCache(max_entries=2048)
+    conditions = ('ringworm', 'impetigo', 'cellulitis', 'chickenpox', 'shingles',
+                  'athletes foot', 'nail fungus', 'creeping eruption')
+    for i in range(1000):
+        cache.put(f"what is the treatment for {conditions[i % 8]} case {i}", 'answer')
+    questions = [f"how is {c} treated in adults" for c in conditions]
+
+    def run():
+        for question in questions:
+            cache.get(question)
+    return run
+
+
+# ===================== RATE LIMIT CASES =====================
+def bench_ratelimit_hit(uri_kind: str):
+    def setup():
+        from limits import parse
+        from limits.storage import storage_from_string
+        from limits.strategies import FixedWindowRateLimiter
+
+        if uri_kind == 'sqlite':
+            path = fixtures.temp_db_path()
+            atexit.register(lambda: [os.remove(path + s) for s in ('', '-wal', '-shm', '.lock')
+                                     if os.path.exists(path + s)])
+            storage = storage_from_string(f"sqlite:///{path}")
+        else:
+            storage = storage_from_string('memory://')
+        limiter = FixedWindowRateLimiter(storage)
+        limit = parse("1000000000 per hour")
+        return lambda: limiter.hit(limit, '127.0.0.1')
+    return setup
+
+
+def build_cases() -> List[Case]:
+    corpus_size = len(fixtures.corpus_images())
+    cases = [
+        Case('image.validate_image', bench_validate_image, 'image', items=corpus_size),
+        Case('image.ingest_upload', bench_ingest_upload, 'image', items=corpus_size),
+        Case('image.quality_gate', bench_quality_gate, 'image', items=corpus_size),
+        Case('image.create_image_preview', bench_create_image_preview, 'image', items=corpus_size),
+        Case('model.preprocess', bench_preprocess, 'model', items=corpus_size),
+    ]
+    cases += [
+        Case(f'model.predict[batch={size}]', bench_predict(size), 'model', items=size)
+        for size in BATCH_SIZES
+    ]
+    if CASCADE_MODE != 'off' and os.path.exists(STUDENT_MODEL_PATH):
+        cases += [
+            Case(f'model.predict_cascade[batch={size}]', bench_predict(size, cascade=True), 'model',
+                 items=size)
+            for size in BATCH_SIZES
+        ]
+    cases += [
+        Case('model.tta[8 views]', bench_tta(), 'model', items=8),
+        Case('model.analyze_image[stub llm]', bench_analyze_image, 'model'),
+        Case('model.parse_analysis_sections', bench_parse_sections, 'model'),
+    ]
+    cases += [
+        Case(f'model.similar_search[exact, {rows} rows]', bench_similar_search(rows), 'model',
+             repeat=3 if rows >= 100000 else 7, slow=rows >= 100000)
+        for rows in EMBEDDING_ROWS
+    ]
+    cases += [
+        Case(f'db.history[{rows} rows]', bench_history(rows), 'database',
+             repeat=3 if rows >= 100000 else 7, items=rows, slow=rows >= 100000)
+        for rows in HISTORY_ROWS
+    ]
+    cases += [
+        cleanup_case(),
+        Case('chat.prompt_build', bench_prompt_build, 'chat'),
+        Case('chat.answer_cache_lookup', bench_answer_cache_lookup, 'chat', items=8),
+        Case('ratelimit.hit[memory]', bench_ratelimit_hit('memory'), 'ratelimit'),
+        Case('ratelimit.hit[sqlite]', bench_ratelimit_hit('sqlite'), 'ratelimit'),
+    ]
+    return cases
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return 'unknown'
+
+
+def environment() -> Dict[str, object]:
+    return {
+        'timestamp': datetime.utcnow().isoformat(),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'torch': torch.__version__,
+        'torch_threads': torch.get_num_threads(),
+        'device': 'cuda' if torch.cuda.is_available() else 'cpu'
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='DermAI hot-path benchmarks')
+    parser.add_argument('-k', dest='filters', action='append', default=[],
+                        help='Only run cases whose name contains this substring (repeatable)')
+    parser.add_argument('--quick', action='store_true', help='Skip slow cases')
+    parser.add_argument('--repeat', type=int, help='Samples per case (overrides per-case default)')
+    parser.add_argument('--threads', type=int, help='torch intra-op threads')
+    parser.add_argument('--output', help='Write results JSON to this path')
+    parser.add_argument('--baseline', help='Compare against this results JSON')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown vs baseline before failing (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    logging.disable(logging.INFO)
+    torch.manual_seed(0)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.set_grad_enabled(False)
+
+    cases = [
+        c for c in build_cases()
+        if (not args.filters or any(f in c.name for f in args.filters))
+        and not (args.quick and c.slow)
+    ]
+
+    results = {}
+    for case in cases:
+        result = measure(case, args.repeat)
+        results[case.name] = result
+        throughput = f"  {result['items_per_s']:.1f} items/s" if case.items > 1 else ''
+        print(f"{case.name:<48} {format_seconds(result['median_s']):>12}  "
+              f"(min {format_seconds(result['min_s'])}, n={result['samples']}){throughput}")
+
+    report = {'environment': environment(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if not args.baseline:
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"\nBaseline {args.baseline} not found; skipping comparison")
+        return 0
+
+    rows = compare(results, load_results(args.baseline), args.threshold)
+    print(f"\nComparison against {args.baseline} (threshold {args.threshold:.0%}):")
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] else '-'
+        print(f"  {row['status']:<12} {ratio:>7}  {row['name']}")
+
+    regressions = [r for r in rows if r['status'] == 'regression']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,297 @@
+"""
+Train and calibrate the cascade student (see api/cascade.py). Runs on CPU.
+
+    python cascade_cli.py distill --teacher best_model.pth --data datasets/skin --epochs 8
+    python cascade_cli.py calibrate --teacher best_model.pth --data datasets/held_out
+    python cascade_cli.py evaluate --teacher best_model.pth --data datasets/held_out
+
+--data is either a directory with one sub-directory per class (named after
+the class or its condition code, e.g. "Ringworm" or "FU-ringworm") or a flat
+directory of images. Unlabelled images are scored against the teacher's
+predictions, so "accuracy" then means agreement with the full model.
+
+distill trains MobileNetV3-small on the teacher's softened outputs (plus the
+labels, when present) and keeps --holdout of the images aside. It then picks
+the lowest confidence threshold at which the cascade stays within
+--max-accuracy-drop of the teacher on those images, and writes the student,
+threshold and calibration report to models/student.pth. calibrate re-tunes
+the threshold of an existing student on new held-out data; evaluate only
+prints the report. The student records the sha256 of the --teacher it was
+distilled from or last calibrated against, and the server only uses it while
+that checkpoint is the served model version.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from datetime import datetime
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torch.utils.data import Dataset, DataLoader
+
+from api.cascade import StudentModel, calibrate_threshold, STUDENT_MODEL_PATH
+from api.model_registry import file_sha256
+from api.skin_analysis import (CLASS_NAMES, CONDITION_CODES, SkinDiseaseModel,
+                               build_transform, load_checkpoint_weights)
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+# ===================== DATA =====================
+def _class_index(folder: str):
+    key = folder.lower()
+    for index, name in enumerate(CLASS_NAMES):
+        if key in (name.lower(), CONDITION_CODES[name].lower()):
+            return index
+    return None
+
+
+def discover(data_dir: str):
+    """Returns (paths, labels); labels is None for a flat directory of images"""
+    def images_in(directory):
+        return [os.path.join(directory, n) for n in sorted(os.listdir(directory))
+                if n.lower().endswith(IMAGE_EXTENSIONS)]
+
+    subdirs = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    if not subdirs:
+        return images_in(data_dir), None
+
+    paths, labels = [], []
+    for folder in subdirs:
+        index = _class_index(folder)
+        if index is None:
+            raise SystemExit(f"Unknown class directory '{folder}'; expected one of {', '.join(CLASS_NAMES)}")
+        found = images_in(os.path.join(data_dir, folder))
+        paths += found
+        labels += [index] * len(found)
+    return paths, labels
+
+
+class ImageDataset(Dataset):
+    def __init__(self, paths, augment: bool = False):
+        self.paths = paths
+        self.augment = augment
+        self.transform = build_transform()
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, index):
+        image = np.array(Image.open(self.paths[index]).convert('RGB'))
+        tensor = self.transform(image=image)['image']
+        if self.augment and random.random() < 0.5:
+            tensor = tensor.flip(-1)
+        return tensor, index
+
+
+# ===================== MODELS =====================
+def load_teacher(path: str) -> torch.nn.Module:
+    teacher = SkinDiseaseModel(num_classes=len(CLASS_NAMES), pretrained=False)
+    teacher.load_state_dict(load_checkpoint_weights(path, 'cpu'))
+    return teacher.eval()
+
+
+def load_student(path: str):
+    checkpoint = torch.load(path, map_location='cpu')
+    student = StudentModel(num_classes=len(CLASS_NAMES))
+    student.load_state_dict(checkpoint['model_state_dict'])
+    return student.eval(), checkpoint
+
+
+@torch.no_grad()
+def predict_logits(model, paths, batch_size: int, workers: int) -> torch.Tensor:
+    loader = DataLoader(ImageDataset(paths), batch_size=batch_size, num_workers=workers)
+    return torch.cat([model(images) for images, _ in loader])
+
+
+@torch.inference_mode()
+def per_image_ms(model, repeats: int = 20) -> float:
+    """Single-image forward latency, as the model is served"""
+    sample = torch.randn(1, 3, 224, 224)
+    for _ in range(3):
+        model(sample)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model(sample)
+    return (time.perf_counter() - start) / repeats * 1000
+
+
+# ===================== CALIBRATION =====================
+def evaluate(student, teacher, paths, labels, args) -> dict:
+    student_logits = predict_logits(student, paths, args.batch_size, args.workers)
+    full_pred = predict_logits(teacher, paths, args.batch_size, args.workers).argmax(dim=1)
+    targets = torch.tensor(labels) if labels is not None else full_pred
+
+    report = calibrate_threshold(F.softmax(student_logits, dim=1), full_pred, targets, args.max_accuracy_drop)
+    report['labelled'] = labels is not None
+    report['student_ms'] = per_image_ms(student)
+    report['full_ms'] = per_image_ms(teacher)
+    # Every image pays for the student; escalated ones also for the full model
+    report['expected_ms'] = report['student_ms'] + report['escalation_rate'] * report['full_ms']
+    return report
+
+
+def print_report(report: dict) -> None:
+    kind = 'labelled' if report['labelled'] else 'unlabelled, scored against the teacher'
+    print(f"held-out images: {report['held_out']} ({kind})")
+    print(f"accuracy: full model {report['full_accuracy']:.2%}, student alone {report['student_accuracy']:.2%}")
+    print(f"threshold {report['threshold']:.4f}: {report['escalation_rate']:.1%} escalated, "
+          f"cascade accuracy {report['cascade_accuracy']:.2%}")
+    print(f"per image: student {report['student_ms']:.1f} ms, full {report['full_ms']:.1f} ms, "
+          f"cascade {report['expected_ms']:.1f} ms expected "
+          f"({report['expected_ms'] / report['full_ms']:.0%} of the full model)")
+
+
+def save_student(path: str, student, report: dict, teacher_path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    torch.save({
+        'model_state_dict': student.state_dict(),
+        'arch': 'mobilenet_v3_small',
+        'class_names': list(CLASS_NAMES),
+        'threshold': report['threshold'],
+        'calibration': report,
+        'teacher': os.path.abspath(teacher_path),
+        'teacher_sha256': file_sha256(teacher_path),
+        'created_at': datetime.utcnow().isoformat()
+    }, tmp_path)
+    os.replace(tmp_path, path)
+    print(f"Saved student to {path}")
+
+
+# ===================== COMMANDS =====================
+def cmd_distill(args):
+    random.seed(args.seed)
+    torch.manual_seed(args.seed)
+
+    paths, labels = discover(args.data)
+    order = list(range(len(paths)))
+    random.shuffle(order)
+    n_held = max(1, int(len(paths) * args.holdout))
+    if len(paths) - n_held < 1:
+        print(f"Need at least 2 images, found {len(paths)} in {args.data}", file=sys.stderr)
+        return 1
+    held, train = order[:n_held], order[n_held:]
+    train_paths = [paths[i] for i in train]
+    train_labels = torch.tensor([labels[i] for i in train]) if labels is not None else None
+    print(f"{len(train)} training / {len(held)} held-out images "
+          f"({'labelled' if labels is not None else 'unlabelled'})")
+
+    teacher = load_teacher(args.teacher)
+    student = StudentModel(num_classes=len(CLASS_NAMES), pretrained=not args.no_pretrained)
+
+    # Without augmentation the teacher's outputs never change; compute them once
+    cached_logits = None
+    if not args.augment:
+        start = time.perf_counter()
+        cached_logits = predict_logits(teacher, train_paths, args.batch_size, args.workers)
+        print(f"teacher outputs for {len(train)} images in {time.perf_counter() - start:.0f}s")
+
+    loader = DataLoader(ImageDataset(train_paths, augment=args.augment), batch_size=args.batch_size,
+                        shuffle=True, num_workers=args.workers)
+    optimizer = torch.optim.AdamW(student.parameters(), lr=args.lr, weight_decay=1e-4)
+    scheduler = torch.optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs * len(loader))
+    t = args.temperature
+
+    for epoch in range(args.epochs):
+        student.train()
+        start, total, seen = time.perf_counter(), 0.0, 0
+        for images, index in loader:
+            if cached_logits is None:
+                with torch.no_grad():
+                    teacher_logits = teacher(images)
+            else:
+                teacher_logits = cached_logits[index]
+
+            logits = student(images)
+            # Soft-target distillation loss, scaled by T^2 to keep gradients comparable
+            loss = F.kl_div(F.log_softmax(logits / t, dim=1), F.softmax(teacher_logits / t, dim=1),
+                            reduction='batchmean') * t * t
+            if train_labels is not None:
+                loss = args.alpha * loss + (1 - args.alpha) * F.cross_entropy(logits, train_labels[index])
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            scheduler.step()
+            total += loss.item() * len(index)
+            seen += len(index)
+        print(f"epoch {epoch + 1}/{args.epochs}: loss {total / seen:.4f} ({time.perf_counter() - start:.0f}s)")
+
+    student.eval()
+    report = evaluate(student, teacher, [paths[i] for i in held],
+                      [labels[i] for i in held] if labels is not None else None, args)
+    print_report(report)
+    save_student(args.output, student, report, args.teacher)
+    return 0
+
+
+def cmd_calibrate(args):
+    paths, labels = discover(args.data)
+    if not paths:
+        print(f"No images in {args.data}", file=sys.stderr)
+        return 1
+    student, checkpoint = load_student(args.student)
+    report = evaluate(student, load_teacher(args.teacher), paths, labels, args)
+    print_report(report)
+    if args.dry_run:
+        return 0
+    # Calibrated against this teacher: the server uses the student only while it is served
+    checkpoint.update(threshold=report['threshold'], calibration=report,
+                      teacher=os.path.abspath(args.teacher), teacher_sha256=file_sha256(args.teacher))
+    tmp_path = f"{args.student}.{os.getpid()}.tmp"
+    torch.save(checkpoint, tmp_path)
+    os.replace(tmp_path, args.student)
+    print(f"Updated threshold in {args.student}; restart the server (or set CASCADE_THRESHOLD) to apply it")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI model cascade: distil and calibrate the student')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p):
+        p.add_argument('--teacher', required=True, help='Full model checkpoint (EfficientNet-B0)')
+        p.add_argument('--data', required=True, help='Image directory (class sub-directories or flat)')
+        p.add_argument('--max-accuracy-drop', type=float, default=0.005,
+                       help='Largest accepted accuracy loss against the full model')
+        p.add_argument('--batch-size', type=int, default=32)
+        p.add_argument('--workers', type=int, default=0, help='DataLoader worker processes')
+        p.add_argument('--threads', type=int, help='torch intra-op threads')
+
+    p = sub.add_parser('distill', help='Train a student from the full model and calibrate it')
+    common(p)
+    p.add_argument('--output', default=STUDENT_MODEL_PATH)
+    p.add_argument('--holdout', type=float, default=0.2, help='Fraction of images kept for calibration')
+    p.add_argument('--epochs', type=int, default=8)
+    p.add_argument('--lr', type=float, default=1e-3)
+    p.add_argument('--temperature', type=float, default=4.0)
+    p.add_argument('--alpha', type=float, default=0.7, help='Weight of the distillation loss when labels exist')
+    p.add_argument('--augment', action='store_true', help='Random flips (teacher re-run every batch)')
+    p.add_argument('--no-pretrained', action='store_true', help='Start from random instead of ImageNet weights')
+    p.add_argument('--seed', type=int, default=0)
+    p.set_defaults(func=cmd_distill)
+
+    for name, help_text in (('calibrate', 'Re-tune the threshold of a trained student'),
+                            ('evaluate', 'Report escalation rate and accuracy without saving')):
+        p = sub.add_parser(name, help=help_text)
+        common(p)
+        p.add_argument('--student', default=STUDENT_MODEL_PATH)
+        p.set_defaults(func=cmd_calibrate, dry_run=name == 'evaluate')
+        if name == 'calibrate':
+            p.add_argument('--dry-run', action='store_true')
+
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+"""
+Maintain the similar-case embedding index (see api/embedding_index.py).
+
+    python embeddings_cli.py stats
+    python embeddings_cli.py backfill --batch-size 32     # embed analyses not yet indexed
+    python embeddings_cli.py build-ann                    # train the IVF-PQ index (needs faiss-cpu)
+    python embeddings_cli.py compact                      # drop rows of deleted analyses
+    python embeddings_cli.py query 42 -k 5
+
+Every command works on the index of the active model version (see
+api/model_registry.py) unless --model-version names another; after a model
+swap, backfill fills the new version's index. backfill, compact and query
+import the app (database, and for backfill the model). build-ann should be
+re-run as the archive grows: rows added after a build are scanned exactly on
+every query.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+from api.embedding_index import EmbeddingIndex, index_directory
+from api.model_registry import resolve_active
+
+
+def _server():
+    """The app module: database, models and job handlers"""
+    import app
+    return app
+
+
+def _index(args) -> EmbeddingIndex:
+    return EmbeddingIndex(index_directory(args.model_version or resolve_active().version))
+
+
+def cmd_stats(args):
+    index = _index(args)
+    stats = index.stats()
+    print(f"rows: {stats['rows']} ({stats['bytes'] / 2**20:.1f} MiB) in {index.directory}")
+    print(f"IVF-PQ index: {stats['ann_rows'] if stats['ann_rows'] is not None else 'not in use'}")
+    return 0
+
+
+def cmd_backfill(args):
+    server = _server()
+    analyzer = server.analyzer
+    model, model_version = analyzer.model, analyzer.model_version
+    if args.model_version and args.model_version != model_version:
+        print(f"The server loads {model_version}; activate {args.model_version} to backfill it", file=sys.stderr)
+        return 1
+    index = EmbeddingIndex(index_directory(model_version))
+    indexed = set(index.ids().tolist())
+    added = skipped = 0
+    start = time.perf_counter()
+
+    def flush(batch):
+        nonlocal added
+        with torch.inference_mode():
+            _, embeddings = model.forward_with_embedding(torch.cat([t for _, t in batch]))
+        index.add_many([analysis_id for analysis_id, _ in batch], embeddings)
+        added += len(batch)
+        print(f"{added} embedded ({added / (time.perf_counter() - start):.1f}/s)")
+
+    with server.app.app_context():
+        query = server.db.session.query(server.SkinAnalysisResult.id, server.SkinAnalysisResult.image_path)
+        batch = []
+        for analysis_id, image_path in query.order_by(server.SkinAnalysisResult.id).yield_per(1000):
+            if analysis_id in indexed:
+                continue
+            if not os.path.exists(image_path):
+                skipped += 1
+                continue
+            batch.append((analysis_id, analyzer._load_tensor(image_path)))
+            if len(batch) == args.batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    print(f"Added {added} {model_version} embeddings; {skipped} analyses have no image")
+    return 0
+
+
+def cmd_build_ann(args):
+    index = _index(args)
+    try:
+        report = index.build_ann(lists=args.lists, subquantizers=args.subquantizers, train_rows=args.train_rows)
+    except (RuntimeError, ValueError) as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"IVF-PQ index over {report['rows']} rows: {report['lists']} lists, "
+          f"{report['subquantizers']} x 8-bit codes; trained in {report['train_seconds']:.0f}s, "
+          f"{report['total_seconds']:.0f}s total")
+    return 0
+
+
+def cmd_compact(args):
+    server = _server()
+    with server.app.app_context():
+        live = [row.id for row in server.db.session.query(server.SkinAnalysisResult.id)]
+    before, after = _index(args).compact(live)
+    print(f"Compacted {before} rows to {after}")
+    if after:
+        print("Rebuild the IVF-PQ index with build-ann if the archive uses one")
+    return 0
+
+
+def cmd_query(args):
+    index = _index(args)
+    query = index.get(args.id)
+    if query is None:
+        print(f"Analysis {args.id} is not indexed", file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    matches = index.search(query, k=args.k, exclude=[args.id])
+    elapsed = (time.perf_counter() - start) * 1000
+    server = _server()
+    with server.app.app_context():
+        for analysis_id, score in matches:
+            analysis = server.SkinAnalysisResult.query.get(analysis_id)
+            condition = analysis.primary_condition if analysis else '(deleted)'
+            print(f"{analysis_id:>10}  {score:.4f}  {condition}")
+    print(f"{len(matches)} matches in {elapsed:.1f} ms over {len(index)} rows")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI similar-case embedding index')
+    parser.add_argument('--model-version', help='Index of this model version (default: the active one)')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('stats', help='Rows stored and IVF-PQ coverage').set_defaults(func=cmd_stats)
+
+    p = sub.add_parser('backfill', help='Embed stored analyses that are not indexed yet')
+    p.add_argument('--batch-size', type=int, default=32)
+    p.add_argument('--threads', type=int, help='torch intra-op threads')
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser('build-ann', help='Train the IVF-PQ index over the stored rows')
+    p.add_argument('--lists', type=int, help='Inverted lists (default: sqrt of the row count)')
+    p.add_argument('--subquantizers', type=int, default=64, help='PQ code bytes per vector')
+    p.add_argument('--train-rows', type=int, default=65536)
+    p.set_defaults(func=cmd_build_ann)
+
+    sub.add_parser('compact', help='Drop rows of deleted analyses').set_defaults(func=cmd_compact)
+
+    p = sub.add_parser('query', help='Most similar analyses to a stored one, across all users')
+    p.add_argument('id', type=int)
+    p.add_argument('-k', type=int, default=10)
+    p.set_defaults(func=cmd_query)
+
+    args = parser.parse_args()
+    if getattr(args, 'threads', None):
+        torch.set_num_threads(args.threads)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
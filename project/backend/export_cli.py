@@ -0,0 +1,67 @@
+"""
+Bulk export of analyses and chat transcripts (see api/export.py).
+
+    python export_cli.py analyses --format parquet -o analyses.parquet
+    python export_cli.py analyses --since 2026-01-01 --until 2026-03-31 --condition "Ringworm,Nail Fungus" -o q1.ndjson
+    python export_cli.py analyses --images -o analyses.tar      # data file plus images/<id>.<ext>
+    python export_cli.py chats --format csv > chats.csv
+
+Rows are streamed in --chunk-rows chunks straight to the output, so memory
+use does not grow with the table. Only the database is opened (not the
+model), so exports can run next to the server. The same export is served by
+GET /admin/export/<table>.
+"""
+
+import os
+import sys
+import time
+import argparse
+
+from api.cli_app import DEFAULT_DATABASE, make_app
+from api.export import ExportError, ExportQuery, ENCODERS, EXPORT_CHUNK_ROWS, stream_export
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI bulk export')
+    parser.add_argument('table', choices=['analyses', 'chats'])
+    parser.add_argument('--format', choices=list(ENCODERS), default='ndjson')
+    parser.add_argument('--since', help='ISO date or datetime (inclusive)')
+    parser.add_argument('--until', help='ISO date (inclusive) or datetime (exclusive)')
+    parser.add_argument('--condition', help='Comma-separated conditions (analyses only)')
+    parser.add_argument('--user-id')
+    parser.add_argument('--images', action='store_true', help='Tar of the data file and the analysed images')
+    parser.add_argument('--chunk-rows', type=int, default=EXPORT_CHUNK_ROWS)
+    parser.add_argument('-o', '--output', help='Output file (default: stdout)')
+    parser.add_argument('--database', default=DEFAULT_DATABASE)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.database):
+        print(f"No database at {args.database}", file=sys.stderr)
+        return 1
+    with make_app(args.database).app_context():
+        try:
+            query = ExportQuery.parse(args.table, since=args.since, until=args.until,
+                                      condition=args.condition, user_id=args.user_id)
+            chunks = stream_export(query, args.format, images=args.images, chunk_rows=args.chunk_rows)
+        except ExportError as e:
+            print(e, file=sys.stderr)
+            return 1
+
+        start = time.perf_counter()
+        output = open(args.output, 'wb') if args.output else sys.stdout.buffer
+        written = 0
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                written += len(chunk)
+        finally:
+            if args.output:
+                output.close()
+    if args.output:
+        print(f"Wrote {written / 2**20:.1f} MiB to {os.path.abspath(args.output)} "
+              f"in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Gunicorn production profile.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+* The app (and model) is preloaded once in the master; workers are forked from
+  it and share the weights copy-on-write instead of loading a copy each.
+* Torch runs single-threaded in the master so no OpenMP pool exists at fork
+  time; each worker then gets TORCH_NUM_THREADS intra-op threads, so
+  workers x TORCH_NUM_THREADS should not exceed the number of cores.
+* Each worker warms the model up before it accepts traffic.
+* The APScheduler jobs run in exactly one worker, elected with a file lock;
+  when that worker exits the lock is released and its replacement takes over.
+* Every worker runs JOB_WORKER_THREADS job queue threads (0 disables them,
+  e.g. when a separate `python jobs_cli.py work` process is used).
+* The ASGI app runs with the same profile using uvicorn workers:
+  GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn -c gunicorn.conf.py asgi:app
+
+Configuration (environment):
+    GUNICORN_BIND           listen address (0.0.0.0:5002)
+    GUNICORN_WORKERS        worker processes (cores / TORCH_NUM_THREADS, at most 4)
+    GUNICORN_THREADS        request threads per worker (4; gthread only)
+    GUNICORN_WORKER_CLASS   gthread, or uvicorn.workers.UvicornWorker for asgi:app
+    GUNICORN_TIMEOUT        worker timeout in seconds (120)
+    GUNICORN_MAX_REQUESTS   recycle a worker after this many requests (1000, 0 = never)
+    TORCH_NUM_THREADS       intra-op threads per worker (1)
+"""
+
+import os
+import gc
+import multiprocessing
+
+# Must be set before torch is imported by the preloaded app
+os.environ['OMP_NUM_THREADS'] = '1'
+os.environ['MKL_NUM_THREADS'] = '1'
+
+TORCH_NUM_THREADS = int(os.getenv('TORCH_NUM_THREADS', '1'))
+SCHEDULER_LOCK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'scheduler.lock')
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:5002')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', str(max(1, min(4, multiprocessing.cpu_count() // TORCH_NUM_THREADS)))
+))
+# Requests spend most of their time waiting on the LLM, so a few threads per
+# worker keep the (shared) model busy; forward passes are bounded by admission control
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+preload_app = True
+
+# Scheduler election lock, held by at most one worker
+_scheduler_lock = None
+
+
+def when_ready(server):
+    # Move everything allocated by the preload into the permanent generation so
+    # the workers' garbage collector does not touch (and copy) those pages
+    gc.collect()
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    import torch
+    from app import app, db
+
+    torch.set_num_threads(TORCH_NUM_THREADS)
+    try:
+        torch.set_num_interop_threads(TORCH_NUM_THREADS)
+    except RuntimeError:
+        pass  # already fixed once inter-op work has run
+
+    # Do not reuse SQLite connections opened by the master
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def post_worker_init(worker):
+    """Runs in the worker after the fork, before it starts accepting requests"""
+    import fcntl
+    from app import start_worker_services, logger
+
+    global _scheduler_lock
+    lock_file = open(SCHEDULER_LOCK_PATH, 'a+')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        # Held (and the file kept open) for the life of this worker
+        _scheduler_lock = lock_file
+    except OSError:
+        lock_file.close()
+
+    # Warmup, LLM probe and job workers; the scheduler only in the lock holder
+    start_worker_services(scheduler=_scheduler_lock is not None)
+    if _scheduler_lock is not None:
+        logger.info(f"Worker {worker.pid} runs the scheduler")
+
+
+def worker_exit(server, worker):
+    from app import stop_worker_services
+    stop_worker_services()
@@ -1,5 +1,5 @@
 from flask import Flask
-from api.skin_analysis import db, ChatMessage, SkinAnalysisResult
+from api.skin_analysis import db, ChatMessage, SkinAnalysisResult, upgrade_schema
 import logging
 import os
 
@@ -26,6 +26,7 @@ def init_database():
         with app.app_context():
             # Create all database tables
             db.create_all()
+            upgrade_schema()
             logger.info(f"Database created at: {db_path}")
             
             # Verify tables exist by querying them
@@ -0,0 +1,150 @@
+"""
+Inspect and operate the background job queue (instance/jobs.db).
+
+    python jobs_cli.py stats
+    python jobs_cli.py list --status dead --kind enrich
+    python jobs_cli.py show 42
+    python jobs_cli.py retry 42            # or: retry --dead [--kind enrich]
+    python jobs_cli.py purge --status done --older-than-days 7
+    python jobs_cli.py enqueue retention '{"days_to_keep": 30}'
+    python jobs_cli.py drain               # run every due job, then exit
+    python jobs_cli.py work --threads 2    # standalone worker process
+
+drain and work import the app to register the job handlers (and load the model).
+"""
+
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+
+from api.jobs import job_queue, WorkerPool, STATUSES, PRIORITY_NORMAL
+
+
+def _ts(value):
+    return datetime.fromtimestamp(value).strftime('%Y-%m-%d %H:%M:%S') if value else '-'
+
+
+def cmd_stats(args):
+    counts = job_queue.stats()
+    if not counts:
+        print("Queue is empty")
+        return 0
+    print(f"{'kind':<14}" + ''.join(f"{s:>10}" for s in STATUSES))
+    for kind, by_status in sorted(counts.items()):
+        print(f"{kind:<14}" + ''.join(f"{by_status[s]:>10}" for s in STATUSES))
+    return 0
+
+
+def cmd_list(args):
+    for job in job_queue.list(status=args.status, kind=args.kind, limit=args.limit):
+        error = f"  {job['last_error']}" if job['last_error'] else ''
+        print(f"{job['id']:>8}  {job['kind']:<12} {job['status']:<8} p{job['priority']} "
+              f"{job['attempts']}/{job['max_attempts']}  created {_ts(job['created_at'])}"
+              f"  run_at {_ts(job['run_at'])}{error}")
+    return 0
+
+
+def cmd_show(args):
+    job = job_queue.get(args.id)
+    if job is None:
+        print(f"Job {args.id} not found", file=sys.stderr)
+        return 1
+    print(json.dumps(job, indent=2, default=str))
+    return 0
+
+
+def cmd_retry(args):
+    if args.id is None and not args.dead:
+        print("Give a job id or --dead", file=sys.stderr)
+        return 1
+    count = job_queue.retry(job_id=args.id, kind=args.kind)
+    print(f"Requeued {count} job(s)")
+    return 0
+
+
+def cmd_purge(args):
+    count = job_queue.purge(args.status, older_than_seconds=args.older_than_days * 86400)
+    print(f"Purged {count} {args.status} job(s)")
+    return 0
+
+
+def cmd_enqueue(args):
+    job_id = job_queue.enqueue(args.kind, json.loads(args.payload), priority=args.priority,
+                               dedupe_key=args.dedupe_key)
+    print(f"Enqueued job {job_id}" if job_id else "Duplicate dedupe key; nothing enqueued")
+    return 0
+
+
+def _worker_pool(threads=1, kinds=None):
+    from app import app  # registers the handlers
+    return WorkerPool(job_queue, app, threads=threads, kinds=kinds)
+
+
+def cmd_drain(args):
+    ran = _worker_pool(kinds=args.kind).drain()
+    print(f"Ran {ran} job(s)")
+    return 0
+
+
+def cmd_work(args):
+    workers = _worker_pool(threads=args.threads, kinds=args.kind)
+    workers.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        workers.stop()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI background job queue')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('stats', help='Job counts by kind and status').set_defaults(func=cmd_stats)
+
+    p = sub.add_parser('list', help='Most recent jobs')
+    p.add_argument('--status', choices=STATUSES)
+    p.add_argument('--kind')
+    p.add_argument('--limit', type=int, default=50)
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser('show', help='Full record of one job')
+    p.add_argument('id', type=int)
+    p.set_defaults(func=cmd_show)
+
+    p = sub.add_parser('retry', help='Requeue a job, or all dead jobs')
+    p.add_argument('id', type=int, nargs='?')
+    p.add_argument('--dead', action='store_true', help='Requeue every dead-lettered job')
+    p.add_argument('--kind', help='With --dead, only jobs of this kind')
+    p.set_defaults(func=cmd_retry)
+
+    p = sub.add_parser('purge', help='Delete finished jobs')
+    p.add_argument('--status', choices=('done', 'dead'), default='done')
+    p.add_argument('--older-than-days', type=float, default=7)
+    p.set_defaults(func=cmd_purge)
+
+    p = sub.add_parser('enqueue', help='Add a job by hand')
+    p.add_argument('kind')
+    p.add_argument('payload', nargs='?', default='{}', help='JSON payload')
+    p.add_argument('--priority', type=int, default=PRIORITY_NORMAL)
+    p.add_argument('--dedupe-key')
+    p.set_defaults(func=cmd_enqueue)
+
+    p = sub.add_parser('drain', help='Run all due jobs in this process and exit')
+    p.add_argument('--kind', action='append', help='Only these kinds (repeatable)')
+    p.set_defaults(func=cmd_drain)
+
+    p = sub.add_parser('work', help='Run a standalone worker until interrupted')
+    p.add_argument('--threads', type=int, default=1)
+    p.add_argument('--kind', action='append', help='Only these kinds (repeatable)')
+    p.set_defaults(func=cmd_work)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,4 @@
+"""
+Load-testing tools: a fake OpenAI-compatible completions server and a
+closed/open-loop load generator for the DermAI API.
+"""
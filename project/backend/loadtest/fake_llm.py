@@ -0,0 +1,257 @@
+"""
+Fake OpenAI-compatible completions server for load tests.
+
+Serves POST /v1/chat/completions (optionally streamed as server-sent events)
+and GET /v1/models with latency drawn from a configurable distribution, so
+the backend can be driven at high concurrency without touching Groq:
+
+    python -m loadtest.fake_llm --port 8001 --latency lognormal:0.8,0.5 --error-rate 0.01
+    LLM_BACKEND_URL=http://localhost:8001/v1 python app.py
+
+Latency specs: fixed:S, uniform:LO,HI, normal:MEAN,STDDEV,
+lognormal:MEDIAN,SIGMA, exp:MEAN (all in seconds).
+"""
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict
+
+ANALYSIS_TEXT = """1. CONDITION OVERVIEW
+• A common superficial skin infection
+• Usually spread by direct contact
+2. KEY SYMPTOMS
+• Red, scaly or blistered patches
+• Itching or tenderness
+3. TREATMENT APPROACHES
+• Topical treatment applied as directed for 2-4 weeks
+• Oral medication for extensive infection
+4. PREVENTION GUIDELINES
+• Keep skin clean and dry
+• Avoid sharing towels and clothing
+5. MEDICAL ATTENTION INDICATORS
+• No improvement after two weeks
+• Fever, spreading redness or pus"""
+
+CHAT_TEXT = """**Introduction**
+This is a simulated answer from the load-test completions server.
+
+**Overview**
+The condition you asked about is common and usually responds well to treatment.
+
+**Care Tips**
+1. Keep the affected area clean and dry.
+2. Follow the treatment course for its full length.
+
+**When to See a Doctor**
+See a dermatologist if symptoms worsen or do not improve within two weeks."""
+
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Build a sampler from a 'kind:arg1,arg2' spec; samples are clamped at 0"""
+    kind, _, raw = spec.partition(':')
+    args = [float(a) for a in raw.split(',') if a] if raw else []
+
+    samplers = {
+        'fixed': (1, lambda s: s),
+        'uniform': (2, lambda lo, hi: random.uniform(lo, hi)),
+        'normal': (2, lambda mean, sd: random.gauss(mean, sd)),
+        'lognormal': (2, lambda median, sigma: random.lognormvariate(math.log(median), sigma)),
+        'exp': (1, lambda mean: random.expovariate(1 / mean)),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Unknown latency distribution '{kind}'")
+    arity, sampler = samplers[kind]
+    if len(args) != arity:
+        raise ValueError(f"Latency '{kind}' takes {arity} argument(s), got {len(args)}")
+    return lambda: max(0.0, sampler(*args))
+
+
+class FakeLLMConfig:
+    def __init__(self, latency: str = 'lognormal:0.8,0.5', error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, tokens_per_second: float = 0.0):
+        self.latency = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.tokens_per_second = tokens_per_second
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {
+            'requests': 0, 'streamed': 0, 'errors': 0, 'rate_limited': 0,
+            'in_flight': 0, 'peak_in_flight': 0
+        }
+
+    def track(self, key: str, delta: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += delta
+            if key == 'in_flight':
+                self.stats['peak_in_flight'] = max(self.stats['peak_in_flight'], self.stats['in_flight'])
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.stats)
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    config: FakeLLMConfig = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict, headers: Dict[str, str] = None) -> None:
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') in ('/v1/models', '/models'):
+            self._send_json(200, {'object': 'list', 'data': [
+                {'id': 'llama3-70b-8192', 'object': 'model', 'owned_by': 'fake-llm'},
+                {'id': 'mixtral-8x7b-32768', 'object': 'model', 'owned_by': 'fake-llm'}
+            ]})
+        elif self.path.rstrip('/') == '/stats':
+            self._send_json(200, self.config.snapshot())
+        else:
+            self._send_json(404, {'error': {'message': 'Not found'}})
+
+    def do_POST(self):
+        if self.path.rstrip('/') not in ('/v1/chat/completions', '/chat/completions'):
+            self._send_json(404, {'error': {'message': 'Not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request_body = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': {'message': 'Invalid JSON'}})
+            return
+
+        config = self.config
+        config.track('requests')
+        config.track('in_flight')
+        try:
+            roll = random.random()
+            if roll < config.rate_limit_rate:
+                config.track('rate_limited')
+                self._send_json(429, {'error': {'message': 'Rate limit exceeded'}}, {'Retry-After': '1'})
+                return
+            if roll < config.rate_limit_rate + config.error_rate:
+                time.sleep(config.sample_latency())
+                config.track('errors')
+                self._send_json(500, {'error': {'message': 'Injected upstream error'}})
+                return
+
+            prompt = ' '.join(m.get('content', '') for m in request_body.get('messages', []))
+            text = ANALYSIS_TEXT if 'CONDITION OVERVIEW' in prompt else CHAT_TEXT
+            model = request_body.get('model', 'fake')
+
+            if request_body.get('stream'):
+                config.track('streamed')
+                self._stream(model, text)
+            else:
+                delay = config.sample_latency()
+                if config.tokens_per_second:
+                    delay += len(text.split()) / config.tokens_per_second
+                time.sleep(delay)
+                self._send_json(200, {
+                    'id': f'chatcmpl-fake-{int(time.time() * 1000)}',
+                    'object': 'chat.completion',
+                    'created': int(time.time()),
+                    'model': model,
+                    'choices': [{
+                        'index': 0,
+                        'message': {'role': 'assistant', 'content': text},
+                        'finish_reason': 'stop'
+                    }],
+                    'usage': {
+                        'prompt_tokens': len(prompt.split()),
+                        'completion_tokens': len(text.split()),
+                        'total_tokens': len(prompt.split()) + len(text.split())
+                    }
+                })
+        finally:
+            config.track('in_flight', -1)
+
+    def _stream(self, model: str, text: str) -> None:
+        """Send the answer word by word as OpenAI-style SSE chunks"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        # Latency sample is time to first token; the rest arrives at tokens_per_second
+        time.sleep(self.config.sample_latency())
+        interval = 1 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        created = int(time.time())
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            chunk = {
+                'id': f'chatcmpl-fake-{created}',
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': word if i == 0 else ' ' + word},
+                    'finish_reason': None
+                }]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            if interval:
+                time.sleep(interval)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    # The default listen backlog (5) resets connections when hundreds of
+    # requests arrive at once
+    request_queue_size = 1024
+
+
+def make_server(host: str, port: int, config: FakeLLMConfig) -> ThreadingHTTPServer:
+    handler = type('ConfiguredFakeLLMHandler', (FakeLLMHandler,), {'config': config})
+    server = FakeLLMServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fake OpenAI-compatible completions server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', default='lognormal:0.8,0.5',
+                        help='Latency distribution (fixed:S, uniform:LO,HI, normal:MEAN,SD, '
+                             'lognormal:MEDIAN,SIGMA, exp:MEAN)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Fraction answered with 429')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0,
+                        help='Generation speed added on top of the latency sample (0 = instant)')
+    args = parser.parse_args(argv)
+
+    config = FakeLLMConfig(args.latency, args.error_rate, args.rate_limit_rate, args.tokens_per_second)
+    server = make_server(args.host, args.port, config)
+    print(f"Fake LLM listening on http://{args.host}:{args.port}/v1 (latency {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
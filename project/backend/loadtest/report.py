@@ -0,0 +1,190 @@
+"""
+Aggregate load-test samples into per-endpoint statistics and render them as
+JSON and a self-contained HTML page.
+"""
+
+import json
+import html
+import math
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+PERCENTILES = (50, 95, 99)
+
+
+class Sample:
+    __slots__ = ('endpoint', 'scheduled', 'started', 'finished', 'status', 'error', 'stages')
+
+    def __init__(self, endpoint: str, scheduled: float, started: float, finished: float,
+                 status: int, error: Optional[str] = None, stages: Optional[Dict[str, float]] = None):
+        self.endpoint = endpoint
+        self.scheduled = scheduled
+        self.started = started
+        self.finished = finished
+        self.status = status
+        self.error = error
+        self.stages = stages or {}
+
+    @property
+    def latency(self) -> float:
+        # Measured from the scheduled send time so queueing in the generator
+        # counts against the server (no coordinated omission in open loop)
+        return self.finished - self.scheduled
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """'stage;dur=12.3, total;dur=40' -> {'stage': 0.0123, 'total': 0.04}"""
+    stages = {}
+    for part in (header or '').split(','):
+        name, _, params = part.strip().partition(';')
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'dur':
+                try:
+                    stages[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return stages
+
+
+def _summarize(samples: List[Sample], duration: float) -> Dict[str, object]:
+    latencies = sorted(s.latency for s in samples if s.error is None)
+    errors = defaultdict(int)
+    for s in samples:
+        if s.error is not None:
+            errors[s.error] += 1
+
+    stage_totals, stage_counts = defaultdict(float), defaultdict(int)
+    for s in samples:
+        for name, seconds in s.stages.items():
+            stage_totals[name] += seconds
+            stage_counts[name] += 1
+
+    summary = {
+        'requests': len(samples),
+        'successes': len(latencies),
+        'errors': dict(errors),
+        'error_rate': (len(samples) - len(latencies)) / len(samples) if samples else 0.0,
+        'throughput_rps': len(latencies) / duration if duration else 0.0,
+        'latency_s': {
+            'mean': sum(latencies) / len(latencies) if latencies else None,
+            'min': latencies[0] if latencies else None,
+            'max': latencies[-1] if latencies else None,
+            **{f'p{p}': percentile(latencies, p) for p in PERCENTILES}
+        },
+        'server_stages_mean_s': {
+            name: stage_totals[name] / stage_counts[name] for name in sorted(stage_totals)
+        }
+    }
+    return summary
+
+
+def _timeline(samples: List[Sample], start: float, bucket: float = 1.0) -> List[Dict[str, object]]:
+    buckets = defaultdict(list)
+    for s in samples:
+        buckets[int((s.finished - start) // bucket)].append(s)
+    timeline = []
+    for index in range(max(buckets) + 1 if buckets else 0):
+        items = buckets.get(index, [])
+        ok = sorted(s.latency for s in items if s.error is None)
+        timeline.append({
+            't': index * bucket,
+            'rps': len(ok) / bucket,
+            'errors': len(items) - len(ok),
+            'p95_s': percentile(ok, 95)
+        })
+    return timeline
+
+
+def build_report(samples: List[Sample], start: float, duration: float,
+                 settings: Dict[str, object]) -> Dict[str, object]:
+    by_endpoint = defaultdict(list)
+    for s in samples:
+        by_endpoint[s.endpoint].append(s)
+
+    return {
+        'settings': settings,
+        'duration_s': duration,
+        'overall': _summarize(samples, duration),
+        'endpoints': {name: _summarize(items, duration) for name, items in sorted(by_endpoint.items())},
+        'timeline': _timeline(samples, start)
+    }
+
+
+def write_json(report: Dict[str, object], path: str) -> None:
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2)
+
+
+def _ms(value: Optional[float]) -> str:
+    return '-' if value is None else f"{value * 1000:.1f}"
+
+
+def _polyline(points: List[float], width: int, height: int, top: float) -> str:
+    if not points or not top:
+        return ''
+    step = width / max(1, len(points) - 1)
+    return ' '.join(f"{i * step:.1f},{height - (v / top) * height:.1f}" for i, v in enumerate(points))
+
+
+def write_html(report: Dict[str, object], path: str) -> None:
+    rows = []
+    for name, stats in [('all', report['overall'])] + list(report['endpoints'].items()):
+        lat = stats['latency_s']
+        errors = ', '.join(f"{k}: {v}" for k, v in sorted(stats['errors'].items())) or '-'
+        rows.append(
+            f"<tr><td>{html.escape(name)}</td><td>{stats['requests']}</td>"
+            f"<td>{stats['throughput_rps']:.2f}</td><td>{_ms(lat['p50'])}</td><td>{_ms(lat['p95'])}</td>"
+            f"<td>{_ms(lat['p99'])}</td><td>{_ms(lat['max'])}</td>"
+            f"<td>{stats['error_rate']:.2%}</td><td>{html.escape(errors)}</td></tr>"
+        )
+
+    stage_rows = []
+    for name, stats in report['endpoints'].items():
+        for stage_name, seconds in stats['server_stages_mean_s'].items():
+            stage_rows.append(f"<tr><td>{html.escape(name)}</td><td>{html.escape(stage_name)}</td>"
+                              f"<td>{_ms(seconds)}</td></tr>")
+
+    timeline = report['timeline']
+    width, height = 800, 200
+    rps = [t['rps'] for t in timeline]
+    p95 = [t['p95_s'] or 0.0 for t in timeline]
+    settings = html.escape(json.dumps(report['settings'], indent=2))
+
+    page = f"""<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>DermAI load test</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; color: #222; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ border: 1px solid #ccc; padding: 4px 10px; text-align: right; }}
+th:first-child, td:first-child, td:nth-child(2) {{ text-align: left; }}
+svg {{ border: 1px solid #ccc; margin-bottom: 0.5em; }}
+pre {{ background: #f6f6f6; padding: 1em; }}
+</style></head><body>
+<h1>DermAI load test</h1>
+<p>Duration {report['duration_s']:.1f} s. Latencies in milliseconds, measured from the scheduled send time.</p>
+<h2>Endpoints</h2>
+<table><tr><th>Endpoint</th><th>Requests</th><th>Throughput (req/s)</th><th>p50</th><th>p95</th>
+<th>p99</th><th>max</th><th>Error rate</th><th>Errors</th></tr>
+{''.join(rows)}</table>
+<h2>Throughput over time (max {max(rps, default=0):.1f} req/s)</h2>
+<svg width="{width}" height="{height}"><polyline fill="none" stroke="#2a7ab9" stroke-width="2"
+ points="{_polyline(rps, width, height, max(rps, default=0))}"/></svg>
+<h2>p95 latency over time (max {_ms(max(p95, default=0))} ms)</h2>
+<svg width="{width}" height="{height}"><polyline fill="none" stroke="#c0392b" stroke-width="2"
+ points="{_polyline(p95, width, height, max(p95, default=0))}"/></svg>
+<h2>Server-Timing stages (mean)</h2>
+<table><tr><th>Endpoint</th><th>Stage</th><th>ms</th></tr>{''.join(stage_rows)}</table>
+<h2>Settings</h2><pre>{settings}</pre>
+</body></html>
+"""
+    with open(path, 'w') as f:
+        f.write(page)
@@ -0,0 +1,214 @@
+"""
+Load generator for /api/analyze and /chat/chat.
+
+Closed loop: --users virtual users each send a request, wait for the answer,
+think for --think-time seconds and repeat. Open loop: requests are sent as a
+Poisson process at --rate per second regardless of how fast the server
+answers; latency is measured from the scheduled send time so a slow server
+cannot hide its queueing.
+
+    python -m loadtest.run --url http://localhost:5002 --mode closed --users 16 --duration 60
+    python -m loadtest.run --mode open --rate 20 --mix analyze=1,chat=4 --html report.html
+
+Rate limits apply per client IP; start the server with RATELIMIT_ENABLED=false
+or 429s will dominate the results.
+"""
+
+import os
+import time
+import random
+import argparse
+import itertools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import httpx
+
+from loadtest.report import Sample, build_report, parse_server_timing, write_json, write_html
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_IMAGES = os.path.join(BACKEND_DIR, 'static', 'uploads')
+
+CHAT_QUESTIONS = (
+    "What is ringworm and how is it treated?",
+    "How long does impetigo last?",
+    "Is chickenpox contagious for adults?",
+    "What are the early signs of shingles?",
+    "How do I get rid of athlete's foot?",
+    "Can nail fungus spread to other nails?",
+    "What causes cellulitis?",
+    "How is creeping eruption treated?",
+)
+
+
+class Workload:
+    """Builds requests for each endpoint from the image corpus and question list"""
+
+    def __init__(self, base_url: str, images_dir: str, mix: Dict[str, float],
+                 user_pool: int, timeout: float, max_connections: int):
+        self.base_url = base_url.rstrip('/')
+        self.mix = mix
+        self.users = [f"loadtest-{i}" for i in range(user_pool)]
+        self.images = [
+            (name, open(os.path.join(images_dir, name), 'rb').read())
+            for name in sorted(os.listdir(images_dir))
+            if name.lower().endswith(('.png', '.jpg', '.jpeg'))
+        ] if 'analyze' in mix else []
+        if 'analyze' in mix and not self.images:
+            raise ValueError(f"No images found in {images_dir}")
+        self._image_cycle = itertools.cycle(self.images)
+        self._cycle_lock = threading.Lock()
+        self.client = httpx.Client(
+            base_url=self.base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections)
+        )
+
+    def pick_endpoint(self) -> str:
+        names, weights = zip(*self.mix.items())
+        return random.choices(names, weights)[0]
+
+    def _send(self, endpoint: str) -> httpx.Response:
+        user_id = random.choice(self.users)
+        if endpoint == 'analyze':
+            with self._cycle_lock:
+                name, data = next(self._image_cycle)
+            return self.client.post('/api/analyze', data={'user_id': user_id},
+                                    files={'image': (name, data, 'image/jpeg')})
+        if endpoint == 'chat':
+            return self.client.post('/chat/chat', json={
+                'message': random.choice(CHAT_QUESTIONS), 'user_id': user_id
+            })
+        if endpoint == 'history':
+            return self.client.get('/api/analysis/history', params={'user_id': user_id})
+        raise ValueError(f"Unknown endpoint '{endpoint}'")
+
+    def execute(self, endpoint: str, scheduled: float) -> Sample:
+        started = time.perf_counter()
+        status, error, stages = 0, None, {}
+        try:
+            response = self._send(endpoint)
+            status = response.status_code
+            stages = parse_server_timing(response.headers.get('Server-Timing'))
+            if status >= 400:
+                error = f"http_{status}"
+            elif response.headers.get('Content-Type', '').startswith('application/json') \
+                    and response.json().get('success') is False:
+                error = 'app_error'
+        except httpx.TimeoutException:
+            error = 'timeout'
+        except httpx.TransportError as e:
+            error = type(e).__name__
+        return Sample(endpoint, scheduled, started, time.perf_counter(), status, error, stages)
+
+    def close(self) -> None:
+        self.client.close()
+
+
+def run_closed(workload: Workload, users: int, duration: float, think_time: float) -> List[Sample]:
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    stop_at = time.perf_counter() + duration
+
+    def user_loop():
+        while time.perf_counter() < stop_at:
+            sample = workload.execute(workload.pick_endpoint(), time.perf_counter())
+            with lock:
+                samples.append(sample)
+            if think_time:
+                time.sleep(random.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=user_loop, daemon=True) for _ in range(users)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def run_open(workload: Workload, rate: float, duration: float, max_in_flight: int) -> List[Sample]:
+    futures = []
+    start = time.perf_counter()
+    next_send = start
+    with ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix='loadgen') as pool:
+        while next_send < start + duration:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(pool.submit(workload.execute, workload.pick_endpoint(), next_send))
+            next_send += random.expovariate(rate)
+    return [f.result() for f in futures]
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.partition('=')
+        mix[name.strip()] = float(weight) if weight else 1.0
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='DermAI load generator')
+    parser.add_argument('--url', default='http://localhost:5002')
+    parser.add_argument('--mode', choices=('closed', 'open'), default='closed')
+    parser.add_argument('--users', type=int, default=8, help='Concurrent virtual users (closed loop)')
+    parser.add_argument('--think-time', type=float, default=0.0, help='Mean think time between requests (closed loop)')
+    parser.add_argument('--rate', type=float, default=5.0, help='Arrival rate in requests/s (open loop)')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Client-side concurrency cap (open loop)')
+    parser.add_argument('--duration', type=float, default=30.0)
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds of load excluded from the statistics')
+    parser.add_argument('--mix', default='analyze=1,chat=3', help='Endpoint weights, e.g. analyze=1,chat=3,history=1')
+    parser.add_argument('--images', default=DEFAULT_IMAGES, help='Directory of images to upload')
+    parser.add_argument('--user-pool', type=int, default=50, help='Distinct user_ids to spread load over')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--json', dest='json_path', help='Write the JSON report here')
+    parser.add_argument('--html', dest='html_path', help='Write the HTML report here')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args(argv)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    mix = parse_mix(args.mix)
+    connections = args.users if args.mode == 'closed' else args.max_in_flight
+    workload = Workload(args.url, args.images, mix, args.user_pool, args.timeout, connections)
+
+    total = args.warmup + args.duration
+    print(f"{args.mode}-loop load against {args.url} for {total:.0f}s "
+          f"({args.warmup:.0f}s warm-up), mix {mix}")
+    start = time.perf_counter()
+    try:
+        if args.mode == 'closed':
+            samples = run_closed(workload, args.users, total, args.think_time)
+        else:
+            samples = run_open(workload, args.rate, total, args.max_in_flight)
+    finally:
+        workload.close()
+
+    measured_from = start + args.warmup
+    measured = [s for s in samples if s.scheduled >= measured_from]
+    elapsed = max(s.finished for s in measured) - measured_from if measured else 0.0
+    settings = {k: v for k, v in vars(args).items() if k not in ('json_path', 'html_path')}
+    report = build_report(measured, measured_from, elapsed, settings)
+
+    for name, stats in [('all', report['overall'])] + list(report['endpoints'].items()):
+        lat = stats['latency_s']
+        fmt = lambda v: '-' if v is None else f"{v * 1000:.0f}ms"
+        print(f"{name:<10} n={stats['requests']:<6} {stats['throughput_rps']:7.2f} req/s  "
+              f"p50={fmt(lat['p50'])} p95={fmt(lat['p95'])} p99={fmt(lat['p99'])}  "
+              f"errors={stats['error_rate']:.1%} {stats['errors'] or ''}")
+
+    if args.json_path:
+        write_json(report, args.json_path)
+        print(f"JSON report written to {args.json_path}")
+    if args.html_path:
+        write_html(report, args.html_path)
+        print(f"HTML report written to {args.html_path}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,151 @@
+"""
+Manage the versioned model registry (see api/model_registry.py).
+
+    python model_cli.py list
+    python model_cli.py register checkpoints/run42.pth --version v3 --notes "retrained on 2026-10 data"
+    python model_cli.py activate v3
+    python model_cli.py rollback
+    python model_cli.py remove v1
+    python model_cli.py shadow-report v4    # how a shadow-evaluated candidate compares
+
+register loads the checkpoint into the serving architecture and runs a
+forward pass before copying it into the registry, so a broken file is
+rejected here instead of failing every server's swap. Serving processes
+switch within MODEL_REGISTRY_POLL_SECONDS of activate or rollback.
+shadow-report summarises the shadow evaluation of a candidate version
+(SHADOW_MODEL_VERSION, see api/shadow.py) before it is activated.
+"""
+
+import sys
+import argparse
+
+import torch
+
+from api.model_registry import registry, MODEL_REGISTRY_DIR, MODEL_REGISTRY_POLL_SECONDS
+from api.shadow import summarize, report_path, SHADOW_MODEL_VERSION
+from api.skin_analysis import CLASS_NAMES, SkinDiseaseModel, load_checkpoint_weights
+
+
+def verify_checkpoint(path: str) -> None:
+    model = SkinDiseaseModel(num_classes=len(CLASS_NAMES), pretrained=False)
+    model.load_state_dict(load_checkpoint_weights(path, 'cpu'))
+    with torch.inference_mode():
+        logits = model.eval()(torch.zeros(1, 3, 224, 224))
+    if logits.shape != (1, len(CLASS_NAMES)) or not torch.isfinite(logits).all():
+        raise ValueError(f"unexpected output {tuple(logits.shape)} from {path}")
+
+
+def _announce(entry) -> None:
+    print(f"Active version: {entry.version}")
+    if MODEL_REGISTRY_POLL_SECONDS > 0:
+        print(f"Servers switch within {MODEL_REGISTRY_POLL_SECONDS:.0f}s")
+    else:
+        print("MODEL_REGISTRY_POLL_SECONDS=0: restart the servers to apply it")
+
+
+def cmd_list(args):
+    active = registry.manifest().get('active')
+    entries = registry.versions()
+    if not entries:
+        print(f"No versions registered in {MODEL_REGISTRY_DIR}")
+    for entry in entries:
+        marker = '*' if entry.version == active else ' '
+        print(f"{marker} {entry.version:<28} {entry.sha256[:12]}  {entry.registered_at or '':<26}  {entry.notes}")
+    return 0
+
+
+def cmd_register(args):
+    try:
+        verify_checkpoint(args.checkpoint)
+    except Exception as e:
+        print(f"Cannot load {args.checkpoint}: {e}", file=sys.stderr)
+        return 1
+    try:
+        entry = registry.register(args.checkpoint, version=args.version, notes=args.notes)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"Registered {entry.version} ({entry.sha256[:12]})")
+    if args.activate:
+        _announce(registry.activate(entry.version))
+    return 0
+
+
+def cmd_activate(args):
+    try:
+        entry = registry.rollback() if args.command == 'rollback' else registry.activate(args.version)
+    except KeyError as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+    _announce(entry)
+    return 0
+
+
+def cmd_remove(args):
+    try:
+        registry.remove(args.version)
+    except (KeyError, ValueError) as e:
+        print(e.args[0], file=sys.stderr)
+        return 1
+    print(f"Removed {args.version}")
+    return 0
+
+
+def cmd_shadow_report(args):
+    version = args.version or SHADOW_MODEL_VERSION
+    if not version:
+        print("Name the candidate version (or set SHADOW_MODEL_VERSION)", file=sys.stderr)
+        return 1
+    path = report_path(version)
+    report = summarize(path)
+    if not report['samples']:
+        print(f"No shadow samples in {path}", file=sys.stderr)
+        return 1
+    print(f"{report['samples']} samples of {version} in {path}")
+    print(f"top-1 agreement with the served model: {report['agreement']:.2%}")
+    print(f"top-1 confidence delta: {report['mean_confidence_delta']:+.4f} mean, "
+          f"{report['mean_abs_confidence_delta']:.4f} mean absolute")
+    print(f"candidate forward pass: p50 {report['candidate_ms_p50']:.1f} ms, "
+          f"p95 {report['candidate_ms_p95']:.1f} ms")
+    # The candidate runs one full-model view; only 'full' compares like with like
+    for stage, row in report['by_stage'].items():
+        print(f"  served by {stage:<8} {row['samples']:>6} samples, agreement {row['agreement']:.2%}, "
+              f"confidence delta {row['mean_confidence_delta']:+.4f}")
+    for pair, count in report['disagreements'].items():
+        print(f"  {count:>6}  {pair}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='DermAI model registry')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    sub.add_parser('list', help='Registered versions (* = active)').set_defaults(func=cmd_list)
+
+    p = sub.add_parser('register', help='Verify a checkpoint and add it as a new version')
+    p.add_argument('checkpoint')
+    p.add_argument('--version', help='Version name (default: timestamp and hash)')
+    p.add_argument('--notes', default='')
+    p.add_argument('--activate', action='store_true', help='Make it the active version')
+    p.set_defaults(func=cmd_register)
+
+    p = sub.add_parser('activate', help='Serve a registered version')
+    p.add_argument('version')
+    p.set_defaults(func=cmd_activate)
+
+    sub.add_parser('rollback', help='Re-activate the previously active version').set_defaults(func=cmd_activate)
+
+    p = sub.add_parser('remove', help='Delete an inactive version')
+    p.add_argument('version')
+    p.set_defaults(func=cmd_remove)
+
+    p = sub.add_parser('shadow-report', help='Summarise the shadow evaluation of a candidate')
+    p.add_argument('version', nargs='?', help='Candidate version (default: SHADOW_MODEL_VERSION)')
+    p.set_defaults(func=cmd_shadow_report)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
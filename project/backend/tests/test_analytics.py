@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+import pytest
+from flask import Flask
+
+from api.analytics import rebuild_summaries, user_summary
+from api.skin_analysis import db, ConditionSummary, ConditionTrend, SkinAnalysisResult, upgrade_schema
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        yield app
+        db.session.remove()
+
+
+def _add(user_id, condition, confidence, timestamp):
+    analysis = SkinAnalysisResult(user_id=user_id, primary_condition=condition, confidence=confidence,
+                                  timestamp=timestamp, image_path='x.jpg', detailed_analysis='{}')
+    db.session.add(analysis)
+    return analysis
+
+
+def _tables():
+    summary = sorted((r.user_id, r.condition, r.count, round(r.confidence_sum, 9), r.first_seen, r.last_seen)
+                     for r in ConditionSummary.query.all())
+    trend = sorted((r.user_id, r.condition, r.period, r.count, round(r.confidence_sum, 9))
+                   for r in ConditionTrend.query.all())
+    return summary, trend
+
+
+def test_inserts_and_deletes_maintain_the_summary(app):
+    now = datetime.utcnow()
+    old = _add('u', 'Ringworm', 60.0, now - timedelta(days=40))
+    _add('u', 'Ringworm', 80.0, now - timedelta(days=1))
+    newest = _add('u', 'Ringworm', 90.0, now)
+    _add('u', 'Nail Fungus', 50.0, now)
+    _add('someone else', 'Ringworm', 10.0, now)
+    db.session.commit()
+
+    ringworm = db.session.get(ConditionSummary, ('u', 'Ringworm'))
+    assert (ringworm.count, ringworm.confidence_sum) == (3, 230.0)
+    assert (ringworm.first_seen, ringworm.last_seen) == (old.timestamp, newest.timestamp)
+
+    # Deleting the newest analysis moves last_seen back to the next newest
+    db.session.delete(newest)
+    db.session.commit()
+    ringworm = db.session.get(ConditionSummary, ('u', 'Ringworm'))
+    assert (ringworm.count, ringworm.confidence_sum) == (2, 140.0)
+    assert ringworm.last_seen == now - timedelta(days=1)
+
+    incremental = _tables()
+    rebuild_summaries()
+    assert _tables() == incremental
+
+
+def test_deleting_the_last_analysis_removes_the_rows(app):
+    analysis = _add('u', 'Ringworm', 70.0, datetime.utcnow())
+    db.session.commit()
+    db.session.delete(analysis)
+    db.session.commit()
+    assert _tables() == ([], [])
+
+
+def test_user_summary(app):
+    now = datetime.utcnow()
+    _add('u', 'Ringworm', 60.0, now)
+    _add('u', 'Ringworm', 80.0, now)
+    _add('u', 'Nail Fungus', 40.0, now)
+    _add('u', 'Nail Fungus', 50.0, now - timedelta(days=800))  # outside the trend window
+    db.session.commit()
+
+    summary = user_summary('u', months=3)
+    assert summary['total_analyses'] == 4
+    assert summary['average_confidence'] == pytest.approx(57.5)
+    assert [(c['condition'], c['count'], c['average_confidence']) for c in summary['conditions']] == [
+        ('Nail Fungus', 2, 45.0), ('Ringworm', 2, 70.0)
+    ]
+    assert [m['period'] for m in summary['monthly']][-1] == now.strftime('%Y-%m')
+    assert len(summary['monthly']) == 3
+    assert summary['monthly'][-1]['conditions'] == {'Ringworm': 2, 'Nail Fungus': 1}
+    assert summary['monthly'][-1]['average_confidence'] == pytest.approx(60.0)
+    assert summary['monthly'][0]['count'] == 0 and summary['monthly'][0]['average_confidence'] is None
+
+    assert user_summary('nobody')['total_analyses'] == 0
+
+
+def test_rebuild_one_user(app):
+    _add('a', 'Ringworm', 60.0, datetime.utcnow())
+    _add('b', 'Ringworm', 70.0, datetime.utcnow())
+    db.session.commit()
+    ConditionSummary.query.delete()
+    ConditionTrend.query.delete()
+    db.session.commit()
+
+    assert rebuild_summaries('a') == (1, 1)
+    assert [r.user_id for r in ConditionSummary.query.all()] == ['a']
@@ -0,0 +1,58 @@
+import asyncio
+
+import httpx
+from flask import Flask, jsonify
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+from api.asgi_server import AsyncDispatcher
+
+
+def _build():
+    app = Flask(__name__)
+    limiter = Limiter(get_remote_address, app=app, storage_uri='memory://', default_limits=['1 per hour'])
+
+    @app.route('/api/analyze', methods=['POST'])
+    @limiter.limit('2 per minute')
+    def analyze():
+        return jsonify(served_by='wsgi')
+
+    @app.route('/chat/chat', methods=['POST'])
+    def chat():
+        return jsonify(served_by='wsgi')
+
+    dispatcher = AsyncDispatcher(app, limiter=limiter, io_threads=2, inference_threads=1)
+
+    @dispatcher.route('/api/analyze')
+    @dispatcher.route('/chat/chat')
+    async def native(req):
+        return jsonify(served_by='asgi')
+
+    return app, dispatcher
+
+
+def _post(asgi_app, path: str, times: int):
+    async def run():
+        transport = httpx.ASGITransport(app=asgi_app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            return [(await client.post(path)) for _ in range(times)]
+    return asyncio.run(run())
+
+
+def test_native_route_enforces_the_view_limit():
+    app, dispatcher = _build()
+    responses = _post(dispatcher, '/api/analyze', 3)
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].json() == {'served_by': 'asgi'}
+
+
+def test_native_route_matches_wsgi_mode():
+    app, _ = _build()
+    client = app.test_client()
+    assert [client.post('/api/analyze').status_code for _ in range(3)] == [200, 200, 429]
+
+
+def test_default_limits_on_undecorated_native_route_are_counted_once():
+    _, dispatcher = _build()
+    assert [r.status_code for r in _post(dispatcher, '/chat/chat', 2)] == [200, 429]
+
@@ -0,0 +1,48 @@
+import torch
+
+from api.cascade import calibrate_threshold, ESCALATE_ALL
+
+
+def _probs(confidences, predictions, classes=3):
+    probs = torch.zeros(len(confidences), classes)
+    for row, (confidence, prediction) in enumerate(zip(confidences, predictions)):
+        probs[row] = (1 - confidence) / (classes - 1)
+        probs[row, prediction] = confidence
+    return probs
+
+
+def test_threshold_accepts_only_confident_correct_student_answers():
+    # The student is right on its three most confident answers and wrong below
+    student = _probs([0.95, 0.9, 0.8, 0.7, 0.6], [0, 1, 2, 1, 0])
+    targets = torch.tensor([0, 1, 2, 0, 1])
+    full = targets.clone()
+    report = calibrate_threshold(student, full, targets, max_accuracy_drop=0.0)
+    assert abs(report['threshold'] - 0.8) < 1e-6
+    assert report['escalation_rate'] == 0.4
+    assert report['cascade_accuracy'] == report['full_accuracy'] == 1.0
+    assert report['student_accuracy'] == 0.6
+
+
+def test_allowed_accuracy_drop_lowers_the_threshold():
+    student = _probs([0.95, 0.9, 0.8, 0.7, 0.6], [0, 1, 2, 1, 0])
+    targets = torch.tensor([0, 1, 2, 0, 0])
+    report = calibrate_threshold(student, targets.clone(), targets, max_accuracy_drop=0.2)
+    assert abs(report['threshold'] - 0.6) < 1e-6  # one wrong answer (-0.2) is allowed
+    assert abs(report['cascade_accuracy'] - 0.8) < 1e-6
+
+
+def test_ties_are_never_split():
+    # Two answers share the cut-off confidence; accepting one means accepting both
+    student = _probs([0.9, 0.7, 0.7], [0, 1, 0])
+    targets = torch.tensor([0, 1, 1])
+    report = calibrate_threshold(student, targets.clone(), targets, max_accuracy_drop=0.0)
+    assert abs(report['threshold'] - 0.9) < 1e-6
+    assert abs(report['escalation_rate'] - 2 / 3) < 1e-9
+
+
+def test_untrustworthy_student_escalates_everything():
+    student = _probs([0.9, 0.8], [1, 0])
+    targets = torch.tensor([0, 1])
+    report = calibrate_threshold(student, targets.clone(), targets, max_accuracy_drop=0.0)
+    assert report['threshold'] == ESCALATE_ALL
+    assert report['escalation_rate'] == 1.0
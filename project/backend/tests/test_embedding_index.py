@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from api.embedding_index import EmbeddingIndex
+
+DIM = 8
+
+
+@pytest.fixture
+def index(tmp_path):
+    return EmbeddingIndex(str(tmp_path / 'v1'), dim=DIM)
+
+
+def _basis(i, scale=1.0):
+    vector = np.zeros(DIM, dtype=np.float32)
+    vector[i] = scale
+    return vector
+
+
+def test_empty_index(index):
+    assert len(index) == 0
+    assert index.get(1) is None
+    assert index.search(_basis(0)) == []
+
+
+def test_add_normalises_and_get_returns_latest(index):
+    index.add(1, _basis(0, scale=3.0))
+    np.testing.assert_allclose(index.get(1), _basis(0), atol=1e-3)
+    index.add(1, _basis(1))
+    np.testing.assert_allclose(index.get(1), _basis(1), atol=1e-3)
+
+
+def test_add_many_rejects_wrong_shape(index):
+    with pytest.raises(ValueError):
+        index.add_many([1, 2], np.ones((1, DIM)))
+    with pytest.raises(ValueError):
+        index.add(1, np.ones(DIM + 1))
+
+
+def test_search_ranks_by_cosine_similarity(index):
+    index.add_many([1, 2, 3], np.stack([_basis(0), _basis(0) + _basis(1), _basis(2)]))
+    results = index.search(_basis(0), k=3)
+    assert [analysis_id for analysis_id, _ in results] == [1, 2, 3]
+    assert results[0][1] == pytest.approx(1.0, abs=1e-3)
+    assert results[1][1] == pytest.approx(2 ** -0.5, abs=1e-3)
+    assert results[2][1] == pytest.approx(0.0, abs=1e-3)
+
+
+def test_search_restrict_exclude_and_duplicates(index):
+    index.add_many([1, 2, 3], np.stack([_basis(0), _basis(0), _basis(1)]))
+    index.add(2, _basis(0))  # re-indexed: reported once
+    ranked = [i for i, _ in index.search(_basis(0), k=5)]
+    assert sorted(ranked[:2]) == [1, 2] and ranked[2:] == [3]
+    assert [i for i, _ in index.search(_basis(0), k=5, exclude=[1])] == [2, 3]
+    assert [i for i, _ in index.search(_basis(0), k=5, restrict_to=[3, 1])] == [1, 3]
+
+
+def test_compact_keeps_latest_row_of_live_ids(index):
+    index.add_many([1, 2, 3], np.stack([_basis(0), _basis(1), _basis(2)]))
+    index.add(2, _basis(3))
+    assert index.compact(live_ids=[2, 3]) == (4, 2)
+    assert sorted(index.ids().tolist()) == [2, 3]
+    assert index.get(1) is None
+    np.testing.assert_allclose(index.get(2), _basis(3), atol=1e-3)
+
+    reopened = EmbeddingIndex(index.directory, dim=DIM)
+    assert len(reopened) == 2
+    assert reopened.search(_basis(3), k=1)[0][0] == 2
@@ -0,0 +1,46 @@
+import pytest
+import torch
+
+from api.skin_analysis import DermatologyAnalyzer, CLASS_NAMES
+
+
+@pytest.fixture
+def analyzer(monkeypatch):
+    # No model: enrichment must not need one
+    analyzer = DermatologyAnalyzer.__new__(DermatologyAnalyzer)
+    analyzer.class_names = CLASS_NAMES
+
+    def no_forward_pass(*args, **kwargs):
+        raise AssertionError("enrichment ran the model")
+    monkeypatch.setattr(analyzer, '_classify_tensor', no_forward_pass, raising=False)
+    return analyzer
+
+
+def test_enrichment_report_is_built_from_the_stored_prediction(analyzer, monkeypatch):
+    reports = []
+
+    def llm(report):
+        reports.append(report)
+        return "1. CONDITION OVERVIEW\n• Stored condition"
+    monkeypatch.setattr(analyzer, '_get_groq_analysis', llm)
+
+    stored = [(CLASS_NAMES[2], 81.5), (CLASS_NAMES[0], 10.0), (CLASS_NAMES[1], 4.25)]
+    sections = analyzer.enrich_analysis('/uploads/abc.jpg', stored)
+
+    assert sections['overview'] == ['Stored condition']
+    assert f"Condition: {CLASS_NAMES[2]}\nConfidence: 81.5%" in reports[0]
+    assert f"1. {CLASS_NAMES[0]}\n   • Confidence: 10.0%" in reports[0]
+
+
+def test_enrichment_report_matches_the_one_served_at_classification(analyzer, monkeypatch):
+    probabilities = torch.tensor([0.815, 0.1, 0.0425])
+    indices = torch.tensor([2, 0, 1])
+    served = analyzer._generate_initial_report('abc.jpg', analyzer._format_predictions(probabilities, indices))
+
+    reports = []
+    monkeypatch.setattr(analyzer, '_get_groq_analysis', lambda report: reports.append(report) or '')
+    stored = [[p['condition'], p['confidence']] for p in analyzer._format_predictions(probabilities, indices)]
+
+    # Same text, so the answer cache entry of the shed request is reused; no sections -> retry
+    assert analyzer.enrich_analysis('abc.jpg', stored) is None
+    assert reports == [served]
@@ -0,0 +1,129 @@
+import io
+import csv
+import json
+import tarfile
+from datetime import datetime
+
+import pyarrow.parquet as pq
+import pytest
+from flask import Flask
+
+from api.export import CsvEncoder, ExportError, ExportQuery, NdjsonEncoder, stream_export
+from api.skin_analysis import db, ChatMessage, SkinAnalysisResult, upgrade_schema
+
+COLUMNS = ('id', 'timestamp', 'confidence')
+ROWS = [{'id': 1, 'timestamp': datetime(2026, 3, 1, 12, 30), 'confidence': 81.5},
+        {'id': 2, 'timestamp': datetime(2026, 3, 2), 'confidence': 9.25}]
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        upgrade_schema()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def analyses(app, tmp_path):
+    """Five analyses on consecutive days; the image of the third has been deleted"""
+    for day in range(1, 6):
+        image = tmp_path / f"upload{day}.jpg"
+        if day != 3:
+            image.write_bytes(bytes([day]) * (700 * day))
+        db.session.add(SkinAnalysisResult(
+            user_id='u1' if day % 2 else 'u2', timestamp=datetime(2026, 3, day),
+            image_path=str(image), primary_condition='Ringworm' if day < 4 else 'Acne',
+            confidence=50.0 + day, detailed_analysis='{}', model_version='v1', model_stage='full'))
+    db.session.commit()
+
+
+def _export(query, fmt, **kwargs):
+    return b''.join(stream_export(query, fmt, **kwargs))
+
+
+def test_ndjson_encoder():
+    encoder = NdjsonEncoder(COLUMNS)
+    data = encoder.begin() + encoder.encode(ROWS) + encoder.end()
+    lines = [json.loads(line) for line in data.decode().splitlines()]
+    assert lines[0] == {'id': 1, 'timestamp': '2026-03-01T12:30:00', 'confidence': 81.5}
+    assert len(lines) == 2
+
+
+def test_csv_encoder_writes_header_once():
+    encoder = CsvEncoder(COLUMNS)
+    data = encoder.begin() + encoder.encode(ROWS[:1]) + encoder.encode(ROWS[1:]) + encoder.end()
+    assert list(csv.reader(io.StringIO(data.decode()))) == [
+        ['id', 'timestamp', 'confidence'],
+        ['1', '2026-03-01T12:30:00', '81.5'],
+        ['2', '2026-03-02T00:00:00', '9.25'],
+    ]
+
+
+def test_query_validation():
+    with pytest.raises(ExportError):
+        ExportQuery.parse('users')
+    with pytest.raises(ExportError):
+        ExportQuery.parse('analyses', condition='Sunburn')
+    with pytest.raises(ExportError):
+        ExportQuery.parse('chats', condition='Acne')
+    with pytest.raises(ExportError):
+        ExportQuery.parse('analyses', since='yesterday')
+    with pytest.raises(ExportError):
+        stream_export(ExportQuery.parse('analyses'), 'xml')
+    with pytest.raises(ExportError):
+        stream_export(ExportQuery.parse('chats'), 'csv', images=True)
+
+
+def test_filters_and_chunking(analyses):
+    query = ExportQuery.parse('analyses', since='2026-03-02', until='2026-03-04', condition='Ringworm')
+    rows = [json.loads(line) for line in _export(query, 'ndjson', chunk_rows=1).splitlines()]
+    # A date-only until includes that day; Acne starts on day 4
+    assert [row['id'] for row in rows] == [2, 3]
+    assert rows[0]['model_stage'] == 'full'
+
+    rows = [json.loads(line) for line in _export(ExportQuery.parse('analyses', user_id='u2'), 'ndjson').splitlines()]
+    assert [row['id'] for row in rows] == [2, 4]
+
+
+def test_parquet_round_trip(analyses):
+    data = _export(ExportQuery.parse('analyses'), 'parquet', chunk_rows=2)
+    parquet = pq.ParquetFile(io.BytesIO(data))
+    assert parquet.metadata.num_row_groups == 3  # one per chunk
+    table = parquet.read()
+    assert table.column_names == list(ExportQuery.parse('analyses').columns)
+    assert table.column('id').to_pylist() == [1, 2, 3, 4, 5]
+    assert table.column('timestamp').to_pylist()[0] == datetime(2026, 3, 1)
+    assert table.column('confidence').to_pylist() == [51.0, 52.0, 53.0, 54.0, 55.0]
+
+
+def test_parquet_export_of_an_empty_table(app):
+    data = _export(ExportQuery.parse('chats'), 'parquet')
+    table = pq.read_table(io.BytesIO(data))
+    assert table.num_rows == 0
+    assert table.column_names == list(ExportQuery.parse('chats').columns)
+
+
+def test_tar_stream_is_a_valid_archive(analyses, tmp_path):
+    data = _export(ExportQuery.parse('analyses'), 'parquet', images=True, chunk_rows=2)
+    assert len(data) % tarfile.RECORDSIZE == 0
+
+    with tarfile.open(fileobj=io.BytesIO(data), mode='r:') as archive:
+        names = archive.getnames()
+        # Images as rows are read (the deleted one is skipped), then the data file
+        assert names == ['images/1.jpg', 'images/2.jpg', 'images/4.jpg', 'images/5.jpg', 'analyses.parquet']
+        assert archive.extractfile('images/4.jpg').read() == (tmp_path / 'upload4.jpg').read_bytes()
+        table = pq.read_table(io.BytesIO(archive.extractfile('analyses.parquet').read()))
+    assert table.column('id').to_pylist() == [1, 2, 3, 4, 5]
+
+
+def test_chat_export(app):
+    db.session.add_all([ChatMessage(user_id='u1', role='user', content='itchy, red "patch"'),
+                        ChatMessage(user_id='u1', role='assistant', content='line one\nline two')])
+    db.session.commit()
+    rows = list(csv.DictReader(io.StringIO(_export(ExportQuery.parse('chats'), 'csv').decode())))
+    assert [row['content'] for row in rows] == ['itchy, red "patch"', 'line one\nline two']
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+from flask import Flask, jsonify, request
+
+from api.http_cache import RESOURCE_ANALYSES, apply_validators, bump_version, check_not_modified
+from api.skin_analysis import db, SkinAnalysisResult
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'app.db'}"
+    db.init_app(app)
+
+    @app.route('/history')
+    def history():
+        # Same shape as the real read endpoints: validators first, then the rows
+        user_id = request.args['user_id']
+        not_modified, etag, last_modified = check_not_modified(user_id, RESOURCE_ANALYSES)
+        if not_modified:
+            return not_modified
+        rows = SkinAnalysisResult.query.filter_by(user_id=user_id).count()
+        response = jsonify({'rows': rows, 'timestamp': datetime.utcnow().isoformat()})
+        return apply_validators(response, etag, last_modified)
+
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def _add(user_id):
+    db.session.add(SkinAnalysisResult(user_id=user_id, image_path='x.jpg', primary_condition='Acne',
+                                      confidence=90.0, detailed_analysis='{}'))
+    db.session.commit()
+
+
+def test_weak_etag_and_revalidation_headers(client):
+    response = client.get('/history?user_id=u1')
+    assert response.status_code == 200
+    assert response.headers['ETag'].startswith('W/"')
+    assert response.headers['Cache-Control'] == 'private, no-cache'
+
+
+def test_if_none_match_returns_304_until_the_user_changes(client):
+    etag = client.get('/history?user_id=u1').headers['ETag']
+
+    response = client.get('/history?user_id=u1', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    assert response.headers['ETag'] == etag
+    # Clients and proxies that strip the weak prefix still revalidate
+    assert client.get('/history?user_id=u1', headers={'If-None-Match': etag[2:]}).status_code == 304
+    assert client.get('/history?user_id=u1', headers={'If-None-Match': '"other", ' + etag}).status_code == 304
+
+    _add('u2')  # another user's change
+    assert client.get('/history?user_id=u1', headers={'If-None-Match': etag}).status_code == 304
+
+    _add('u1')
+    response = client.get('/history?user_id=u1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['rows'] == 1
+    assert response.headers['ETag'] != etag
+
+
+def test_bump_version_invalidates_for_bulk_changes(client):
+    _add('u1')
+    etag = client.get('/history?user_id=u1').headers['ETag']
+    SkinAnalysisResult.query.filter_by(user_id='u1').delete()  # bulk: not seen by the flush hook
+    bump_version('u1', RESOURCE_ANALYSES)
+    db.session.commit()
+    response = client.get('/history?user_id=u1', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.json['rows'] == 0
+
+
+def test_if_modified_since(client):
+    _add('u1')
+    last_modified = client.get('/history?user_id=u1').headers['Last-Modified']
+    assert client.get('/history?user_id=u1', headers={'If-Modified-Since': last_modified}).status_code == 304
+    assert client.get('/history?user_id=u1',
+                      headers={'If-Modified-Since': 'Thu, 01 Jan 2015 00:00:00 GMT'}).status_code == 200
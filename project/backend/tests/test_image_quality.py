@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+from api import image_quality
+from api.image_quality import ImageQualityError, assess, check
+
+
+def _tile(rgb, noise=8.0, size=256, seed=0):
+    """A textured photo-like tile: a base colour plus per-pixel luminance noise"""
+    rng = np.random.default_rng(seed)
+    texture = rng.normal(0.0, noise, (size, size, 1))
+    pixels = np.clip(np.array(rgb, dtype=np.float64) + texture, 0, 255)
+    return Image.fromarray(pixels.astype(np.uint8), 'RGB')
+
+
+@pytest.fixture
+def reject_mode(monkeypatch):
+    monkeypatch.setattr(image_quality, 'QUALITY_GATE_MODE', 'reject')
+
+
+def test_default_mode_is_flag():
+    assert image_quality.QUALITY_GATE_MODE == 'flag'
+
+
+def test_inflamed_skin_passes():
+    report = assess(_tile((200, 90, 90)))
+    assert report.issues == []
+    assert report.metrics['skin_fraction'] > 0.9
+
+
+def test_evenly_lit_dark_skin_passes():
+    report = assess(_tile((60, 40, 30)))
+    assert report.metrics['brightness'] < 45
+    assert report.issues == []
+
+
+def test_black_image_is_dark():
+    assert 'dark' in assess(_tile((5, 5, 5), noise=2.0)).issues
+
+
+def test_blown_out_image_is_overexposed():
+    assert 'overexposed' in assess(_tile((252, 252, 252), noise=2.0)).issues
+
+
+def test_flat_histogram_counts_as_badly_exposed():
+    report = assess(_tile((40, 35, 30), noise=1.0))
+    assert report.metrics['dynamic_range'] < image_quality.QUALITY_MIN_RANGE
+    assert 'dark' in report.issues
+
+
+def test_blurry_image_is_flagged():
+    blurry = Image.new('RGB', (256, 256), (180, 120, 100))
+    assert 'blur' in assess(blurry).issues
+
+
+def test_reject_mode_refuses_exposure_failures(reject_mode):
+    with pytest.raises(ImageQualityError) as excinfo:
+        check(_tile((252, 252, 252), noise=2.0))
+    assert 'overexposed' in excinfo.value.report.issues
+
+
+def test_low_skin_coverage_is_never_rejected(reject_mode):
+    report = check(_tile((60, 160, 70)))
+    assert report.issues == ['skin']
+
+
+def test_flag_mode_returns_the_problems(monkeypatch):
+    monkeypatch.setattr(image_quality, 'QUALITY_GATE_MODE', 'flag')
+    report = check(_tile((5, 5, 5), noise=2.0))
+    assert not report.acceptable
+    assert 'dark' in [issue['check'] for issue in report.to_dict()['issues']]
@@ -0,0 +1,75 @@
+import io
+import struct
+
+import pytest
+from PIL import Image
+
+from api.ingest import ImageHeader, UploadRejected, check_header, parse_image_header, PNG_SIGNATURE
+
+
+def _encode(mode: str, size, fmt: str, **options) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size).save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize('mode, fmt, options, expected', [
+    ('RGB', 'PNG', {}, ImageHeader('png', 640, 480, 'RGB')),
+    ('RGBA', 'PNG', {}, ImageHeader('png', 640, 480, 'RGBA')),
+    ('L', 'PNG', {}, ImageHeader('png', 640, 480, 'L')),
+    ('P', 'PNG', {}, ImageHeader('png', 640, 480, 'P')),
+    ('RGB', 'JPEG', {}, ImageHeader('jpeg', 640, 480, 'RGB')),
+    ('RGB', 'JPEG', {'progressive': True}, ImageHeader('jpeg', 640, 480, 'RGB')),
+    ('L', 'JPEG', {}, ImageHeader('jpeg', 640, 480, 'L')),
+    ('CMYK', 'JPEG', {}, ImageHeader('jpeg', 640, 480, 'CMYK')),
+])
+def test_header_matches_pillow(mode, fmt, options, expected):
+    data = _encode(mode, (640, 480), fmt, **options)
+    assert parse_image_header(data) == expected
+    assert Image.open(io.BytesIO(data)).mode == expected.mode
+
+
+def test_jpeg_frame_after_exif_and_fill_bytes():
+    data = _encode('RGB', (33, 17), 'JPEG', exif=b'Exif\x00\x00' + b'\x00' * 2000)
+    assert parse_image_header(data) == ImageHeader('jpeg', 33, 17, 'RGB')
+    padded = data[:2] + b'\xff\xff\xff' + data[2:]
+    assert parse_image_header(padded) == ImageHeader('jpeg', 33, 17, 'RGB')
+
+
+@pytest.mark.parametrize('fmt', ['PNG', 'JPEG'])
+def test_every_prefix_needs_more_data_or_parses(fmt):
+    data = _encode('RGB', (20, 10), fmt)
+    results = [parse_image_header(data[:n]) for n in range(len(data) + 1)]
+    first = next(n for n, header in enumerate(results) if header is not None)
+    assert all(header is None for header in results[:first])
+    assert all(header == results[-1] for header in results[first:])
+    assert first < 1024
+
+
+@pytest.mark.parametrize('data, reason', [
+    (b'GIF89a\x01\x00\x01\x00', 'format'),
+    (b'%PDF-1.7', 'format'),
+    (PNG_SIGNATURE + struct.pack('>I4s', 13, b'IDAT') + b'\x00' * 13, 'corrupt'),
+    (PNG_SIGNATURE + struct.pack('>I4sIIBB', 13, b'IHDR', 1, 1, 8, 5) + b'\x00' * 3, 'corrupt'),
+    (b'\xff\xd8\x00\x00', 'corrupt'),
+    (b'\xff\xd8\xff\xda\x00\x08', 'corrupt'),
+    (b'\xff\xd8\xff\xe0\x00\x01', 'corrupt'),
+])
+def test_invalid_headers_are_rejected(data, reason):
+    with pytest.raises(UploadRejected) as error:
+        parse_image_header(data)
+    assert error.value.reason == reason
+    assert error.value.code == 400
+
+
+def test_check_header_limits():
+    check_header(ImageHeader('png', 4096, 4096, 'RGB'))
+    for header, reason in [
+        (ImageHeader('png', 0, 10, 'RGB'), 'dimensions'),
+        (ImageHeader('png', 4097, 10, 'RGB'), 'dimensions'),
+        (ImageHeader('jpeg', 10, 10, 'CMYK'), 'mode'),
+        (ImageHeader('png', 10, 10, 'L'), 'mode'),
+    ]:
+        with pytest.raises(UploadRejected) as error:
+            check_header(header)
+        assert error.value.reason == reason
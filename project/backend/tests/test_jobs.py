@@ -0,0 +1,137 @@
+import time
+
+import pytest
+
+from api import jobs
+from api.jobs import JobQueue, WorkerPool, JobError, DEAD, DONE, QUEUED, PRIORITY_HIGH, PRIORITY_LOW
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return JobQueue(str(tmp_path / 'jobs.db'), visibility_timeout=60, max_attempts=3)
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_BACKOFF_BASE', 0)
+
+
+def test_enqueue_claim_complete(queue):
+    job_id = queue.enqueue('thumbnail', {'image_path': 'a.jpg'})
+    job = queue.claim('w1')
+    assert job.id == job_id and job.payload == {'image_path': 'a.jpg'} and job.attempts == 1
+    assert queue.get(job_id)['status'] == 'running'
+    assert queue.claim('w2') is None  # leased to w1
+
+    assert queue.complete(job, {'ok': True})
+    stored = queue.get(job_id)
+    assert stored['status'] == DONE and stored['result'] == {'ok': True} and stored['locked_until'] is None
+
+
+def test_claim_order_priority_then_age(queue):
+    low = queue.enqueue('k', {}, priority=PRIORITY_LOW)
+    first = queue.enqueue('k', {})
+    second = queue.enqueue('k', {})
+    high = queue.enqueue('k', {}, priority=PRIORITY_HIGH)
+    assert [queue.claim('w').id for _ in range(4)] == [high, first, second, low]
+
+
+def test_delayed_and_filtered_claims(queue):
+    queue.enqueue('later', {}, delay=60)
+    other = queue.enqueue('other', {})
+    assert queue.claim('w', kinds=['later']) is None
+    assert queue.claim('w', kinds=['later', 'other']).id == other
+
+
+def test_dedupe_key(queue):
+    first = queue.enqueue('retention', {}, dedupe_key='retention:2026-10-19')
+    assert first is not None
+    assert queue.enqueue('retention', {}, dedupe_key='retention:2026-10-19') is None
+    assert queue.enqueue('retention', {}, dedupe_key='retention:2026-10-20') is not None
+    # Jobs without a key never collide
+    assert queue.enqueue('k', {}) != queue.enqueue('k', {})
+    # The key stays taken after the job has run
+    queue.complete(queue.claim('w', kinds=['retention']))
+    assert queue.enqueue('retention', {}, dedupe_key='retention:2026-10-19') is None
+
+
+def test_retry_with_backoff_then_dead_letter(queue, no_backoff):
+    calls = []
+
+    @queue.handler('flaky')
+    def flaky(payload, job):
+        calls.append(job.attempts)
+        raise JobError('upstream down')
+
+    job_id = queue.enqueue('flaky', {})
+    assert queue.execute(queue.claim('w')) == 'retry'
+    stored = queue.get(job_id)
+    assert stored['status'] == QUEUED and stored['last_error'] == 'JobError: upstream down'
+    assert queue.execute(queue.claim('w')) == 'retry'
+    assert queue.execute(queue.claim('w')) == 'dead'
+    assert calls == [1, 2, 3]
+    assert queue.get(job_id)['status'] == DEAD
+    assert queue.claim('w') is None
+
+
+def test_backoff_delays_retry(queue):
+    queue.enqueue('k', {})
+    job = queue.claim('w')
+    assert queue.fail(job, 'boom') == QUEUED
+    assert queue.get(job.id)['run_at'] >= time.time() + jobs.JOB_BACKOFF_BASE * 0.5 - 1
+    assert queue.claim('w') is None
+
+
+def test_missing_handler_fails_the_job(queue, no_backoff):
+    job_id = queue.enqueue('unknown', {}, max_attempts=1)
+    assert queue.execute(queue.claim('w')) == 'dead'
+    assert 'No handler' in queue.get(job_id)['last_error']
+
+
+def test_expired_lease_is_reclaimed(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), visibility_timeout=0, max_attempts=3)
+    job_id = queue.enqueue('k', {})
+    crashed = queue.claim('w1')
+    retaken = queue.claim('w2')
+    assert retaken.id == job_id and retaken.attempts == 2
+    # The first worker lost its lease: it can neither extend nor finish the job
+    assert not crashed.heartbeat()
+    assert not queue.complete(crashed)
+    assert queue.complete(retaken)
+
+
+def test_expired_lease_on_final_attempt_dead_letters(tmp_path):
+    queue = JobQueue(str(tmp_path / 'jobs.db'), visibility_timeout=0, max_attempts=1)
+    job_id = queue.enqueue('k', {})
+    queue.claim('w1')
+    assert queue.claim('w2') is None
+    stored = queue.get(job_id)
+    assert stored['status'] == DEAD and 'Visibility timeout' in stored['last_error']
+
+
+def test_retry_and_purge(queue, no_backoff):
+    job_id = queue.enqueue('k', {}, max_attempts=1)
+    queue.fail(queue.claim('w'), 'boom')
+    assert queue.stats() == {'k': {'queued': 0, 'running': 0, 'done': 0, 'dead': 1}}
+    assert queue.retry(kind='k') == 1
+    job = queue.claim('w')
+    assert job.id == job_id and job.attempts == 1
+    queue.complete(job)
+    assert queue.purge(DONE) == 1
+    assert queue.get(job_id) is None
+
+
+def test_worker_pool_drain_runs_in_app_context(queue):
+    from flask import Flask, current_app
+    app = Flask('jobs-test')
+    seen = []
+
+    @queue.handler('k')
+    def handler(payload, job):
+        seen.append((payload['n'], current_app.name))
+        return payload['n']
+
+    ids = [queue.enqueue('k', {'n': n}) for n in range(3)]
+    assert WorkerPool(queue, app).drain() == 3
+    assert seen == [(0, 'jobs-test'), (1, 'jobs-test'), (2, 'jobs-test')]
+    assert [queue.get(i)['result'] for i in ids] == [0, 1, 2]
@@ -0,0 +1,59 @@
+import pytest
+
+from api.llm_gateway import CircuitBreaker
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr('api.llm_gateway.time.monotonic', clock)
+    return clock
+
+
+def test_breaker_trips_at_error_rate_after_min_calls(clock):
+    breaker = CircuitBreaker(window=10, min_calls=4, error_rate=0.5, cooldown=30)
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED  # too few calls to judge
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED  # rate is only checked on a failure
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+
+
+def test_breaker_half_open_lets_one_probe_through(clock):
+    breaker = CircuitBreaker(window=4, min_calls=2, error_rate=0.5, cooldown=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 2
+    assert breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow()  # the probe is still in flight
+
+    breaker.record_failure()   # failed probe: open for another cooldown
+    assert breaker.state == CircuitBreaker.OPEN
+    clock.now += 31
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.allow() and breaker.allow()
+
+
+def test_breaker_release_probe(clock):
+    breaker = CircuitBreaker(window=4, min_calls=1, error_rate=0.5, cooldown=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()
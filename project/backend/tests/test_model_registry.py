@@ -0,0 +1,115 @@
+import pytest
+from prometheus_client import REGISTRY
+
+from api import model_registry
+from api.model_registry import ChecksumMismatch, ModelRegistry, ModelWatcher, file_sha256, verify_checksum
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    registry = ModelRegistry(str(tmp_path / 'registry'))
+    monkeypatch.setattr(model_registry, 'registry', registry)
+    return registry
+
+
+@pytest.fixture
+def checkpoints(tmp_path):
+    paths = []
+    for name in ('a', 'b', 'c'):
+        path = tmp_path / f"{name}.pth"
+        path.write_bytes(name.encode() * 1000)
+        paths.append(str(path))
+    return paths
+
+
+def _swaps(outcome: str) -> float:
+    return REGISTRY.get_sample_value('model_swaps_total', {'outcome': outcome}) or 0
+
+
+def test_register_copies_the_checkpoint(registry, checkpoints):
+    entry = registry.register(checkpoints[0], version='v1', notes='first')
+    assert entry.sha256 == file_sha256(checkpoints[0])
+    assert file_sha256(entry.path) == entry.sha256 and entry.path != checkpoints[0]
+    assert registry.active() is None
+    with pytest.raises(ValueError):
+        registry.register(checkpoints[1], version='v1')
+    with pytest.raises(ValueError):
+        registry.register(checkpoints[1], version='../v2')
+
+
+def test_activate_and_rollback(registry, checkpoints):
+    for version, path in zip(('v1', 'v2', 'v3'), checkpoints):
+        registry.register(path, version=version)
+    with pytest.raises(KeyError):
+        registry.rollback()
+    with pytest.raises(KeyError):
+        registry.activate('v9')
+
+    registry.activate('v1')
+    registry.activate('v2')
+    registry.activate('v2')  # no-op: not recorded twice
+    registry.activate('v3')
+    assert registry.rollback().version == 'v2'
+    assert registry.active().version == 'v2'
+    assert registry.manifest()['history'] == ['v1', 'v2', 'v3', 'v2']
+
+    with pytest.raises(ValueError):
+        registry.remove('v2')  # active
+    registry.remove('v3')
+    assert [entry.version for entry in registry.versions()] == ['v1', 'v2']
+    assert registry.rollback().version == 'v1'
+
+
+def test_verify_checksum_detects_a_replaced_file(registry, checkpoints):
+    entry = registry.register(checkpoints[0], version='v1')
+    verify_checksum(entry)
+    with open(entry.path, 'ab') as f:
+        f.write(b'tampered')
+    with pytest.raises(ChecksumMismatch):
+        verify_checksum(registry.get('v1'))
+
+
+def test_watcher_swaps_to_the_active_version(registry, checkpoints):
+    registry.register(checkpoints[0], version='v1')
+    served = ['v0']
+    watcher = ModelWatcher(interval=0)
+    watcher.attach(lambda entry: served.append(entry.version), lambda: served[-1])
+
+    assert not watcher.check()  # nothing active
+    registry.activate('v1')
+    swapped = _swaps('swapped')
+    assert watcher.check()
+    assert served[-1] == 'v1' and _swaps('swapped') == swapped + 1
+    assert not watcher.check()  # already serving it
+    assert watcher.status()['serving'] == 'v1' and watcher.status()['last_swap_at']
+
+
+def test_watcher_failure_keeps_serving_and_retries_on_manifest_change(registry, checkpoints):
+    registry.register(checkpoints[0], version='v1')
+    registry.register(checkpoints[1], version='v2')
+    registry.activate('v1')
+    with open(registry.get('v1').path, 'ab') as f:
+        f.write(b'tampered')
+
+    attempts, served = [], ['v0']
+
+    def loader(entry):
+        attempts.append(entry.version)
+        verify_checksum(entry)
+        served.append(entry.version)
+
+    watcher = ModelWatcher(interval=0)
+    watcher.attach(loader, lambda: served[-1])
+    failed = _swaps('failed')
+
+    assert not watcher.check()
+    assert served == ['v0']
+    assert _swaps('failed') == failed + 1
+    assert watcher.last_error.startswith('v1:') and watcher.state == 'idle'
+
+    assert not watcher.check()  # the same broken entry is not retried on every poll
+    assert attempts == ['v1']
+
+    registry.activate('v2')
+    assert watcher.check()
+    assert served[-1] == 'v2' and watcher.last_error is None
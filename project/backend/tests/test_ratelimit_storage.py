@@ -0,0 +1,77 @@
+import pytest
+
+from api import ratelimit_storage
+from api.ratelimit_storage import SQLiteStorage
+
+
+@pytest.fixture
+def uri(tmp_path):
+    return f"sqlite:///{tmp_path / 'ratelimit.db'}"
+
+
+def test_counts_within_a_window(uri):
+    storage = SQLiteStorage(uri)
+    assert [storage.incr('k', 60) for _ in range(3)] == [1, 2, 3]
+    assert storage.get('k') == 3
+    assert storage.incr('k', 60, amount=5) == 8
+    assert storage.get('other') == 0
+
+
+def test_counters_are_shared_between_instances(uri):
+    first, second = SQLiteStorage(uri), SQLiteStorage(uri)
+    first.incr('k', 60)
+    assert second.incr('k', 60) == 2
+    assert first.get('k') == 2
+
+
+def test_expired_window_restarts(uri, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit_storage.time, 'time', lambda: now[0])
+    storage = SQLiteStorage(uri)
+    storage.incr('k', 10)
+    storage.incr('k', 10)
+    assert storage.get_expiry('k') == 1010.0
+    now[0] = 1005.0
+    assert storage.incr('k', 10) == 3
+    assert storage.get_expiry('k') == 1010.0  # fixed window: the expiry does not move
+    now[0] = 1010.0
+    assert storage.get('k') == 0
+    assert storage.incr('k', 10) == 1
+    assert storage.get_expiry('k') == 1020.0
+
+
+def test_elastic_expiry_extends_the_window(uri, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit_storage.time, 'time', lambda: now[0])
+    storage = SQLiteStorage(uri)
+    storage.incr('k', 10, elastic_expiry=True)
+    now[0] = 1005.0
+    assert storage.incr('k', 10, elastic_expiry=True) == 2
+    assert storage.get_expiry('k') == 1015.0
+
+
+def test_clear_and_reset(uri):
+    storage = SQLiteStorage(uri)
+    storage.incr('a', 60)
+    storage.incr('b', 60)
+    storage.clear('a')
+    assert storage.get('a') == 0 and storage.get('b') == 1
+    assert storage.reset() == 1
+    assert storage.check()
+
+
+def test_limiter_enforces_limits_through_the_storage(uri):
+    from flask import Flask
+    from flask_limiter import Limiter
+    from flask_limiter.util import get_remote_address
+
+    app = Flask(__name__)
+    limiter = Limiter(get_remote_address, app=app, storage_uri=uri)
+
+    @app.route('/')
+    @limiter.limit('2 per minute')
+    def index():
+        return 'ok'
+
+    client = app.test_client()
+    assert [client.get('/').status_code for _ in range(3)] == [200, 200, 429]
@@ -0,0 +1,34 @@
+import json
+
+from api.shadow import summarize
+
+
+def _record(stage, agree, delta, ms):
+    record = {'agree': agree, 'confidence_delta': delta, 'candidate_ms': ms,
+              'primary': {'condition': 'Ringworm'}, 'candidate': {'condition': 'Ringworm' if agree else 'Nail Fungus'}}
+    if stage is not None:
+        record['primary_stage'] = stage
+    return json.dumps(record)
+
+
+def test_summary_by_served_stage(tmp_path):
+    path = tmp_path / 'v2.jsonl'
+    path.write_text('\n'.join([
+        _record('full', True, 0.1, 10),
+        _record('full', False, -0.1, 20),
+        _record('student', False, 0.3, 30),
+        _record(None, True, 0.0, 40),   # written before stages were recorded
+    ]) + '\n{"agree": tr')              # partially written last line
+    report = summarize(str(path))
+    assert report['samples'] == 4
+    assert report['agreement'] == 0.5
+    assert report['disagreements'] == {'Ringworm -> Nail Fungus': 2}
+    assert report['by_stage'] == {
+        'full': {'samples': 2, 'agreement': 0.5, 'mean_confidence_delta': 0.0},
+        'student': {'samples': 1, 'agreement': 0.0, 'mean_confidence_delta': 0.3},
+        'unknown': {'samples': 1, 'agreement': 1.0, 'mean_confidence_delta': 0.0},
+    }
+
+
+def test_missing_report(tmp_path):
+    assert summarize(str(tmp_path / 'none.jsonl')) == {'samples': 0}
@@ -0,0 +1,52 @@
+import threading
+import time
+
+import pytest
+from prometheus_client import REGISTRY
+
+from api.singleflight import SingleFlight
+
+
+def _coalesced(group: str) -> float:
+    return REGISTRY.get_sample_value('singleflight_coalesced_calls_total', {'group': group}) or 0
+
+
+def test_singleflight_coalesces_concurrent_calls():
+    flight = SingleFlight('test-coalesce')
+    started, release = threading.Event(), threading.Event()
+    calls, results = [], []
+
+    def work():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    def caller():
+        results.append(flight.do('key', work))
+
+    threads = [threading.Thread(target=caller) for _ in range(5)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while _coalesced('test-coalesce') < 4 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert flight.in_flight() == 0
+
+
+def test_singleflight_shares_errors_and_forgets_the_call():
+    flight = SingleFlight('test')
+
+    def fail():
+        raise RuntimeError('upstream')
+
+    with pytest.raises(RuntimeError):
+        flight.do('key', fail)
+    assert flight.do('key', lambda: 'fresh') == 'fresh'
@@ -0,0 +1,71 @@
+import torch
+from prometheus_client import REGISTRY
+
+# Aliased so pytest does not try to collect it as a test class
+from api.tta import TestTimeAugmentation as Augmentation
+
+
+class _Recorder(torch.nn.Module):
+    """Logits from the mean of each channel; remembers the batches it was called with"""
+
+    def __init__(self):
+        super().__init__()
+        self.batches = []
+
+    def forward(self, x):
+        self.batches.append(x.shape[0])
+        return x.mean(dim=(2, 3)) * 10
+
+
+def _image(seed=0):
+    return torch.rand(1, 3, 32, 32, generator=torch.Generator().manual_seed(seed))
+
+
+def _runs(top1: str) -> float:
+    return REGISTRY.get_sample_value('tta_runs_total', {'top1': top1}) or 0
+
+
+def test_views_are_one_batch_of_the_expected_transforms():
+    tta = Augmentation(rotation=10, crop=0.88)
+    image = _image()
+    views = tta.views(image)
+    assert views.shape == (tta.num_views, 3, 32, 32) == (8, 3, 32, 32)
+    torch.testing.assert_close(views[0], image[0], atol=1e-5, rtol=0)
+    torch.testing.assert_close(views[1], image[0].flip(2), atol=1e-5, rtol=0)   # horizontal flip
+    torch.testing.assert_close(views[2], image[0].flip(1), atol=1e-5, rtol=0)   # vertical flip
+    for view in views[3:]:
+        assert not torch.allclose(view, image[0], atol=1e-3)
+
+
+def test_rotated_and_cropped_views_of_a_uniform_image_stay_uniform():
+    # Reflection padding: no zero-filled corners
+    views = Augmentation().views(torch.full((1, 3, 16, 16), 0.5))
+    torch.testing.assert_close(views, torch.full_like(views, 0.5))
+
+
+def test_predict_averages_all_views_in_one_forward_pass():
+    tta, model = Augmentation(), _Recorder()
+    image = _image()
+    top_prob, top_idx = tta.predict(model, image, k=3)
+    assert model.batches == [tta.num_views]
+
+    expected = torch.softmax(tta.views(image).mean(dim=(2, 3)) * 10, dim=1).mean(dim=0)
+    torch.testing.assert_close(top_prob, expected.sort(descending=True).values)
+    torch.testing.assert_close(top_idx, expected.argsort(descending=True))
+
+
+def test_refine_reports_whether_the_top_class_changed():
+    tta, model = Augmentation(threshold=0.7), _Recorder()
+    image = torch.zeros(1, 3, 8, 8)
+    image[:, 2] = 1.0  # channel 2 wins in every view
+
+    same, changed = _runs('same'), _runs('changed')
+    top_prob, top_idx, info = tta.refine(model, image, torch.tensor([0.6, 0.3, 0.1]), torch.tensor([2, 0, 1]))
+    assert top_idx[0].item() == 2
+    assert info['views'] == 8 and not info['top1_changed']
+    assert abs(info['single_view_confidence'] - 60) < 1e-4
+    assert _runs('same') == same + 1
+
+    _, _, info = tta.refine(model, image, torch.tensor([0.5, 0.3, 0.2]), torch.tensor([0, 1, 2]))
+    assert info['top1_changed']
+    assert _runs('changed') == changed + 1
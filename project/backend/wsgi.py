@@ -0,0 +1,15 @@
+"""
+Production WSGI entry point.
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Importing app loads the model. With preload_app (see gunicorn.conf.py) this
+happens once in the gunicorn master and the forked workers share the weights
+copy-on-write. Per-process services (LLM probe, job workers, scheduler) are
+started by the worker hooks in gunicorn.conf.py, not here.
+"""
+
+from app import app, init_app
+
+if not init_app():
+    raise RuntimeError("Failed to initialize application")